@@ -17,6 +17,15 @@ from constants import *
 from parse import Settings_Parser, Credentials_Parser, Init_Parser
 from outlookclient import outlookclient
 from ITSdriver import ITSdriver
+from ITShttpdriver import ITShttpdriver
+from preference_matcher import Preference_Matcher
+from connection_manager import Connection_Manager
+from session_pool import ITS_Session_Pool
+from grab_pipeline import Grab_Pipeline
+from event_loop import Event_Loop, Mail_Watcher
+from schedule_watcher import Schedule_Watcher
+from pre_armer import Pre_Armer
+from schedule_snapshot import Schedule_Snapshot_Cache
 
 current_filepath = dirname(realpath(__file__))
 
@@ -35,16 +44,21 @@ class Coracle(object):
 		self.c_parser = None
 
 		self.advanced_logging = None
+		self.uid_state_filepath = None
 
 		self.outlookcl = None
-		self.ITSdr = None
+		self.outlook_manager = None
+		self.ITS_pool = None
+		self.armed_pool = None
+		self.schedule_snapshots = None
 
 		self.coracle_logger = logging.getLogger("Coracle")
 		self.simple_logger = logging.getLogger("simple_log")
 
 	def dict_configure(self, **config):
-		'''Provided a dictionary, load 
+		'''Provided a dictionary, load the settings, credentials and, when given, where the email uid state is kept
 		'''
+		self.uid_state_filepath = config.get("uid_state_filepath")
 		self.set_logging(config["settings_filepath"])
 		self.load_settings(config["settings_filepath"])
 		self.load_credentials(config["credentials_filepath"])
@@ -91,38 +105,141 @@ class Coracle(object):
 		self.coracle_logger.info("Logging initialization test")
 		self.simple_logger.info("LOGGING INITIALIZATION TEST")
 
-	def init_clients(self, adv_log=None):
-		'''Provided or given advanced logging, init both clients for coracle
+	def init_clients(self, adv_log=None, share=None, schedule_snapshots=None, tenant=None):
 		'''
-		self.coracle_logger.info("Initializing outlookclient and ITSdriver")
-		self.outlookcl = outlookclient(self.advanced_logging)
-		self.ITSdr = ITSdriver(self.advanced_logging)
+		Provided or given advanced logging, init both clients for coracle. A
+		Fair_Share, schedule snapshot cache and tenant name are passed when
+		several tenants share the process
+		'''
+		self.coracle_logger.info("Initializing outlookclient and ITS session pool")
+		settings = self.s_parser.get_settings()
+		credentials = self.c_parser.get_dict()
+		self.outlookcl = outlookclient(self.advanced_logging, state_filepath=self.uid_state_filepath, batch_size=settings.fetch_batch_size)
+		self.outlook_manager = Connection_Manager(self.outlookcl, credentials["Outlook"]["username"], credentials["Outlook"]["password"])
+		self.schedule_snapshots = schedule_snapshots or Schedule_Snapshot_Cache()
+		if settings.its_engine == "http":
+			its_driver = lambda: ITShttpdriver(self.advanced_logging, self.schedule_snapshots)
+		else:
+			its_driver = lambda: ITSdriver(self.advanced_logging, self.schedule_snapshots, profile=settings.phantomjs_profile)
+		self.ITS_pool = ITS_Session_Pool(its_driver, credentials["ITS"]["username"], credentials["ITS"]["password"], settings.its_sessions, queue_size=GRAB_QUEUE_SIZE, share=share, tenant=tenant)
+		self.armed_pool = None
+		if settings.pre_arm:
+			#one dedicated session keeps the one armed day loaded
+			self.armed_pool = ITS_Session_Pool(its_driver, credentials["ITS"]["username"], credentials["ITS"]["password"], 1, share=share, tenant=tenant)
+
+	def grab_matching_shift(self, ITSdr, matcher, ITS_email):
+		'''Provided an ITS session, a matcher and an email, attempt its matching actions in order until one grabs
+		'''
+		for action, locations in matcher.match(ITS_email):
+			shift = dict(ITS_email, action=action, locations=locations)
+			if ITSdr.grab_shift(shift):
+				return True
+		return False
+
+	def iter_ITS_emails(self, starttime):
+		'''Provided the start time, yield ITS emails as they arrive until the active window ends
+		'''
+		settings = self.s_parser.get_settings()
+		deadline = starttime + settings.active
+
+		if settings.idle:
+			for ITS_email in self.outlook_manager.listen(settings.refresh, deadline):
+				yield ITS_email
+			return
+
+		while time() < deadline:
+			for ITS_email in self.outlook_manager.iter_new_ITS_email_info():
+				yield ITS_email
+			sleep(max(0, min(settings.refresh, deadline - time())))
+
+	def start_schedule_watcher(self, matcher, pipeline):
+		'''Provided the matcher and grab pipeline, start watching the ITS schedule if the settings ask to
+		'''
+		if not self.s_parser.get_settings().watch_schedule:
+			return None
+		schedule_watcher = Schedule_Watcher(self.ITS_pool, matcher, pipeline.enqueue)
+		schedule_watcher.start()
+		return schedule_watcher
+
+	def stop_schedule_watcher(self, schedule_watcher):
+		'''Provided the schedule watcher (or None), stop it and log its metrics
+		'''
+		if schedule_watcher is None:
+			return
+		schedule_watcher.stop()
+		self.coracle_logger.info("Schedule watcher metrics: %s" % (schedule_watcher.metrics()))
+
+	def start_pre_armer(self, matcher):
+		'''Provided the matcher, start keeping the best ranked preferences pre-armed if the settings ask to
+		'''
+		if self.armed_pool is None:
+			return None
+		pre_armer = Pre_Armer(self.armed_pool, matcher, self.s_parser.get_settings().pre_arm)
+		pre_armer.start()
+		return pre_armer
+
+	def stop_pre_armer(self, pre_armer):
+		'''Provided the pre-armer (or None), stop it and log its metrics
+		'''
+		if pre_armer is None:
+			return
+		pre_armer.stop()
+		self.coracle_logger.info("Pre-armer metrics: %s" % (pre_armer.metrics()))
 
 	def run(self, **Config):
 		'''TIME TO RUN
 		'''
-		settings = self.s_parser.get_dict()
+		settings = self.s_parser.get_settings()
 		credentials = self.c_parser.get_dict()
 
-		self.init_clients()
-
-		starttime = time()
-		is_active = lambda: (time() - starttime) < settings["active"]
-		is_in_range = lambda i,r:r[0] <= i <= r[1] if len(r)==2 else True
-
-		while is_active():
-			for ITS_email in self.outlookcl.get_ITS_email_info(True):
-				# if email is within date range
-				for date_key, date in settings["dates"].iteritems():
-					if is_in_range(ITS_email["start_date"], date["range"]) and is_in_range(ITS_email["end_date"], date["range"]):
-						for weekday_key, weekday in date.iteritems():
-							if ITS_email["weekday"] in WEEKDAYS or ITS_email["weekday"] in WEEKDAYS_INITIALS or ITS_email["weekday"] == "all":
-								for hour, actions in weekday["hours"].iteritems():
-									if "_range" in hour:continue
-									if is_in_range(ITS_email["start_time"], weekday[hour+"_range"]) and is_in_range(ITS_email["end_time"], weekday[hour+"_range"]):
-										self.ITSdriver.grab_shift(ITS_email)
-							else:
-								continue
-					else:
-						continue
-			sleep(settings["refresh"])
+		self.init_clients(**Config)
+		self.ITS_pool.start()
+		self.outlook_manager.connect()
+
+		matcher = Preference_Matcher(settings.dates)
+		pre_armer = self.start_pre_armer(matcher)
+		pipeline = Grab_Pipeline(self.ITS_pool, matcher, self.grab_matching_shift, pre_armer)
+		schedule_watcher = self.start_schedule_watcher(matcher, pipeline)
+
+		try:
+			pipeline.run(self.iter_ITS_emails(time()))
+		finally:
+			self.stop_schedule_watcher(schedule_watcher)
+			self.stop_pre_armer(pre_armer)
+			self.ITS_pool.stop()
+			self.coracle_logger.info("Grab pipeline metrics: %s" % (pipeline.metrics()))
+			self.coracle_logger.info("ITS session pool metrics: %s" % (self.ITS_pool.metrics()))
+			self.coracle_logger.info("Schedule snapshot metrics: %s" % (self.schedule_snapshots.metrics()))
+
+	def run_event_loop(self, **Config):
+		'''
+		TIME TO RUN, on a single threaded event loop. The loop waits on the IMAP
+		session, its timers and the end of the active window together, and
+		queues every new ITS email on the grab pipeline the moment it is read
+		'''
+		settings = self.s_parser.get_settings()
+
+		self.init_clients(**Config)
+		self.ITS_pool.start()
+		self.outlook_manager.connect()
+
+		matcher = Preference_Matcher(settings.dates)
+		pre_armer = self.start_pre_armer(matcher)
+		pipeline = Grab_Pipeline(self.ITS_pool, matcher, self.grab_matching_shift, pre_armer)
+		loop = Event_Loop()
+		watcher = Mail_Watcher(loop, self.outlook_manager, pipeline.enqueue, settings.refresh, settings.idle)
+		schedule_watcher = self.start_schedule_watcher(matcher, pipeline)
+
+		try:
+			self.simple_logger.info("LISTENING FOR EMAILS")
+			watcher.start()
+			loop.run_until(time() + settings.active)
+		finally:
+			watcher.stop()
+			self.stop_schedule_watcher(schedule_watcher)
+			self.stop_pre_armer(pre_armer)
+			self.ITS_pool.stop()
+			self.coracle_logger.info("Grab pipeline metrics: %s" % (pipeline.metrics()))
+			self.coracle_logger.info("ITS session pool metrics: %s" % (self.ITS_pool.metrics()))
+			self.coracle_logger.info("Schedule snapshot metrics: %s" % (self.schedule_snapshots.metrics()))
+
@@ -1,11 +1,13 @@
 from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 from string import printable
+import sys
 import time
+import urlparse
 from os.path import dirname, realpath, join
 
 import logging
@@ -13,21 +15,128 @@ import logging.config
 
 from constants import *
 from parse.ITS_message_parsers import *
-from coracle_exceptions import SessionException
+from coracle_exceptions import SessionException, ParseException
+from schedule_urls import Schedule_URL_Cache, resolve_year
+from schedule_snapshot import Schedule_Block, Schedule_Snapshot, Schedule_Snapshot_Cache
+from step_timings import Step_Timings
 
 current_filepath = dirname(realpath(__file__))
 
 logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
 
+#true once the page is done loading and has the element with the id it is given
+PAGE_READY_SCRIPT = """
+return document.readyState === "complete" && document.getElementById(arguments[0]) !== null;
+"""
+
+#run by phantomjs itself on the current page (this), counts every resource
+#the page requests and the bytes it receives. Given a pattern (arguments[0])
+#it aborts the requests matching it and those outside the origins it is given
+#(arguments[1]), for the lean profile
+PAGE_RESOURCES_SCRIPT = """
+var page = this;
+var blocked = arguments[0] ? new RegExp(arguments[0], "i") : null;
+var origins = arguments[1];
+page.coracle_resources = {"requests": 0, "blocked": 0, "bytes": 0};
+page.onResourceRequested = function(request, network) {
+    var url = request.url;
+    var allowed = url.indexOf("data:") === 0 || origins.some(function(origin) { return url.indexOf(origin) === 0; });
+    if (blocked && (blocked.test(url) || !allowed)) {
+        page.coracle_resources.blocked += 1;
+        network.abort();
+        return;
+    }
+    page.coracle_resources.requests += 1;
+};
+page.onResourceReceived = function(response) {
+    if (response.stage !== "start") {
+        return;
+    }
+    var size = response.bodySize || 0;
+    response.headers.forEach(function(header) {
+        if (header.name.toLowerCase() === "content-length") {
+            size = parseInt(header.value, 10) || size;
+        }
+    });
+    page.coracle_resources.bytes += size;
+};
+"""
+
+#run by phantomjs itself, returns what PAGE_RESOURCES_SCRIPT counted since the last call and starts over
+PAGE_RESOURCES_TAKE_SCRIPT = """
+var resources = this.coracle_resources;
+this.coracle_resources = {"requests": 0, "blocked": 0, "bytes": 0};
+return resources;
+"""
+
+#seconds the current page took from navigation to its load event
+PAGE_LOAD_TIME_SCRIPT = """
+var timing = window.performance.timing;
+return ((timing.loadEventEnd || new Date().getTime()) - timing.navigationStart) / 1000;
+"""
+
+PAGE_LOAD_KEYS = ["bytes", "requests", "blocked", "seconds"]
+
+def url_origin(url):
+    '''Provided a url, return its scheme://host part
+    '''
+    parts = urlparse.urlsplit(url)
+    return "%s://%s" % (parts.scheme, parts.netloc)
+
+ITS_ORIGINS = sorted(set(url_origin(url) for url in [ITS_URL] + ITS_LOCATION_MAP.keys()))
+
+#returns the shifts_by_day grid as one list per location column, each block
+#as {text, options}, found the same way get_schedule_columns and
+#get_schedule_block_elements find them. text is null where a block has no div
+SCHEDULE_GRID_SCRIPT = """
+var schedule = document.getElementById("shifts_by_day");
+var row = schedule.getElementsByTagName("tbody")[0].getElementsByTagName("tr")[1];
+var columns = row.getElementsByTagName("td");
+var grid = [];
+for (var c = 1; c < columns.length; c++) {
+    var blocks = [];
+    var divs = columns[c].getElementsByTagName("div");
+    for (var b = 1; b < divs.length; b += 2) {
+        var inner = divs[b].getElementsByTagName("div")[0];
+        if (!inner) {
+            blocks.push({"text": null, "options": []});
+            continue;
+        }
+        var options = [];
+        var option_elements = inner.getElementsByTagName("option");
+        for (var o = 0; o < option_elements.length; o++) {
+            options.push(option_elements[o].text);
+        }
+        blocks.push({"text": inner.innerText, "options": options});
+    }
+    grid.push(blocks);
+}
+return grid;
+"""
+
 class ITSdriver(webdriver.PhantomJS):
     '''
     Special sublass of phantomjs for ease of use when interacting
     with the ITS site. 
+
+    profile "full" loads every page like a browser. "lean" turns images off,
+    keeps a disk cache, and blocks fonts, media and anything off the ITS
+    website, none of which coracle looks at.
     '''
-    def __init__(self, advanced_logging=False, *args, **kwargs):
+    def __init__(self, advanced_logging=False, schedule_snapshots=None, profile=PHANTOMJS_PROFILES[0], *args, **kwargs):
+        if profile not in PHANTOMJS_PROFILES:
+            raise ValueError("Unknown phantomjs profile %s" % (profile))
+        kwargs.setdefault("service_args", PHANTOMJS_LEAN_SERVICE_ARGS if profile == "lean" else PHANTOMJS_SERVICE_ARGS)
         super(ITSdriver, self).__init__(*args, **kwargs)
+        self.command_executor._commands["executePhantomScript"] = ("POST", "/session/$sessionId/phantom/execute")
+        self.profile = profile
         self.session_start = False
         self.current_location = None
+        self.schedule_urls = Schedule_URL_Cache()
+        self.schedule_snapshots = schedule_snapshots or Schedule_Snapshot_Cache()
+        self.armed = {}
+        self.poll_interval = ITS_WAIT_POLL_INTERVAL
+        self.step_timings = Step_Timings()
 
         self.ITSdriver_logger = logging.getLogger("ITSdriver")
         self.simple_logger = logging.getLogger("simple_log")
@@ -37,7 +146,47 @@ class ITSdriver(webdriver.PhantomJS):
         else:
             self.ITSdriver_logger.handlers = [h for h in self.ITSdriver_logger.handlers if type(h) != logging.StreamHandler]
 
-        self.ITSdriver_logger.info("%s object initialized" % (self.__class__))
+        #screenshots only when the ITSdriver logger is set to DEBUG in logging.ini
+        self.debug = self.ITSdriver_logger.isEnabledFor(logging.DEBUG)
+        self.watch_resources(ITS_ORIGINS)
+
+        self.ITSdriver_logger.info("%s object initialized with the %s profile" % (self.__class__, self.profile))
+
+    def execute_phantom_script(self, script, *args):
+        '''Provided a script and its arguments, run it in phantomjs itself rather than in the page
+        '''
+        return self.execute("executePhantomScript", {"script":script, "args":list(args)})["value"]
+
+    def watch_resources(self, origins):
+        '''Provided the origins pages may load from, count the resources pages load and, lean, block the rest
+        '''
+        blocked = PHANTOMJS_BLOCKED_RESOURCES if self.profile == "lean" else None
+        try:
+            self.execute_phantom_script(PAGE_RESOURCES_SCRIPT, blocked, origins)
+            return True
+        except WebDriverException, e:
+            self.ITSdriver_logger.warning("Unable to watch page resources, nothing blocked: %s" % (e))
+            return False
+
+    def take_page_load(self):
+        '''return the bytes, requests and blocked requests loaded since the last call, and the current page's load seconds
+        '''
+        page_load = dict(self.execute_phantom_script(PAGE_RESOURCES_TAKE_SCRIPT) or {"requests":0, "blocked":0, "bytes":0})
+        page_load["seconds"] = self.execute_script(PAGE_LOAD_TIME_SCRIPT)
+        return page_load
+
+    def measure_page_load(self, url):
+        '''Provided the url of a page (live or recorded), load it and return what loading it took
+        '''
+        self.watch_resources([url_origin(url)])
+        self.get(url)
+        return self.take_page_load()
+
+    def save_debug_screenshot(self, name):
+        '''Provided a name, save a screenshot of the current page to it in debug mode only
+        '''
+        if self.debug:
+            self.save_screenshot(name)
 
     def init_session(self):
         '''given the albany url, initialize your session and flag it
@@ -58,25 +207,64 @@ class ITSdriver(webdriver.PhantomJS):
             self.ITSdriver_logger.info("ITS punchcard session not initialized")
             raise SessionException("ITS session not started")
 
-    def loaded(self):
+    def is_logged_in(self):
+        '''Given a started session, check the ITS website still has it logged in
+        '''
+        if not self.is_started():
+            return False
+        try:
+            self.go_to_location("home")
+            return self.at_location("home")
+        except SessionException:
+            return False
+
+    def wait_until(self, condition, timeout=ITS_WAIT_TIMEOUT):
+        '''Provided a condition and a timeout, check it every poll_interval until it holds and return its value
+        '''
+        return WebDriverWait(self, timeout, poll_frequency=self.poll_interval).until(condition)
+
+    def wait_for(self, element_id, timeout=ITS_WAIT_TIMEOUT):
+        '''Provided an element id and a timeout, wait for the element and return it
+        '''
+        return self.wait_until(EC.presence_of_element_located((By.ID, element_id)), timeout)
+
+    def page_ready(self, element_id="its_logo"):
+        '''Provided an element id, check in one round trip the page is done loading and has the element
+        '''
+        return self.execute_script(PAGE_READY_SCRIPT, element_id)
+
+    def loaded(self, timeout=ITS_WAIT_TIMEOUT):
         '''On the ITS website, wait and check if the header is loaded, raise exception if fail
         '''
         try:
-            WebDriverWait(self, 5).until(
-                EC.presence_of_element_located((By.ID, "its_logo"))
-                )
+            self.wait_until(lambda driver: driver.page_ready(), timeout)
             return True
         except TimeoutException:
             raise SessionException("location not loading in time. Check connectivity")
 
+    def transition(self, step, action, timeout=ITS_WAIT_TIMEOUT):
+        '''
+        Provided a step name and an action leaving the current page (a click or
+        a submit), run it, wait for the page it leads to and time the step
+        '''
+        with self.step_timings.timed(step):
+            page = self.find_element_by_tag_name("html")
+            action()
+            try:
+                self.wait_until(EC.staleness_of(page), timeout)
+            except TimeoutException:
+                self.ITSdriver_logger.warning("Page did not change %.1f seconds after %s" % (timeout, step))
+            self.loaded(timeout)
+
     def go_to_location(self, location):
         '''Provided a location, check that location and 'get' it with phantomjs
         '''
         if self.location_exists(location):
             ITS_LOCATION_MAP_INVERT = {v: k for k, v in ITS_LOCATION_MAP.items()}
-            self.get(ITS_LOCATION_MAP_INVERT[location])
-            self.ITSdriver_logger.info("Going to location: %s" % (location))
-            self.loaded()
+            with self.step_timings.timed("go_to_%s" % (location)):
+                self.get(ITS_LOCATION_MAP_INVERT[location])
+                self.ITSdriver_logger.info("Going to location: %s" % (location))
+                self.loaded()
         else:
             self.ITSdriver_logger.error("Location %s not found" % (location))
             raise SessionException("Unknown location %s" % (location))
@@ -92,16 +280,16 @@ class ITSdriver(webdriver.PhantomJS):
         return location in ITS_LOCATION_MAP.values()
 
     def check_location(self, location):
-        '''Given the hashmap "ITS_LOCATION_MAP" and a location, check the location
+        '''Given the hashmap "ITS_LOCATION_MAP" and a location, check the location, ignoring any query string
         '''
         try:
-            return ITS_LOCATION_MAP[self.current_url] == location
+            return ITS_LOCATION_MAP[self.current_url.split("?")[0].split("#")[0]] == location
         except KeyError:
             self.ITSdriver_logger.error("ITSdriver in unknown location %s" % (location))
             raise SessionException("ITSdriver is at an unknown url location %s. Re-init session" % (self.current_url))
 
     def login(self, username, password):
-        '''provided a username and a password, wait till loaded and login to the ITS website
+        '''provided a username and a password, wait till loaded and login to the ITS website. Return True once logged in
         '''
         self.simple_logger.info("LOGGING INTO ITS PUNCHCARD")
         self.ITSdriver_logger.info("ITSdriver logging in to ITS punchcard")
@@ -112,22 +300,27 @@ class ITSdriver(webdriver.PhantomJS):
             return False
 
         try:
-            login_form = WebDriverWait(self, 10).until(
-                EC.presence_of_element_located((By.ID, "loginForm"))
-                )
+            login_form = self.wait_for("loginForm", ITS_WAIT_LOGIN_TIMEOUT)
 
             login_form.find_element_by_id("user").send_keys(username)
             login_form.find_element_by_id("pass").send_keys(password)
-            login_form.find_elements_by_tag_name("input")[-1].click()
-            self.save_screenshot("test.png")
-            self.loaded()
-            self.ITSdriver_logger.info("Login Session Initialized")
+            self.transition("login", login_form.find_elements_by_tag_name("input")[-1].click, ITS_WAIT_LOGIN_TIMEOUT)
+            self.save_debug_screenshot("test.png")
 
         except Exception, e:
             self.simple_logger.error("UNABLE TO LOG IN GIVEN CREDENTIALS")
             self.ITSdriver_logger.error("Unable to log in via ITSdriver")
             raise SessionException("Unable to log in to ITS website")
 
+        # a rejected login lands back on a page with the login form
+        if self.find_elements_by_id("loginForm"):
+            self.simple_logger.error("UNABLE TO LOG IN GIVEN CREDENTIALS")
+            self.ITSdriver_logger.error("ITS website rejected the login of %s" % (username))
+            raise SessionException("ITS website rejected the login")
+
+        self.ITSdriver_logger.info("Login Session Initialized")
+        return True
+
     def get_user_shifts(self):
         '''
         Given driver is at a location home, iterate through 'My Shifts' and extract
@@ -141,9 +334,7 @@ class ITSdriver(webdriver.PhantomJS):
         if not self.at_location("home"):
             return False
 
-        shift_box = WebDriverWait(self, 10).until(
-            EC.presence_of_element_located((By.ID, "index_my_shifts"))
-            )
+        shift_box = self.wait_for("index_my_shifts", 10)
         self.ITSdriver_logger.info("Found shift_box from 'home', %d shifts found" % (len(shift_box.find_elements_by_class_name("index_perm_shift"))))
 
         shifts = []
@@ -171,46 +362,77 @@ class ITSdriver(webdriver.PhantomJS):
         self.ITSdriver_logger.info("%d shifts analyzed and returned" % (len(shifts)))
         return shifts
 
+    def get_calendar_month(self):
+        '''Given the schedule page, return the first day of the month its calendar shows
+        '''
+        calendar = self.wait_for("right_menu")
+        selected_month, selected_year = filter(lambda x:x in set(printable), calendar.find_element_by_tag_name("h4").text).split()[:2]
+        return datetime.datetime.strptime("%s-%s" % (selected_month, selected_year), "%B-%Y")
+
+    def get_selected_date(self):
+        '''Given the schedule page, return the date highlighted on its calendar
+        '''
+        calendar = self.wait_for("right_menu")
+        selected_day = calendar.find_element_by_class_name("highlighted").text
+        selected_date = self.get_calendar_month().replace(day=int(selected_day))
+        self.ITSdriver_logger.info("Selected date: %s" % (selected_date.strftime("%B-%d-%Y")))
+        return selected_date
+
     def navigate_calander(self, date):
         '''
-        Given a driver is on the schedule page, navigate the calander based on a datetime
+        Navigate the schedule to a datetime. Once the schedule url of a date is
+        known the date is loaded directly, otherwise (or if that url shows
+        another date) the calendar is clicked through
         '''
         self.check_started()
+        date = resolve_year(date)
+
+        self.simple_logger.info("NAVIGATING TO %s" % (date.strftime("%d-%b")))
+        self.ITSdriver_logger.info("Navigating ITS calendar to: %s" % (date.strftime("%d-%b-%Y")))
+
+        url = self.schedule_urls.url_for(date)
+        if url is not None:
+            try:
+                with self.step_timings.timed("navigate_direct"):
+                    self.get(url)
+                    at_date = self.loaded() and self.at_location("schedule") and self.get_selected_date() == date
+                if at_date:
+                    return date
+            except (SessionException, NoSuchElementException, TimeoutException, ValueError), e:
+                self.ITSdriver_logger.warning("Direct schedule url failed: %s" % (e))
+            self.ITSdriver_logger.warning("%s did not show %s, clicking through the calendar" % (url, date.strftime("%d-%b-%Y")))
+            self.schedule_urls.forget()
+
+        with self.step_timings.timed("navigate_calendar"):
+            return self.click_through_calendar(date)
+
+    def click_through_calendar(self, date):
+        '''
+        Given a driver is on the schedule page, navigate the calander based on a datetime
+        by clicking its month and day links
+        '''
         self.go_to_location("schedule")
-        self.check_started()
         if not self.at_location("schedule"):
             return False
 
-        self.simple_logger.info("NAVIGATING TO %s" % (date.strftime("%d-%b")))
-        self.ITSdriver_logger.info("Navigating ITS calendar to: %s" % (date.strftime("%d-%b-%Y")))
-        calendar = WebDriverWait(self, 5).until(
-            EC.presence_of_element_located((By.ID, "right_menu"))
-            )
-        
+        calendar = self.wait_for("right_menu")
+
         long_navigations = calendar.find_element_by_tag_name("h4").find_elements_by_tag_name("a")
-        back_one_month, forward_one_month, go_to_today = long_navigations
+        back_one_month, forward_one_month, go_to_today = long_navigations[:3]
 
-        selected_month, selected_year = filter(lambda x:x in set(printable), calendar.find_element_by_tag_name("h4").text).split()[:2]
-        selected_day = calendar.find_element_by_class_name("highlighted").text
-        selected_date_str = "%s-%s-%s" % (selected_month, selected_day, selected_year)
-        selected_date = datetime.datetime.strptime(selected_date_str, "%B-%d-%Y")
-        self.ITSdriver_logger.info("Selected date: %s" % (selected_date_str))
-        
-        month_diff = selected_date.month - date.month
+        selected_date = self.get_selected_date()
+        month_diff = (date.year - selected_date.year) * 12 + date.month - selected_date.month
         self.ITSdriver_logger.info("Moving %d months" % (month_diff))
 
         for month_move in range(abs(month_diff)):
-            WebDriverWait(self, 5).until(
-                EC.presence_of_element_located((By.ID, "right_menu"))
-                )
-            if month_diff < 0:
-                back_one_month.click()
-            elif month_diff > 0:
-                forward_one_month.click()
-
-        days_elements = WebDriverWait(self, 5).until(
-            EC.presence_of_element_located((By.ID, "right_menu"))
-            ).find_element_by_tag_name("tbody")
+            calendar = self.wait_for("right_menu")
+            back_one_month, forward_one_month, go_to_today = calendar.find_element_by_tag_name("h4").find_elements_by_tag_name("a")[:3]
+            if month_diff > 0:
+                self.transition("change_month", forward_one_month.click)
+            else:
+                self.transition("change_month", back_one_month.click)
+
+        days_elements = self.wait_for("right_menu").find_element_by_tag_name("tbody")
         days_elements = days_elements.find_elements_by_tag_name("tr")[1:]
 
         days_elements_td = []
@@ -220,127 +442,349 @@ class ITSdriver(webdriver.PhantomJS):
         days_links = []
         for days in days_elements_td:
             link_class = days.get_attribute("class")
-            if (link_class != "prevMonth") or (link_class != "nextMonth"):
+            if (link_class != "prevMonth") and (link_class != "nextMonth"):
                 days_links.extend(days.find_elements_by_tag_name("a"))
 
+        self.schedule_urls.learn_calendar(self.get_calendar_month(), [(link.text, link.get_attribute("href")) for link in days_links])
+
         self.ITSdriver_logger.info("Selecting day %d" % (date.day))
 
-        filter(lambda d:str(d.text) == str(date.day), days_links)[0].click()
+        self.transition("select_day", filter(lambda d:str(d.text) == str(date.day), days_links)[0].click)
 
-        calendar = WebDriverWait(self, 5).until(
-            EC.presence_of_element_located((By.ID, "right_menu"))
-            )
-        selected_month, selected_year = filter(lambda x:x in set(printable), calendar.find_element_by_tag_name("h4").text).split()[:2]
-        selected_day = calendar.find_element_by_class_name("highlighted").text
-        selected_date_str = "%s-%s-%s" % (selected_month, selected_day, selected_year)
-        selected_date = datetime.datetime.strptime(selected_date_str, "%B-%d-%Y")
-        self.ITSdriver_logger.info("Selected date: %s" % (selected_date_str))
+        self.schedule_urls.learn(date, self.current_url)
+        return self.get_selected_date()
 
     def grab_shift(self, shift):
         '''
         Given that an option is selected for a particular shift. Confirm the shift
         '''
         self.check_started()
+        started = time.time()
+
+        with self.step_timings.timed("select_shift"):
+            selected = self.select_shift(shift)
+
+        if selected:
+            try:
+                return self.submit_selected_shift()
+            finally:
+                self.schedule_snapshots.invalidate(shift["start_date"])
+                self.step_timings.record("grab_shift", time.time() - started)
+                self.ITSdriver_logger.info("Grab took %.2f seconds, step timings so far: %s" % (time.time() - started, self.step_timings.metrics()))
+        else:
+            self.simple_logger.warning("UNABLE TO GRAB SHIFT")
+            self.ITSdriver_logger.warning("Unable to grab shift because unable to select: %s %s %s" % (shift["actions"], shift["user"], shift["start_time"]))
+            return False
 
-        if self.select_shift(shift):
-            if not self.at_location("schedule"):
-                self.ITSdriver_logger.error("ITSdriver not at location schedule to grab shift")
-                return False
+    def submit_selected_shift(self):
+        '''Given an action is selected on the schedule, submit and confirm it, return whether the shift was grabbed
+        '''
+        if not self.at_location("schedule"):
+            self.ITSdriver_logger.error("ITSdriver not at location schedule to grab shift")
+            return False
 
-            shifts = WebDriverWait(self, 5).until(
-                EC.presence_of_element_located((By.ID, "shifts_by_day"))
-                )
+        shifts = self.wait_for("shifts_by_day")
 
-            submit_button = self.find_element_by_tag_name("input").click()
+        self.transition("submit_shift", self.find_element_by_tag_name("input").click)
+
+        if not self.at_location("confirm"):
+            self.ITSdriver_logger.error("ITSdriver not at location confirm to grab shift")
+            return False
 
-            if not self.at_location("confirm"):
-                self.ITSdriver_logger.error("ITSdriver not at location confirm to grab shift")
+        confirm_form = self.wait_until(EC.presence_of_element_located((By.TAG_NAME, "form")))
+        self.transition("confirm_shift", confirm_form.submit)
+
+        if not self.at_location("schedule"):
+            self.ITSdriver_logger.warning("ITSdriver not at location schedule to grab shift")
+            return False
+        else:
+            self.ITSdriver_logger.info("Shift Successfully grabbed")
+            return True
+
+    def arm(self, date):
+        '''
+        Provided a date, load its schedule and keep its snapshot, which holds the
+        day's url and where each block sits, so grab_armed_shift can go
+        straight to a shift's block. The day's schedule stays loaded
+        '''
+        self.check_started()
+        if not self.navigate_calander(date):
+            return None
+        snapshot = self.take_schedule_snapshot(date)
+        self.armed[Schedule_Snapshot_Cache.day(date)] = snapshot
+        return snapshot
+
+    def is_armed_page_fresh(self, armed, shift):
+        '''
+        Provided an armed snapshot and a shift, check the armed day is still
+        the page loaded and was loaded after the shift was freed, so it already
+        offers the shift and needs no reload
+        '''
+        return shift.get("sent") is not None and armed.is_fresh(PRE_ARM_INTERVAL, shift["sent"]) and self.current_url == armed.url
+
+    def grab_armed_shift(self, shift):
+        '''
+        Provided a shift on a day armed with arm(), select the action on the
+        first block located for it that offers the action, then submit and
+        confirm. The day's url is only reloaded when the armed page is older
+        than the shift (a freed shift only shows on a page loaded after it).
+        Shifts on days not armed, or whose blocks moved, are grabbed the usual
+        way and timed as such
+        '''
+        self.check_started()
+        armed = self.armed.get(Schedule_Snapshot_Cache.day(shift["start_date"]))
+        blocks = armed.covering(shift) if armed is not None else []
+        if not blocks:
+            return self.grab_shift(shift)
+
+        started = time.time()
+        fall_back = False
+        try:
+            grabbed = self.grab_armed_blocks(shift, armed, blocks)
+            fall_back = grabbed is None
+        finally:
+            if not fall_back:
+                self.schedule_snapshots.invalidate(shift["start_date"])
+                self.step_timings.record("armed_grab", time.time() - started)
+
+        if fall_back:
+            return self.grab_shift(shift)
+        return grabbed
+
+    def grab_armed_blocks(self, shift, armed, blocks):
+        '''
+        Provided a shift, its armed snapshot and the blocks located for it,
+        select the action and confirm it. Return whether it was grabbed, or
+        None if the armed blocks moved and the shift has to be grabbed the
+        usual way
+        '''
+        if self.is_armed_page_fresh(armed, shift):
+            self.ITSdriver_logger.info("Armed schedule of %s is still fresh, not reloading it" % (armed.date.strftime("%d-%b-%Y")))
+        else:
+            with self.step_timings.timed("armed_reload"):
+                self.get(armed.url)
+                self.loaded()
+
+        with self.step_timings.timed("armed_select"):
+            for block in blocks:
+                element = self.find_schedule_block(block)
+                try:
+                    moved = element is None or get_info_from_schedule_block(element.text) != block.times
+                except (ValueError, ParseException):
+                    moved = True
+                if moved:
+                    self.ITSdriver_logger.warning("Armed schedule of %s changed, grabbing the usual way" % (armed.date.strftime("%d-%b-%Y")))
+                    del self.armed[Schedule_Snapshot_Cache.day(armed.date)]
+                    return None
+
+                option = self.find_action_option(element, shift["action"])
+                if option is not None:
+                    option.click()
+                    break
+            else:
+                self.ITSdriver_logger.warning("Action %s not offered on the armed blocks of %s" % (shift["action"], armed.date.strftime("%d-%b-%Y")))
                 return False
 
-            confirm_form = WebDriverWait(self, 5).until(
-                EC.presence_of_element_located((By.TAG_NAME, "form"))
-                )
-            confirm_form.submit()
-            
-            if not self.at_location("schedule"):
-                self.ITSdriver_logger.warning("ITSdriver not at location schedule to grab shift")
+        return self.submit_selected_shift()
+
+    def find_action_option(self, element, action):
+        '''Provided a block's div and an action, return its option offering the action or None
+        '''
+        for option in element.find_elements_by_tag_name("option"):
+            if normeq(option.text, action):
+                return option
+        return None
+
+    def get_schedule_columns(self):
+        '''Given the schedule page, return the td of each location in LOCATIONS order
+        '''
+        menu_schedule = self.wait_for("shifts_by_day")
+
+        shifts_schedule = menu_schedule.find_element_by_tag_name("tbody")
+        shifts_blocks = shifts_schedule.find_elements_by_tag_name("tr")[1]
+        return shifts_blocks.find_elements_by_tag_name("td")[1:]
+
+    def get_schedule_block_elements(self, location_shifts):
+        '''Provided a location's td, return the divs holding its blocks' times, dates and action select
+        '''
+        schedule_block_divs = []
+        for block in location_shifts.find_elements_by_tag_name("div")[1::2]:
+            schedule_block_divs.append(block.find_elements_by_tag_name("div")[0])
+        return schedule_block_divs
+
+    def extract_schedule_grid(self):
+        '''
+        Given the schedule page, return every location's blocks as (text,
+        options) in one execute_script round trip, None if the script fails
+        '''
+        try:
+            return self.execute_script(SCHEDULE_GRID_SCRIPT)
+        except WebDriverException, e:
+            self.ITSdriver_logger.warning("Unable to extract the schedule grid by script: %s" % (e))
+            return None
+
+    def walk_schedule_grid(self):
+        '''Given the schedule page, return what extract_schedule_grid does by walking the elements
+        '''
+        grid = []
+        for location_shifts in self.get_schedule_columns():
+            blocks = []
+            for block in self.get_schedule_block_elements(location_shifts):
+                blocks.append({"text":block.text, "options":[option.text for option in block.find_elements_by_tag_name("option")]})
+            grid.append(blocks)
+        return grid
+
+    def take_schedule_snapshot(self, date):
+        '''
+        Given the schedule of a date is loaded, parse every block of every
+        location once into a Schedule_Snapshot, cache it and return it. The grid
+        is read in one script call, and walked element by element only if that fails
+        '''
+        started = time.time()
+        self.wait_for("shifts_by_day")
+
+        grid = self.extract_schedule_grid()
+        extraction = "script"
+        if grid is None:
+            grid = self.walk_schedule_grid()
+            extraction = "elements"
+
+        blocks = []
+        for location, location_blocks in zip(LOCATIONS, grid):
+            for position, block in enumerate(location_blocks):
+                if block["text"] is None:
+                    continue
+                try:
+                    start_time, end_time, start_date, end_date = get_info_from_schedule_block(block["text"])
+                except (ValueError, ParseException):
+                    continue
+                blocks.append(Schedule_Block(location, position, start_time, end_time, start_date, end_date, block["options"]))
+
+        snapshot = Schedule_Snapshot(date, blocks, self.current_url, taken_by=self, parse_seconds=time.time() - started)
+        self.ITSdriver_logger.info("Took schedule snapshot of %s, %d blocks in %.3f seconds by %s" % (snapshot.date.strftime("%d-%b-%Y"), len(blocks), snapshot.parse_seconds, extraction))
+        self.schedule_snapshots.put(snapshot)
+        self.step_timings.record("schedule_snapshot", snapshot.parse_seconds)
+        return snapshot
+
+    def get_schedule_snapshot(self, date, not_before=None):
+        '''
+        Provided a date and optionally the earliest time the snapshot may be
+        from, return the cached snapshot of that date or navigate and take one
+        '''
+        snapshot = self.schedule_snapshots.get(date, not_before)
+        if snapshot is not None:
+            self.ITSdriver_logger.info("Using schedule snapshot of %s" % (snapshot.date.strftime("%d-%b-%Y")))
+            return snapshot
+
+        self.ITSdriver_logger.info("Navigating calendar to %s" % (date))
+        if not self.navigate_calander(date):
+            return None
+        return self.take_schedule_snapshot(date)
+
+    def find_schedule_block(self, block):
+        '''Given the schedule page, return the live div of a snapshot block or None
+        '''
+        location_shifts = self.get_schedule_columns()[LOCATIONS.index(block.location)]
+        schedule_block_divs = self.get_schedule_block_elements(location_shifts)
+        if block.position < len(schedule_block_divs):
+            return schedule_block_divs[block.position]
+        return None
+
+    def choose_action(self, shift, block):
+        '''
+        Provided a shift and the snapshot block offering its action, click the
+        action on the live page. If the page no longer matches the snapshot,
+        take a new one and look again
+        '''
+        date = resolve_year(shift["start_date"])
+        if not (self.at_location("schedule") and self.get_selected_date() == date):
+            self.navigate_calander(date)
+
+        element = self.find_schedule_block(block)
+        try:
+            changed = element is None or get_info_from_schedule_block(element.text) != block.times
+        except (ValueError, ParseException):
+            changed = True
+
+        if changed:
+            self.ITSdriver_logger.warning("Schedule changed since its snapshot, taking a new one")
+            block = self.take_schedule_snapshot(date).offering(shift)
+            if block is None:
                 return False
-            else:
-                self.ITSdriver_logger.info("Shift Successfully grabbed")
-                return True
-        else:
-            self.simple_logger.warning("UNABLE TO GRAB SHIFT")
-            self.ITSdriver_logger.warning("Unable to grab shift because unable to select: %s %s %s" % (shift["actions"], shift["user"], shift["start_time"]))
+            element = self.find_schedule_block(block)
+
+        option = self.find_action_option(element, shift["action"])
+        if option is None:
             return False
+        option.click()
+        return True
 
     def select_shift(self, shift):
         '''
         Provided a shift, based on the settings of the shift, perform
         an action on the shift
 
-        shift needs a locations, time slot, and action 
+        shift needs a locations, time slot, and action. The day's schedule is
+        read from its snapshot, so only the block to act on is touched live
         '''
         self.simple_logger.info("GRABBING NEW %s SHIFT" % (shift["actions"]))
         self.ITSdriver_logger.info("Grabbing new shift: %s %s %s" % (shift["actions"], shift["user"], shift["start_time"]))
 
         self.check_started()
-        self.go_to_location("schedule")
-        if not self.at_location("schedule"):
+        snapshot = self.get_schedule_snapshot(shift["start_date"], shift.get("sent"))
+        if snapshot is None:
             return False
 
-        self.ITSdriver_logger.info("Navigating calendar to %s" % (shift["start_date"]))
-        self.navigate_calander(shift["start_date"])
-
         self.ITSdriver_logger.info("Checking prescence of shift")
-        menu_schedule = WebDriverWait(self, 5).until(
-            EC.presence_of_element_located((By.ID, "shifts_by_day"))
-            )
+        blocks = snapshot.covering(shift)
+        if not blocks:
+            self.ITSdriver_logger.warning("Unable to locate shift for %s" % (shift["start_time"]))
+            self.simple_logger.warning("Unable to select shift")
+            return False
 
-        shifts_schedule = menu_schedule.find_element_by_tag_name("tbody")
-        shifts_blocks = shifts_schedule.find_elements_by_tag_name("tr")[1]
+        if not any(block.actions for block in blocks):
+            self.ITSdriver_logger.warning("No actions can be performed on shift. Shift is taken")
+            self.simple_logger.warning("SHIFT ALREADY TAKEN")
+            return False
 
-        for location_index in [LOCATIONS.index(i) for i in shift["locations"]]:
-            location_shifts = shifts_blocks.find_elements_by_tag_name("td")[1+location_index]
-            
-            schedule_block_divs = []
-            for block in location_shifts.find_elements_by_tag_name("div")[1::2]:
-                inner_div = block.find_elements_by_tag_name("div")[0]
-                schedule_block_divs.append(inner_div)
-
-            for block in schedule_block_divs:
-                start_time, end_time, start_date, end_date = get_info_from_schedule_block(block.text)
-                time_check_start = (start_time <= shift["start_time"] <= end_time)
-                time_check_end = (start_time <= shift["end_time"] <= end_time)
-
-                date_check_start = (start_date <= shift["start_date"] <= end_date)
-                date_check_end = (start_date <= shift["end_date"] <= end_date)
-
-                if time_check_start and time_check_end and date_check_start and date_check_end:
-                    try:
-                        options = block.find_element_by_tag_name("select")
-                        for option in options.find_elements_by_tag_name("option"):
-                            norm_option = option.text.lower().replace(" ","")
-                            norm_action = shift["action"].lower().replace(" ","")
-                            if norm_option == norm_action:
-                                option.click()
-                                return True
-                        else:
-                            self.ITSdriver_logger.warning("Action %s cannot be performed on shift. Action not available" % (shift["action"]))
-                            self.simple_logger.debug("%s ACTION NOT AVAILABLE FOR SHIFT" % (shift["action"]))
-                            return False
-                    except NoSuchElementException:
-                        self.ITSdriver_logger.warning("No actions can be performed on shift. Shift is taken")
-                        self.simple_logger.warning("SHIFT ALREADY TAKEN")
-                        return False
-                else:
-                    pass#wrong shift, on to the next
-        self.ITSdriver_logger.warning("Unable to locate shift for %s" % (shift["start_time"]))
-        self.simple_logger.warning("Unable to select shift")
+        # another block in the same hours (a longer shift, another location) may be taken while this one is free
+        for block in blocks:
+            if block.find_action(shift["action"]) is not None and self.choose_action(shift, block):
+                return True
+
+        self.ITSdriver_logger.warning("Action %s cannot be performed on shift. Action not available" % (shift["action"]))
+        self.simple_logger.debug("%s ACTION NOT AVAILABLE FOR SHIFT" % (shift["action"]))
         return False
 
 
+def benchmark_phantomjs_profiles(urls, profiles=PHANTOMJS_PROFILES, repeat=3):
+    '''
+    Provided the urls (or file paths) of recorded ITS pages, load each of them
+    'repeat' times under every phantomjs profile. Return {profile: {key: mean
+    per page load}} for the bytes received, requests made, requests blocked
+    and seconds to the load event
+    '''
+    urls = [url if "://" in url else "file://" + realpath(url) for url in urls]
+
+    results = {}
+    for profile in profiles:
+        driver = ITSdriver(True, profile=profile)
+        try:
+            page_loads = [driver.measure_page_load(url) for url in urls * repeat]
+        finally:
+            driver.quit()
+        results[profile] = dict((key, sum(page_load[key] for page_load in page_loads) / float(len(page_loads))) for key in PAGE_LOAD_KEYS)
+    return results
+
+
 if __name__ == "__main__":
-    d = ITSdriver(True, service_args=PHANTOMJS_SERVICE_ARGS)
+    if sys.argv[1:]:
+        #python ITSdriver.py page.html ... compares the profiles on recorded pages
+        for profile, result in sorted(benchmark_phantomjs_profiles(sys.argv[1:]).items()):
+            print "%s: %d bytes, %.1f requests, %.1f blocked, %.3f s per page load" % (profile, result["bytes"], result["requests"], result["blocked"], result["seconds"])
+        sys.exit(0)
+
+    d = ITSdriver(True)
 
     shift = {
                 'end_date': datetime.datetime(1900, 10, 7, 0, 0), 
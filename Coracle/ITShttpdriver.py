@@ -0,0 +1,677 @@
+import time
+import socket
+import httplib
+import urllib
+import urllib2
+import urlparse
+import cookielib
+import datetime
+from collections import namedtuple
+from string import printable
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+from parse.ITS_message_parsers import *
+from parse.html_parsers import parse_html, get_form_fields, set_form_field, get_option_value
+from coracle_exceptions import SessionException, ParseException
+from schedule_urls import Schedule_URL_Cache, resolve_year
+from schedule_snapshot import Schedule_Block, Schedule_Snapshot, Schedule_Snapshot_Cache
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+HTTP_Response = namedtuple("HTTP_Response", ["url", "status", "body"])
+
+REDIRECT_STATUSES = (301, 302, 303, 307)
+
+def urlencode_fields(fields):
+    '''
+    Provided form fields, return them urlencoded like a browser sends them.
+    Values parsed from entity refs are unicode, they are sent as utf-8
+    '''
+    encode = lambda value: value.encode("utf-8") if isinstance(value, unicode) else value
+    return urllib.urlencode([(encode(name), encode(value)) for name, value in fields])
+
+class Cookie_Response(object):
+    '''Adapter giving cookielib the info() it reads Set-Cookie headers from
+    '''
+    def __init__(self, message):
+        self.message = message
+
+    def info(self):
+        return self.message
+
+class HTTP_Session(object):
+    '''
+    Minimal browser session over httplib. One keep-alive connection is kept
+    per host and reused for every request, cookies are kept in a cookielib
+    jar, and redirects are followed.
+    '''
+
+    def __init__(self, timeout=ITS_HTTP_TIMEOUT):
+        self.timeout = timeout
+        self.cookies = cookielib.CookieJar()
+        self.connections = {}
+
+        self.requests = 0
+        self.connects = 0
+
+        self.ITSdriver_logger = logging.getLogger("ITSdriver")
+
+    def connection(self, scheme, netloc):
+        '''Provided a scheme and a host, return the pooled connection to it, opening one if needed
+        '''
+        key = (scheme, netloc)
+        if key not in self.connections:
+            connection_class = httplib.HTTPSConnection if scheme == "https" else httplib.HTTPConnection
+            self.connections[key] = connection_class(netloc, timeout=self.timeout)
+            self.connects += 1
+            self.ITSdriver_logger.info("Opened connection #%d to %s" % (self.connects, netloc))
+        return self.connections[key]
+
+    def drop_connection(self, scheme, netloc):
+        '''Provided a scheme and a host, close and forget its pooled connection
+        '''
+        connection = self.connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def send(self, method, url, body=None):
+        '''
+        Provided a method, url and an encoded body, send one request and return
+        the httplib response with its body read. A pooled connection the server
+        has closed in the meantime is reopened and the request sent again
+        '''
+        parts = urlparse.urlsplit(url)
+        path = urlparse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+        cookie_request = urllib2.Request(url)
+        self.cookies.add_cookie_header(cookie_request)
+
+        headers = {"User-Agent":ITS_HTTP_USER_AGENT, "Connection":"keep-alive"}
+        if cookie_request.has_header("Cookie"):
+            headers["Cookie"] = cookie_request.get_header("Cookie")
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        reused = (parts.scheme, parts.netloc) in self.connections
+        connection = self.connection(parts.scheme, parts.netloc)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.body = response.read()
+        except (httplib.HTTPException, socket.error), e:
+            self.drop_connection(parts.scheme, parts.netloc)
+            if not reused:
+                raise
+            self.ITSdriver_logger.info("Pooled connection to %s went stale (%r), reconnecting" % (parts.netloc, e))
+            connection = self.connection(parts.scheme, parts.netloc)
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.body = response.read()
+
+        self.requests += 1
+        self.cookies.extract_cookies(Cookie_Response(response.msg), cookie_request)
+        if response.will_close:
+            self.drop_connection(parts.scheme, parts.netloc)
+        return response
+
+    def request(self, method, url, fields=None):
+        '''
+        Provided a method, url and optional form fields, send the request,
+        follow redirects and return an HTTP_Response of the final page
+        '''
+        body = urlencode_fields(fields) if fields is not None else None
+        for redirect in range(ITS_HTTP_MAX_REDIRECTS+1):
+            self.ITSdriver_logger.info("%s %s" % (method, url))
+            response = self.send(method, url, body)
+            location = response.getheader("Location")
+            if response.status not in REDIRECT_STATUSES or not location:
+                return HTTP_Response(url, response.status, response.body)
+
+            url = urlparse.urljoin(url, location)
+            if response.status != 307:
+                method, body = "GET", None
+
+        raise SessionException("Too many redirects requesting %s" % (url))
+
+    def get(self, url):
+        return self.request("GET", url)
+
+    def post(self, url, fields):
+        return self.request("POST", url, fields)
+
+    def close(self):
+        '''close every pooled connection
+        '''
+        for scheme, netloc in self.connections.keys():
+            self.drop_connection(scheme, netloc)
+
+class ITShttpdriver(object):
+    '''
+    Drop in for ITSdriver that talks to the ITS punchcard pages directly over
+    HTTP instead of driving PhantomJS. Pages are fetched over a pooled
+    HTTP_Session with cookies, parsed with parse.html_parsers, and the forms a
+    browser would submit are built and posted by hand.
+
+    base_url defaults to ITS_URL and can point at any server serving the same
+    pages (login, index.php, show_shifts.php, shift_confirm.php).
+    '''
+    def __init__(self, advanced_logging=False, schedule_snapshots=None, base_url=ITS_URL, timeout=ITS_HTTP_TIMEOUT):
+        self.base_url = base_url
+        self.session = HTTP_Session(timeout)
+        self.session_start = False
+        self.current_location = None
+        self.current_url = None
+        self.page = None
+        self.pending_form = None
+        self.schedule_urls = Schedule_URL_Cache()
+        self.schedule_snapshots = schedule_snapshots or Schedule_Snapshot_Cache()
+        self.armed = {}
+
+        #ITS_LOCATION_MAP relative to base_url
+        self.location_urls = dict((location, urlparse.urljoin(base_url, url[len(ITS_URL):])) for url, location in ITS_LOCATION_MAP.iteritems())
+        self.url_locations = dict((url, location) for location, url in self.location_urls.iteritems())
+
+        self.ITSdriver_logger = logging.getLogger("ITSdriver")
+        self.simple_logger = logging.getLogger("simple_log")
+
+        if advanced_logging:
+            self.simple_logger.handlers = [h for h in self.simple_logger.handlers if type(h) != logging.StreamHandler]
+        else:
+            self.ITSdriver_logger.handlers = [h for h in self.ITSdriver_logger.handlers if type(h) != logging.StreamHandler]
+
+        self.ITSdriver_logger.info("%s object initialized" % (self.__class__))
+
+    def load(self, response):
+        '''Provided an HTTP_Response, make it the current page
+        '''
+        self.current_url = response.url
+        self.page = parse_html(response.body)
+        self.ITSdriver_logger.info("Loaded %s (%d)" % (response.url, response.status))
+
+    def get(self, url):
+        '''Provided a url, load it as the current page
+        '''
+        try:
+            self.load(self.session.get(url))
+        except (httplib.HTTPException, socket.error), e:
+            raise SessionException("Unable to reach %s: %s" % (url, e))
+
+    def submit_form(self, form, fields, submit=None):
+        '''
+        Provided a form element, its fields and optionally the submit input
+        pressed, send the form like a browser and load the resulting page
+        '''
+        if submit is not None and submit.get("name"):
+            fields = fields + [(submit.get("name"), submit.get("value", ""))]
+
+        url = urlparse.urljoin(self.current_url, form.get("action") or self.current_url)
+        method = form.get("method", "get").upper()
+        self.ITSdriver_logger.info("Submitting form to %s" % (url))
+        try:
+            if method == "POST":
+                self.load(self.session.post(url, fields))
+            else:
+                parts = urlparse.urlsplit(url)
+                self.load(self.session.get(urlparse.urlunsplit(parts[:3] + (urlencode_fields(fields), ""))))
+        except (httplib.HTTPException, socket.error), e:
+            raise SessionException("Unable to submit form to %s: %s" % (url, e))
+
+    @staticmethod
+    def find_submit(form):
+        '''Provided a form element, return its first submit input or None
+        '''
+        for element in form.find_all("input"):
+            if element.get("type", "text").lower() in ("submit", "image"):
+                return element
+        return None
+
+    def follow_link(self, link):
+        '''Provided an anchor element, load the page it links to
+        '''
+        href = link.get("href", "")
+        if not href or href.startswith("#") or href.lower().startswith("javascript:"):
+            raise SessionException("Link '%s' has no url to follow" % (link.text))
+        self.get(urlparse.urljoin(self.current_url, href))
+
+    def quit(self):
+        '''close the http session
+        '''
+        self.session.close()
+        self.session_start = False
+
+    def init_session(self):
+        '''given the albany url, initialize your session and flag it
+        '''
+        self.get(self.base_url)
+        self.session_start = True
+        self.ITSdriver_logger.info("ITS punchcard session initialized")
+
+    def is_started(self):
+        '''Given a session_start flag, check it to be true
+        '''
+        return self.session_start == True
+
+    def check_started(self):
+        '''Given a session_start flag, raise error if false
+        '''
+        if not self.is_started():
+            self.ITSdriver_logger.info("ITS punchcard session not initialized")
+            raise SessionException("ITS session not started")
+
+    def is_logged_in(self):
+        '''Given a started session, check the ITS website still has it logged in
+        '''
+        if not self.is_started():
+            return False
+        try:
+            self.go_to_location("home")
+            return self.at_location("home")
+        except SessionException:
+            return False
+
+    def loaded(self):
+        '''On the ITS website, check the header is on the current page, raise exception if not
+        '''
+        if self.page is None or self.page.find(id="its_logo") is None:
+            raise SessionException("location not loaded. Check connectivity")
+        return True
+
+    def wait_for(self, element_id):
+        '''Provided an id, return that element of the current page, raise exception if missing
+        '''
+        element = self.page.find(id=element_id) if self.page is not None else None
+        if element is None:
+            raise SessionException("%s not found on %s" % (element_id, self.current_url))
+        return element
+
+    def go_to_location(self, location):
+        '''Provided a location, check that location and 'get' it
+        '''
+        if self.location_exists(location):
+            self.get(self.location_urls[location])
+            self.ITSdriver_logger.info("Going to location: %s" % (location))
+            self.loaded()
+        else:
+            self.ITSdriver_logger.error("Location %s not found" % (location))
+            raise SessionException("Unknown location %s" % (location))
+
+    def at_location(self, location):
+        '''Given a driver is at a location, be sure its in an existing location
+        '''
+        return self.location_exists(location) and self.check_location(location)
+
+    def location_exists(self, location):
+        '''Provided a location, check that location exists
+        '''
+        return location in ITS_LOCATION_MAP.values()
+
+    def check_location(self, location):
+        '''Given the url locations and a location, check the location, ignoring any query string
+        '''
+        parts = urlparse.urlsplit(self.current_url or "")
+        page_url = urlparse.urlunsplit(parts[:3] + ("", ""))
+        try:
+            return self.url_locations[page_url] == location
+        except KeyError:
+            self.ITSdriver_logger.error("ITSdriver in unknown location %s" % (location))
+            raise SessionException("ITSdriver is at an unknown url location %s. Re-init session" % (self.current_url))
+
+    def login(self, username, password):
+        '''provided a username and a password, login to the ITS website. Return True once logged in
+        '''
+        self.simple_logger.info("LOGGING INTO ITS PUNCHCARD")
+        self.ITSdriver_logger.info("ITSdriver logging in to ITS punchcard")
+
+        self.init_session()
+        self.check_started()
+        if not self.at_location("login"):
+            return False
+
+        try:
+            login_form = self.wait_for("loginForm")
+            fields = get_form_fields(login_form)
+            fields = set_form_field(fields, login_form.find(id="user").get("name", "user"), username)
+            fields = set_form_field(fields, login_form.find(id="pass").get("name", "pass"), password)
+
+            self.submit_form(login_form, fields, login_form.find_all("input")[-1])
+            self.loaded()
+
+        except Exception, e:
+            self.simple_logger.error("UNABLE TO LOG IN GIVEN CREDENTIALS")
+            self.ITSdriver_logger.error("Unable to log in via ITShttpdriver: %s" % (e))
+            raise SessionException("Unable to log in to ITS website")
+
+        # a rejected login lands back on a page with the login form
+        if self.page.find(id="loginForm") is not None:
+            self.simple_logger.error("UNABLE TO LOG IN GIVEN CREDENTIALS")
+            self.ITSdriver_logger.error("ITS website rejected the login of %s" % (username))
+            raise SessionException("ITS website rejected the login")
+
+        self.ITSdriver_logger.info("Login Session Initialized")
+        return True
+
+    def get_user_shifts(self):
+        '''
+        Given driver is at a location home, iterate through 'My Shifts' and extract
+        the type, actions, location, and time information into a list of dicts and
+        return
+        '''
+        self.ITSdriver_logger.info("Getting user shifts from 'home'")
+
+        self.check_started()
+        self.go_to_location("home")
+        if not self.at_location("home"):
+            return False
+
+        shift_box = self.wait_for("index_my_shifts")
+        shift_elements = shift_box.find_all(class_name="index_perm_shift")
+        self.ITSdriver_logger.info("Found shift_box from 'home', %d shifts found" % (len(shift_elements)))
+
+        shifts = []
+        for shift in shift_elements:
+            day_time_str = shift.get_text(skip=["p"])
+            shift_info_str = shift.find("p").text
+
+            info_tuple = get_info_from_shift_block(day_time_str, shift_info_str)
+            start_date, end_date, weekday, start_time, end_time, shift_type, location, actions = info_tuple
+
+            shift_block_info = {}
+
+            shift_block_info["start_date"] = start_date
+            shift_block_info["end_date"] = end_date
+            shift_block_info["weekday"] = weekday
+            shift_block_info["start_time"] = start_time
+            shift_block_info["end_time"] = end_time
+
+            shift_block_info["location"] = location
+            shift_block_info["type"] = shift_type
+            shift_block_info["actions"] = actions
+
+            shifts.append(shift_block_info)
+
+        self.ITSdriver_logger.info("%d shifts analyzed and returned" % (len(shifts)))
+        return shifts
+
+    def get_calendar_month(self):
+        '''Given the schedule page, return the first day of the month its calendar shows
+        '''
+        calendar = self.wait_for("right_menu")
+        selected_month, selected_year = filter(lambda x:x in set(printable), calendar.find("h4").text).split()[:2]
+        return datetime.datetime.strptime("%s-%s" % (selected_month, selected_year), "%B-%Y")
+
+    def get_selected_date(self):
+        '''Given the schedule page, return the date highlighted on its calendar
+        '''
+        selected_day = self.wait_for("right_menu").find(class_name="highlighted").text
+        selected_date = self.get_calendar_month().replace(day=int(selected_day))
+        self.ITSdriver_logger.info("Selected date: %s" % (selected_date.strftime("%B-%d-%Y")))
+        return selected_date
+
+    def navigate_calander(self, date):
+        '''
+        Navigate the schedule to a datetime. Once the schedule url of a date is
+        known the date is loaded directly, otherwise (or if that url shows
+        another date) the calendar is clicked through
+        '''
+        self.check_started()
+        date = resolve_year(date)
+
+        self.simple_logger.info("NAVIGATING TO %s" % (date.strftime("%d-%b")))
+        self.ITSdriver_logger.info("Navigating ITS calendar to: %s" % (date.strftime("%d-%b-%Y")))
+
+        url = self.schedule_urls.url_for(date)
+        if url is not None:
+            try:
+                self.get(url)
+                if self.loaded() and self.at_location("schedule") and self.get_selected_date() == date:
+                    return date
+            except (SessionException, AttributeError, ValueError), e:
+                self.ITSdriver_logger.warning("Direct schedule url failed: %s" % (e))
+            self.ITSdriver_logger.warning("%s did not show %s, clicking through the calendar" % (url, date.strftime("%d-%b-%Y")))
+            self.schedule_urls.forget()
+
+        return self.click_through_calendar(date)
+
+    def click_through_calendar(self, date):
+        '''
+        Given a driver is on the schedule page, navigate the calander based on a datetime
+        by following its month and day links
+        '''
+        self.go_to_location("schedule")
+        if not self.at_location("schedule"):
+            return False
+
+        selected_date = self.get_selected_date()
+        month_diff = (date.year - selected_date.year) * 12 + date.month - selected_date.month
+        self.ITSdriver_logger.info("Moving %d months" % (month_diff))
+
+        for month_move in range(abs(month_diff)):
+            back_one_month, forward_one_month, go_to_today = self.wait_for("right_menu").find("h4").find_all("a")[:3]
+            self.follow_link(forward_one_month if month_diff > 0 else back_one_month)
+
+        days_rows = self.wait_for("right_menu").find("tbody").find_all("tr")[1:]
+
+        days_links = []
+        for days in days_rows:
+            for day in days.find_all("td"):
+                if not set(day.classes) & set(["prevMonth", "nextMonth"]):
+                    days_links.extend(day.find_all("a"))
+
+        self.schedule_urls.learn_calendar(self.get_calendar_month(),
+                                          [(link.text, urlparse.urljoin(self.current_url, link.get("href", ""))) for link in days_links])
+
+        self.ITSdriver_logger.info("Selecting day %d" % (date.day))
+        day_links = filter(lambda d:d.text == str(date.day), days_links)
+        if not day_links:
+            raise SessionException("Day %d not found on the calendar" % (date.day))
+        self.follow_link(day_links[0])
+
+        self.schedule_urls.learn(date, self.current_url)
+        return self.get_selected_date()
+
+    def grab_shift(self, shift):
+        '''
+        Given that an option is selected for a particular shift. Confirm the shift
+        '''
+        self.check_started()
+
+        if self.select_shift(shift):
+            try:
+                return self.submit_selected_shift()
+            finally:
+                self.schedule_snapshots.invalidate(shift["start_date"])
+        else:
+            self.simple_logger.warning("UNABLE TO GRAB SHIFT")
+            self.ITSdriver_logger.warning("Unable to grab shift because unable to select: %s %s %s" % (shift["actions"], shift["user"], shift["start_time"]))
+            return False
+
+    def submit_selected_shift(self):
+        '''Given a pending_form choosing an action, submit and confirm it, return whether the shift was grabbed
+        '''
+        if not self.at_location("schedule"):
+            self.ITSdriver_logger.error("ITSdriver not at location schedule to grab shift")
+            return False
+
+        form, fields = self.pending_form
+        self.pending_form = None
+        self.submit_form(form, fields, self.find_submit(form))
+
+        if not self.at_location("confirm"):
+            self.ITSdriver_logger.error("ITSdriver not at location confirm to grab shift")
+            return False
+
+        confirm_form = self.page.find("form")
+        if confirm_form is None:
+            raise SessionException("No confirmation form on %s" % (self.current_url))
+        self.submit_form(confirm_form, get_form_fields(confirm_form), self.find_submit(confirm_form))
+
+        if not self.at_location("schedule"):
+            self.ITSdriver_logger.warning("ITSdriver not at location schedule to grab shift")
+            return False
+        else:
+            self.ITSdriver_logger.info("Shift Successfully grabbed")
+            return True
+
+    def arm(self, date):
+        '''
+        Provided a date, load its schedule and keep its snapshot, which holds the
+        day's url and where each block sits, so grab_armed_shift can go
+        straight to a shift's block
+        '''
+        self.check_started()
+        if not self.navigate_calander(date):
+            return None
+        snapshot = self.take_schedule_snapshot(date)
+        self.armed[Schedule_Snapshot_Cache.day(date)] = snapshot
+        return snapshot
+
+    def is_armed_page_fresh(self, armed, shift):
+        '''
+        Provided an armed snapshot and a shift, check the armed page was loaded
+        after the shift was freed, so it already offers the shift and needs no
+        reload
+        '''
+        return shift.get("sent") is not None and armed.is_fresh(PRE_ARM_INTERVAL, shift["sent"])
+
+    def grab_armed_shift(self, shift):
+        '''
+        Provided a shift on a day armed with arm(), choose the action on the
+        first block covering the shift that offers it, then submit and confirm.
+        The day's url is only loaded again when the armed page is older than
+        the shift (a freed shift only shows on a page loaded after it). Shifts
+        on days not armed are grabbed the usual way
+        '''
+        self.check_started()
+        day = Schedule_Snapshot_Cache.day(shift["start_date"])
+        armed = self.armed.get(day)
+        if armed is None or not armed.covering(shift):
+            return self.grab_shift(shift)
+
+        try:
+            if self.is_armed_page_fresh(armed, shift):
+                self.ITSdriver_logger.info("Armed schedule of %s is still fresh, not reloading it" % (armed.date.strftime("%d-%b-%Y")))
+                snapshot = armed
+            else:
+                self.get(armed.url)
+                self.loaded()
+                snapshot = self.armed[day] = self.take_schedule_snapshot(armed.date)
+
+            for block in snapshot.covering(shift):
+                if block.find_action(shift["action"]) is not None and self.choose_action(shift, snapshot, block):
+                    return self.submit_selected_shift()
+
+            self.ITSdriver_logger.warning("Action %s not offered on the armed blocks of %s" % (shift["action"], armed.date.strftime("%d-%b-%Y")))
+            return False
+        finally:
+            self.schedule_snapshots.invalidate(shift["start_date"])
+
+    def take_schedule_snapshot(self, date):
+        '''
+        Given the schedule of a date is loaded, parse every block of every
+        location once into a Schedule_Snapshot, cache it and return it. The
+        blocks keep their elements, so a shift is chosen on the snapshot's page
+        '''
+        started = time.time()
+        menu_schedule = self.wait_for("shifts_by_day")
+        shifts_blocks = menu_schedule.find("tbody").find_all("tr")[1]
+
+        blocks = []
+        for location, location_shifts in zip(LOCATIONS, shifts_blocks.find_all("td")[1:]):
+            #the innermost divs hold a block's times, dates and action select
+            schedule_block_divs = [div for div in location_shifts.find_all("div") if div.find("div") is None]
+
+            for position, block in enumerate(schedule_block_divs):
+                try:
+                    start_time, end_time, start_date, end_date = get_info_from_schedule_block(block.text)
+                except (ValueError, ParseException):
+                    continue
+                actions = [option.text for option in block.find_all("option")]
+                blocks.append(Schedule_Block(location, position, start_time, end_time, start_date, end_date, actions, block))
+
+        snapshot = Schedule_Snapshot(date, blocks, self.current_url, self.page, taken_by=self, parse_seconds=time.time() - started)
+        self.ITSdriver_logger.info("Took schedule snapshot of %s, %d blocks in %.3f seconds" % (snapshot.date.strftime("%d-%b-%Y"), len(blocks), snapshot.parse_seconds))
+        self.schedule_snapshots.put(snapshot)
+        return snapshot
+
+    def get_schedule_snapshot(self, date, not_before=None):
+        '''
+        Provided a date and optionally the earliest time the snapshot may be
+        from, return the cached snapshot of that date or navigate and take one
+        '''
+        snapshot = self.schedule_snapshots.get(date, not_before)
+        if snapshot is not None:
+            self.ITSdriver_logger.info("Using schedule snapshot of %s" % (snapshot.date.strftime("%d-%b-%Y")))
+            return snapshot
+
+        self.ITSdriver_logger.info("Navigating calendar to %s" % (date))
+        if not self.navigate_calander(date):
+            return None
+        return self.take_schedule_snapshot(date)
+
+    def choose_action(self, shift, snapshot, block):
+        '''
+        Provided a shift and the snapshot block offering its action, go back to
+        the snapshot's page and keep the form choosing the action in pending_form.
+        A snapshot another session took is only trusted to say the shift is
+        there, the form is built from this session's own page
+        '''
+        if snapshot.taken_by is not self:
+            if not self.navigate_calander(shift["start_date"]):
+                return False
+            snapshot = self.take_schedule_snapshot(shift["start_date"])
+            block = snapshot.offering(shift)
+            if block is None:
+                return False
+
+        options = block.element.find("select")
+        for option in options.find_all("option"):
+            if normeq(option.text, shift["action"]):
+                self.current_url, self.page = snapshot.url, snapshot.page
+                form = options.ancestor("form") or self.page.find("form")
+                fields = set_form_field(get_form_fields(form), options.get("name"), get_option_value(option))
+                self.pending_form = (form, fields)
+                return True
+        return False
+
+    def select_shift(self, shift):
+        '''
+        Provided a shift, based on the settings of the shift, choose the
+        action on the shift and keep the form to submit in pending_form
+
+        shift needs a locations, time slot, and action. The day's schedule is
+        read from its snapshot, so later shifts on the same day need no request
+        '''
+        self.simple_logger.info("GRABBING NEW %s SHIFT" % (shift["actions"]))
+        self.ITSdriver_logger.info("Grabbing new shift: %s %s %s" % (shift["actions"], shift["user"], shift["start_time"]))
+
+        self.check_started()
+        snapshot = self.get_schedule_snapshot(shift["start_date"], shift.get("sent"))
+        if snapshot is None:
+            return False
+
+        self.ITSdriver_logger.info("Checking prescence of shift")
+        blocks = snapshot.covering(shift)
+        if not blocks:
+            self.ITSdriver_logger.warning("Unable to locate shift for %s" % (shift["start_time"]))
+            self.simple_logger.warning("Unable to select shift")
+            return False
+
+        if not any(block.actions for block in blocks):
+            self.ITSdriver_logger.warning("No actions can be performed on shift. Shift is taken")
+            self.simple_logger.warning("SHIFT ALREADY TAKEN")
+            return False
+
+        # another block in the same hours (a longer shift, another location) may be taken while this one is free
+        for block in blocks:
+            if block.find_action(shift["action"]) is not None and self.choose_action(shift, snapshot, block):
+                return True
+
+        self.ITSdriver_logger.warning("Action %s cannot be performed on shift. Action not available" % (shift["action"]))
+        self.simple_logger.debug("%s ACTION NOT AVAILABLE FOR SHIFT" % (shift["action"]))
+        return False
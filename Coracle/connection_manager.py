@@ -0,0 +1,113 @@
+import imaplib
+import socket
+import time
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, socket.error)
+
+class Connection_Manager(object):
+    '''
+    Connection_Manager keeps one authenticated outlookclient session alive for
+    the whole run. A quiet session gets a NOOP keepalive, and a dropped one is
+    logged in again with exponential backoff, re-selected, and the interrupted
+    fetch is retried. The uid high-water mark makes the retry skip every email
+    that was already handed out.
+    '''
+
+    def __init__(self, outlookcl, username, password, keepalive_interval=IMAP4_KEEPALIVE_INTERVAL):
+        self.outlookcl = outlookcl
+        self.username = username
+        self.password = password
+        self.keepalive_interval = keepalive_interval
+
+        self.last_activity = None
+        self.reconnects = 0
+
+        self.outlookclient_logger = logging.getLogger("outlookclient")
+        self.simple_logger = logging.getLogger("simple_log")
+
+    def connect(self):
+        '''
+        Given credentials, (re)login and select the ITS folder, backing off
+        exponentially between attempts. Raise IMAP4.abort if every attempt fails
+        '''
+        delay = IMAP4_RECONNECT_BASE_DELAY
+        for attempt in range(1, IMAP4_RECONNECT_ATTEMPTS+1):
+            self.outlookclient_logger.info("Connection attempt #%d" % (attempt))
+            try:
+                self.outlookcl.disconnect()
+                if self.outlookcl.login(self.username, self.password):
+                    self.outlookcl.select(ITS_EMAIL_FOLDER, refresh=True)
+                    self.last_activity = time.time()
+                    return True
+            except CONNECTION_ERRORS, e:
+                self.outlookclient_logger.error("Connection attempt #%d failed: %s" % (attempt, e))
+
+            if attempt < IMAP4_RECONNECT_ATTEMPTS:
+                self.outlookclient_logger.info("Retrying connection in %d seconds" % (delay))
+                time.sleep(delay)
+                delay = min(delay * 2, IMAP4_RECONNECT_MAX_DELAY)
+
+        self.simple_logger.error("UNABLE TO CONNECT TO OUTLOOK")
+        raise imaplib.IMAP4.abort("Unable to connect after %d attempts" % (IMAP4_RECONNECT_ATTEMPTS))
+
+    def reconnect(self, error):
+        '''Provided the connection error, count it and connect again
+        '''
+        self.reconnects += 1
+        self.outlookclient_logger.warning("Connection lost (%s), reconnecting. Reconnect #%d" % (error, self.reconnects))
+        self.simple_logger.warning("OUTLOOK CONNECTION LOST, RECONNECTING")
+        return self.connect()
+
+    def check(self):
+        '''
+        Given a session, NOOP it if it has been quiet for the keepalive interval
+        and reconnect if the NOOP fails
+        '''
+        if not self.outlookcl.is_login:
+            return self.connect()
+        if self.last_activity is not None and time.time() - self.last_activity < self.keepalive_interval:
+            return True
+
+        try:
+            self.outlookcl.noop()
+            self.last_activity = time.time()
+            return True
+        except CONNECTION_ERRORS, e:
+            return self.reconnect(e)
+
+    def retrying(self, make_generator):
+        '''
+        Provided a function making an outlookclient generator, yield from it and
+        start it over on a fresh connection whenever the connection drops
+        '''
+        while True:
+            try:
+                for item in make_generator():
+                    self.last_activity = time.time()
+                    yield item
+                self.last_activity = time.time()
+                return
+            except CONNECTION_ERRORS, e:
+                self.reconnect(e)
+
+    def iter_new_ITS_email_info(self):
+        '''Given a managed session, yield outlookclient.get_new_ITS_email_info across reconnects
+        '''
+        self.check()
+        return self.retrying(self.outlookcl.get_new_ITS_email_info)
+
+    def listen(self, refresh, deadline=None):
+        '''Given a managed session, yield outlookclient.listen across reconnects
+        '''
+        self.check()
+        return self.retrying(lambda: self.outlookcl.listen(refresh, deadline))
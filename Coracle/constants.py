@@ -21,7 +21,41 @@ ITS_LOCATION_MAP = {
 FALL_SEMESTER_DATE_RANGE = "8/10/2010 - 12/10/3005" #No matter what you say or what you do
 SPRING_SEMESTER_DATE_RANGE = "1/10/1900 - 5/10/3005"
 
+HISTORY_JOURNAL_COMPACT_RECORDS = 1000
+HISTORY_BACKENDS = ["journal", "sqlite"]
+
+TOKEN_CACHE_SIZE = 1024 #a few dozen times, 7 weekdays and 366 month/day pairs fit with room to spare
+
 PHANTOMJS_SERVICE_ARGS = ['--ignore-ssl-errors=true', '--ssl-protocol=any'] #For depreciated versions of phantomjs that do not utilize ssl
+ITS_WAIT_POLL_INTERVAL = 0.05 #seconds between checks while waiting on a page, selenium's default is 0.5
+ITS_WAIT_TIMEOUT = 5
+ITS_WAIT_LOGIN_TIMEOUT = 10
+
+PHANTOMJS_PROFILES = ["full", "lean"]
+PHANTOMJS_DISK_CACHE_SIZE = 20 * 1024 #KB of pages, scripts and styles kept between loads by the lean profile
+PHANTOMJS_LEAN_SERVICE_ARGS = PHANTOMJS_SERVICE_ARGS + ['--load-images=false', '--disk-cache=true', '--max-disk-cache-size=%d' % (PHANTOMJS_DISK_CACHE_SIZE)]
+PHANTOMJS_BLOCKED_RESOURCES = r"\.(png|jpe?g|gif|bmp|ico|svg|webp|woff2?|ttf|otf|eot|mp3|mp4|ogg|webm)([?#]|$)" #images, fonts and media the lean profile never requests
+
+ITS_ENGINES = ["phantomjs", "http"]
+ITS_HTTP_TIMEOUT = 10
+ITS_HTTP_MAX_REDIRECTS = 5
+ITS_HTTP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/54.0 Safari/537.36"
+
+ITS_POOL_SIZE = 2
+ITS_POOL_REVALIDATE_INTERVAL = 5 * 60
+GRAB_QUEUE_SIZE = 20 #matched shifts waiting for a session before email ingestion blocks
+ITS_SCHEDULE_SNAPSHOT_TTL = 30 #seconds a parsed day of the schedule is trusted
+SCHEDULE_WATCH_MIN_INTERVAL = 10
+SCHEDULE_WATCH_MAX_INTERVAL = 2 * 60
+SCHEDULE_WATCH_DAYS = 14 #how far ahead the schedule is watched
+PRE_ARM_TARGETS = 0 #best ranked preferences kept pre-armed, none unless the settings ask
+PRE_ARM_DAYS = 7 #how far ahead the pre-armed day is looked for
+PRE_ARM_INTERVAL = 60 #seconds between re-arming the day, an armed page younger than this and the shift is not reloaded
+
+TENANT_ITS_SLOTS = 4 #ITS tasks running at once across every tenant of a process
+TENANT_SETTINGS_FILENAME = "settings.json"
+TENANT_CREDENTIALS_FILENAME = "creds.json"
+TENANT_UID_STATE_FILENAME = "outlook_uids.json" #each tenant keeps its last processed email uid next to its settings
 
 #All paths are relative to files in the parse dir for referencing
 PATH_TO_DEFAULT_SETTINGS_FILE = "../../settings/settings.json"
@@ -30,5 +64,17 @@ PATH_TO_DEFAULT_CREDENTIALS_FILE = "../../settings/creds.json"
 #paths relative to inside coracle
 PATH_TO_DEFAULT_LOGGING_FILE = "./log/logging.ini"
 PATH_TO_DEFAULT_HISTORY_DIR = "./history"
+PATH_TO_DEFAULT_HISTORY_FILE = "./history/history.json"
+PATH_TO_DEFAULT_HISTORY_DB = "./history/history.db"
+PATH_TO_DEFAULT_UID_STATE_FILE = "./history/outlook_uids.json"
 
 IMAP4_OUTLOOK_HOST = 'outlook.office365.com'
+IMAP4_IDLE_TIMEOUT = 29 * 60 #RFC 2177, re-issue IDLE before the server's 30 minute inactivity logout
+IMAP4_KEEPALIVE_INTERVAL = 5 * 60
+IMAP4_RECONNECT_ATTEMPTS = 8
+IMAP4_RECONNECT_BASE_DELAY = 1
+IMAP4_RECONNECT_MAX_DELAY = 60
+
+ITS_EMAIL_FOLDER = "Notes"
+ITS_EMAIL_FETCH_BATCH_SIZE = 50
+ITS_EMAIL_PEEK_BYTES = 2048 #ITS notifications fit well within this, longer ones fall back to a full fetch
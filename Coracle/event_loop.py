@@ -0,0 +1,250 @@
+import time
+import heapq
+import select
+from itertools import count
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+from connection_manager import CONNECTION_ERRORS
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+class Timer(object):
+    '''A callback scheduled on an Event_Loop, cancel() keeps it from running
+    '''
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Event_Loop(object):
+    '''
+    Single threaded select() event loop. Callbacks run when a socket they
+    wait on becomes readable or when their timer is due, so one thread waits
+    on IMAP, on timers and on the end of the active window at the same time
+    and never sleeps a fixed refresh.
+    '''
+
+    def __init__(self):
+        self.timers = []
+        self.sequence = count()
+        self.readers = {}
+        self.running = False
+
+        self.coracle_logger = logging.getLogger("Coracle")
+
+    def call_at(self, when, callback, *args):
+        '''Provided an epoch time, a callback and its arguments, run callback(*args) at that time
+        '''
+        timer = Timer(when, callback, args)
+        heapq.heappush(self.timers, (when, next(self.sequence), timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        '''Provided a delay in seconds, a callback and its arguments, run callback(*args) after the delay
+        '''
+        return self.call_at(time.time() + delay, callback, *args)
+
+    def add_reader(self, fileobj, callback, *args):
+        '''Provided a socket, a callback and its arguments, run callback(*args) whenever it is readable
+        '''
+        self.readers[fileobj.fileno()] = (fileobj, callback, args)
+
+    def remove_reader(self, fileobj):
+        '''Provided a socket, stop watching it
+        '''
+        try:
+            self.readers.pop(fileobj.fileno(), None)
+        except Exception:
+            #closed sockets have no fileno left, drop whichever reader it was
+            self.readers = dict((fileno, reader) for fileno, reader in self.readers.iteritems() if reader[0] is not fileobj)
+
+    def stop(self):
+        '''stop the loop after the callback running now
+        '''
+        self.running = False
+
+    def run_callback(self, callback, args):
+        try:
+            callback(*args)
+        except Exception, e:
+            self.coracle_logger.exception("Event loop callback %s failed: %s" % (getattr(callback, "__name__", callback), e))
+
+    def run_until(self, deadline):
+        '''Provided an epoch deadline, run callbacks as they are due until the deadline or stop()
+        '''
+        self.running = True
+        while self.running:
+            now = time.time()
+            if now >= deadline:
+                break
+
+            while self.timers and self.timers[0][2].cancelled:
+                heapq.heappop(self.timers)
+            wake_at = min(deadline, self.timers[0][0]) if self.timers else deadline
+
+            if self.readers:
+                readable, writable, errored = select.select(self.readers.keys(), [], [], max(0, wake_at - now))
+            else:
+                readable = []
+                time.sleep(max(0, wake_at - now))
+
+            for fileno in readable:
+                if fileno in self.readers and self.running:
+                    fileobj, callback, args = self.readers[fileno]
+                    self.run_callback(callback, args)
+
+            now = time.time()
+            while self.running and self.timers and self.timers[0][0] <= now:
+                when, sequence, timer = heapq.heappop(self.timers)
+                if not timer.cancelled:
+                    self.run_callback(timer.callback, timer.args)
+        self.running = False
+
+class Mail_Watcher(object):
+    '''
+    Mail_Watcher reads new ITS emails from a Connection_Manager on an
+    Event_Loop. With IDLE the session idles between reads and the loop wakes
+    as soon as the server writes to it, without IDLE a timer polls every
+    'refresh' seconds. Every new ITS email is handed to on_email.
+
+    A read that fails is logged by the loop and the watcher carries on: the
+    next poll is always scheduled, and an IDLE that cannot be re-entered is
+    retried with exponential backoff on a fresh connection.
+    '''
+
+    def __init__(self, loop, manager, on_email, refresh, idle=True):
+        self.loop = loop
+        self.manager = manager
+        self.outlookcl = manager.outlookcl
+        self.on_email = on_email
+        self.refresh = refresh
+        self.idle = idle
+
+        self.idle_socket = None
+        self.idle_timer = None
+        self.poll_timer = None
+        self.failures = 0
+
+        self.outlookclient_logger = logging.getLogger("outlookclient")
+
+    def start(self):
+        '''read what is already waiting, then idle or schedule the first poll
+        '''
+        self.fetch()
+        if self.idle and self.outlookcl.supports_idle():
+            self.resume_idle()
+        else:
+            if self.idle:
+                self.outlookclient_logger.warning("Server does not support IDLE, polling every %d seconds" % (self.refresh))
+            self.poll_timer = self.loop.call_later(self.refresh, self.poll)
+
+    def fetch(self, notified_at=None):
+        '''hand every new ITS email to on_email
+        '''
+        for ITS_email in self.manager.iter_new_ITS_email_info():
+            if notified_at is not None and ITS_email["sent"] is not None:
+                ITS_email["notification_latency"] = notified_at - ITS_email["sent"]
+            self.on_email(ITS_email)
+
+    def retry_delay(self):
+        '''return the backoff after the failures in a row, doubling from IMAP4_RECONNECT_BASE_DELAY up to IMAP4_RECONNECT_MAX_DELAY
+        '''
+        if not self.failures:
+            return 0
+        return min(IMAP4_RECONNECT_BASE_DELAY * 2 ** (self.failures - 1), IMAP4_RECONNECT_MAX_DELAY)
+
+    def poll(self):
+        try:
+            self.fetch()
+            self.failures = 0
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.poll_timer = self.loop.call_later(max(self.refresh, self.retry_delay()), self.poll)
+
+    def enter_idle(self):
+        '''IDLE the session and wake on its socket, or when the IDLE has to be renewed
+        '''
+        self.manager.check()
+        self.outlookcl.start_idle()
+        self.idle_socket = self.outlookcl.idle_socket()
+        self.loop.add_reader(self.idle_socket, self.on_readable)
+        self.idle_timer = self.loop.call_later(IMAP4_IDLE_TIMEOUT, self.renew_idle)
+
+    def leave_idle(self):
+        '''end the IDLE in progress and return the new message range, None if nothing arrived
+        '''
+        self.loop.remove_reader(self.idle_socket)
+        self.idle_timer.cancel()
+        self.idle_socket = None
+        return self.outlookcl.end_idle()
+
+    def resume_idle(self):
+        '''
+        IDLE again. If that fails, drop the session so the next attempt logs
+        in afresh, and try again after the backoff
+        '''
+        try:
+            self.enter_idle()
+            self.failures = 0
+        except Exception, e:
+            self.failures += 1
+            self.outlookclient_logger.error("Unable to IDLE (%s), retrying in %d seconds" % (e, self.retry_delay()))
+            if self.idle_socket is not None:
+                self.loop.remove_reader(self.idle_socket)
+                self.idle_socket = None
+            self.outlookcl.disconnect()
+            self.idle_timer = self.loop.call_later(self.retry_delay(), self.resume_idle)
+
+    def on_readable(self):
+        '''
+        The server wrote while idling. End the IDLE (which reads everything it
+        sent), fetch if messages arrived, and idle again whatever happened
+        '''
+        notified_at = time.time()
+        try:
+            new_messages = self.leave_idle()
+            if new_messages is not None:
+                self.outlookclient_logger.info("IDLE notified of messages %d:%d" % new_messages)
+                self.fetch(notified_at)
+        except CONNECTION_ERRORS, e:
+            self.manager.reconnect(e)
+        finally:
+            self.resume_idle()
+
+    def renew_idle(self):
+        '''re-issue IDLE before the server's inactivity logout
+        '''
+        try:
+            new_messages = self.leave_idle()
+            if new_messages is not None:
+                self.fetch(time.time())
+        except CONNECTION_ERRORS, e:
+            self.manager.reconnect(e)
+        finally:
+            self.resume_idle()
+
+    def stop(self):
+        '''end any IDLE and cancel the timers
+        '''
+        if self.poll_timer is not None:
+            self.poll_timer.cancel()
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+        if self.idle_socket is not None:
+            try:
+                self.leave_idle()
+            except CONNECTION_ERRORS, e:
+                self.outlookclient_logger.warning("Error ending IDLE: %s" % (e))
@@ -0,0 +1,178 @@
+import time
+import threading
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+from schedule_urls import resolve_year
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+class Grab_Job(object):
+    '''A matched ITS email waiting to be grabbed, with the times its latency is measured from
+    '''
+
+    def __init__(self, ITS_email, rank):
+        self.ITS_email = ITS_email
+        self.rank = rank
+        self.received = time.time()
+        self.sent = ITS_email.get("sent")
+        self.source = ITS_email.get("source", "email")
+        self.grabbed = None
+        self.finished = None
+        self.armed = False
+
+        #how long after the shift was freed it was noticed, as far as its source tells
+        self.detection_latency = ITS_email.get("detection_latency")
+        if self.detection_latency is None and self.source == "email" and self.sent is not None:
+            self.detection_latency = self.received - self.sent
+
+    @property
+    def start(self):
+        '''the datetime the shift starts, in a real year
+        '''
+        start_date = resolve_year(self.ITS_email["start_date"])
+        start_time = self.ITS_email["start_time"]
+        return start_date.replace(hour=start_time.hour, minute=start_time.minute)
+
+    @property
+    def priority(self):
+        '''sooner shifts first, then the better ranked preference
+        '''
+        return (time.mktime(self.start.timetuple()), self.rank)
+
+class Grab_Pipeline(object):
+    '''
+    Grab_Pipeline decouples reading ITS emails from grabbing their shifts. An
+    ingest worker reads emails, matches them against the preferences, and
+    queues every matching shift on the ITS session pool, soonest shift and
+    best ranked preference first. The pool's sessions grab them as they free
+    up. When the queue is full the ingest worker waits, so a slow ITS website
+    holds back reading more email instead of piling shifts up.
+
+    Latency from the email being read (and from it being sent) to the grab
+    finishing is logged for every shift and summarized by metrics().
+
+    With a Pre_Armer, shifts of its target preferences on an armed day go to
+    its armed sessions instead.
+    '''
+
+    def __init__(self, pool, matcher, grab, armer=None):
+        self.pool = pool
+        self.matcher = matcher
+        self.grab = grab
+        self.armer = armer
+
+        self.ingested = 0
+        self.queued = 0
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.stopping = threading.Event()
+
+        self.coracle_logger = logging.getLogger("Coracle")
+        self.simple_logger = logging.getLogger("simple_log")
+
+    def enqueue(self, ITS_email):
+        '''Provided an ITS email, queue its shift on the pool if any preference matches it
+        '''
+        with self.lock:
+            self.ingested += 1
+        rules = self.matcher.match_rules(ITS_email)
+        if not rules:
+            self.coracle_logger.info("No preference matches shift %s %s" % (ITS_email["start_date"], ITS_email["start_time"]))
+            return None
+
+        job = Grab_Job(ITS_email, rules[0].rank)
+        job.armed = self.armer is not None and self.armer.is_armed(ITS_email, rules)
+        pool = self.armer.pool if job.armed else self.pool
+        pool.submit_priority(job.priority, self.run_job, job)
+        with self.lock:
+            self.queued += 1
+        self.coracle_logger.info("Queued shift starting %s (rank %d%s)" % (job.start, job.rank, ", pre-armed" if job.armed else ""))
+        return job
+
+    def run_job(self, ITSdr, job):
+        '''Provided an ITS session and a job, grab its shift and record the latency
+        '''
+        try:
+            if job.armed:
+                job.grabbed = self.armer.grab(ITSdr, self.matcher, job.ITS_email, job.received)
+            else:
+                job.grabbed = self.grab(ITSdr, self.matcher, job.ITS_email)
+        finally:
+            job.finished = time.time()
+            with self.lock:
+                self.jobs.append(job)
+
+            latency_info = "%.2f seconds after reading the %s" % (job.finished - job.received, job.source)
+            if job.detection_latency is not None:
+                latency_info += ", detected %.2f seconds after it was freed" % (job.detection_latency)
+            self.coracle_logger.info("Shift starting %s %s %s" % (job.start, "grabbed" if job.grabbed else "not grabbed", latency_info))
+        return job.grabbed
+
+    def ingest(self, ITS_emails):
+        '''Provided an iterable of ITS emails, queue each one until it ends or the pipeline stops
+        '''
+        try:
+            for ITS_email in ITS_emails:
+                try:
+                    self.enqueue(ITS_email)
+                except (KeyError, ValueError, TypeError), e:
+                    self.coracle_logger.error("Skipping unmatchable ITS email %s: %r" % (ITS_email, e))
+                if self.stopping.is_set():
+                    break
+        except Exception, e:
+            self.coracle_logger.error("Email ingestion stopped: %s" % (e))
+            raise
+        finally:
+            self.stopping.set()
+
+    def run(self, ITS_emails):
+        '''
+        Provided an iterable of ITS emails, ingest it on its own worker and
+        return once it is exhausted. The pool keeps grabbing what is queued
+        '''
+        ingest_worker = threading.Thread(target=self.ingest, args=(ITS_emails,), name="ITS-email-ingest")
+        ingest_worker.daemon = True
+        ingest_worker.start()
+        try:
+            while ingest_worker.is_alive():
+                ingest_worker.join(1)
+        except KeyboardInterrupt:
+            self.stopping.set()
+            raise
+
+    def metrics(self):
+        '''
+        return how many emails were read, queued and grabbed, the grab latencies
+        so far, and the detection latency of each source shifts came from
+        '''
+        with self.lock:
+            latencies = [job.finished - job.received for job in self.jobs]
+
+            sources = {}
+            for job in self.jobs:
+                source = sources.setdefault(job.source, {"finished":0, "grabbed":0, "detection_latencies":[]})
+                source["finished"] += 1
+                source["grabbed"] += 1 if job.grabbed else 0
+                if job.detection_latency is not None:
+                    source["detection_latencies"].append(job.detection_latency)
+            for source in sources.values():
+                detection_latencies = source.pop("detection_latencies")
+                source["mean_detection_latency"] = sum(detection_latencies) / len(detection_latencies) if detection_latencies else None
+                source["max_detection_latency"] = max(detection_latencies) if detection_latencies else None
+
+            return {
+                "ingested":self.ingested,
+                "queued":self.queued,
+                "finished":len(self.jobs),
+                "grabbed":len([job for job in self.jobs if job.grabbed]),
+                "armed":len([job for job in self.jobs if job.armed]),
+                "mean_latency":sum(latencies) / len(latencies) if latencies else None,
+                "max_latency":max(latencies) if latencies else None,
+                "sources":sources
+            }
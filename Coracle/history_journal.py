@@ -0,0 +1,163 @@
+import json
+import os
+import datetime
+from os.path import dirname, realpath, join, isdir, exists
+
+import logging
+import logging.config
+
+from constants import *
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+def encode_datetime(value):
+    '''json.dumps default, provided a datetime return a tagged dict of it
+    '''
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__":value.strftime(DATETIME_FORMAT)}
+    raise TypeError("%r is not JSON serializable" % (value))
+
+def decode_datetime(value):
+    '''json.loads object_hook, provided a dict turn tagged datetimes back into datetimes
+    '''
+    if "__datetime__" in value:
+        return datetime.datetime.strptime(value["__datetime__"], DATETIME_FORMAT)
+    return value
+
+def dumps(value):
+    '''Provided shifts or a journal record, return its json with datetimes tagged
+    '''
+    return json.dumps(value, default=encode_datetime, sort_keys=True)
+
+def loads(json_str):
+    '''Provided json from dumps, return the shifts or record with datetimes restored
+    '''
+    return json.loads(json_str, object_hook=decode_datetime)
+
+class History_Journal(object):
+    '''
+    History_Journal persists a shift history as a snapshot file plus an append
+    only journal next to it ("<snapshot>.journal"). Every add, remove or update
+    is one json line appended to the journal, and compaction rewrites the
+    snapshot from the live history and empties the journal.
+
+    Replaying the journal over a snapshot that already contains it gives the
+    same history, so a crash between the two steps of compaction is harmless.
+    '''
+
+    def __init__(self, filepath, compact_records=HISTORY_JOURNAL_COMPACT_RECORDS):
+        self.snapshot_filepath = filepath
+        self.journal_filepath = filepath + ".journal"
+        self.compact_records = compact_records
+
+        self.records = 0
+        self.journal_file = None
+
+        self.historymanager_logger = logging.getLogger("historymanager")
+
+    def replay(self, history):
+        '''
+        Provided an empty history (Shift_Store), load the snapshot into it then
+        apply every journal record, and open the journal for appending
+        '''
+        if exists(self.snapshot_filepath):
+            with open(self.snapshot_filepath) as snapshot_file:
+                for shift in loads(snapshot_file.read() or "[]"):
+                    history.add(shift)
+            self.historymanager_logger.info("Loaded %d shifts from snapshot %s" % (len(history), self.snapshot_filepath))
+
+        self.records = 0
+        if exists(self.journal_filepath):
+            valid_size = 0
+            with open(self.journal_filepath, "rb") as journal_file:
+                for line in journal_file:
+                    if not line.endswith("\n"):
+                        break
+                    valid_size += len(line)
+                    try:
+                        record = loads(line)
+                    except ValueError:
+                        self.historymanager_logger.warning("Skipping corrupt journal record in %s" % (self.journal_filepath))
+                        continue
+                    self.apply(history, record)
+                    self.records += 1
+
+            # a crash mid-append leaves a line without its newline, cut it off so
+            # the next record starts on a line of its own
+            if valid_size < os.path.getsize(self.journal_filepath):
+                self.historymanager_logger.warning("Truncating torn journal record in %s" % (self.journal_filepath))
+                with open(self.journal_filepath, "r+b") as journal_file:
+                    journal_file.truncate(valid_size)
+            self.historymanager_logger.info("Replayed %d journal records from %s" % (self.records, self.journal_filepath))
+
+        self.open()
+
+    def apply(self, history, record):
+        '''Provided a history and a journal record, apply the record to the history
+        '''
+        if record["op"] == "add":
+            history.add(record["shift"])
+        elif record["op"] == "remove":
+            if record["shift"] in history:
+                history.remove(record["shift"])
+        elif record["op"] == "update":
+            if record["old"] in history:
+                history.remove(record["old"])
+            history.add(record["new"])
+        else:
+            self.historymanager_logger.error("Unknown journal record %s" % (record))
+
+    def open(self):
+        '''Given the journal filepath, open it for appending, creating its directory
+        '''
+        journal_dir = dirname(self.journal_filepath)
+        if journal_dir and not isdir(journal_dir):
+            os.makedirs(journal_dir)
+        self.journal_file = open(self.journal_filepath, "a")
+
+    def append(self, record):
+        '''Provided a record, write it as one journal line. Return True when compaction is due
+        '''
+        self.journal_file.write(dumps(record) + "\n")
+        self.journal_file.flush()
+        self.records += 1
+        return self.records >= self.compact_records
+
+    def flush(self):
+        '''Given an open journal, push its writes to disk
+        '''
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+
+    def compact(self, history):
+        '''
+        Provided the live history, write it to a new snapshot, swap it in, and
+        empty the journal
+        '''
+        temp_filepath = self.snapshot_filepath + ".tmp"
+        with open(temp_filepath, "w") as snapshot_file:
+            snapshot_file.write(dumps(list(history)))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        try:
+            os.rename(temp_filepath, self.snapshot_filepath)
+        except OSError:
+            os.remove(self.snapshot_filepath)
+            os.rename(temp_filepath, self.snapshot_filepath)
+
+        self.journal_file.close()
+        self.journal_file = open(self.journal_filepath, "w")
+        self.records = 0
+        self.historymanager_logger.info("Compacted %d shifts into snapshot %s" % (len(history), self.snapshot_filepath))
+
+    def close(self):
+        '''Given an open journal, flush and close it
+        '''
+        if self.journal_file is not None:
+            self.flush()
+            self.journal_file.close()
+            self.journal_file = None
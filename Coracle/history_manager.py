@@ -1,6 +1,6 @@
-import json
+import math
 import datetime
-from copy import deepcopy
+from os.path import dirname, realpath, join
 
 import logging
 import logging.config
@@ -8,23 +8,44 @@ import logging.config
 from constants import *
 from parse.ITS_message_parsers import *
 from coracle_exceptions import ParseException
+from shift_store import Shift_Store
+from history_journal import History_Journal
+from history_sqlite import SQLite_Shift_Store
 
 current_filepath = dirname(realpath(__file__))
 
 logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
 
+WEEK_SECONDS = datetime.timedelta(weeks=1).total_seconds()
+
 class History_Manager(object):
     '''
     History_Manager manages a json file containing all the history information.
 
-    Stores all history information into a json. Format as follows
+    Stores all history information into a json snapshot. Format as follows
 
     [{shift_info}, ...]
+
+    Changes since the snapshot are appended to "<file>.journal", one json
+    record per add, remove or update, and are folded back into the snapshot
+    every HISTORY_JOURNAL_COMPACT_RECORDS records. In memory the history is a
+    Shift_Store, indexed by shift identity and date.
+
+    With backend="sqlite" the history lives in a sqlite database instead
+    (SQLite_Shift_Store) and every change is one committed transaction. An
+    existing json history is converted with history_sqlite.import_json_history.
     '''
 
-    def __init__(self, *args, **kwargs):
-        self._file = open(mode="rw+", *args, **kwargs)
-        self._history = []
+    def __init__(self, filepath=None, advanced_logging=False, backend="journal"):
+        assert backend in HISTORY_BACKENDS, "Unknown history backend %s" % (backend)
+        self._backend = backend
+
+        if backend == "sqlite":
+            self._filepath = filepath or join(current_filepath, PATH_TO_DEFAULT_HISTORY_DB)
+            self._journal = None
+        else:
+            self._filepath = filepath or join(current_filepath, PATH_TO_DEFAULT_HISTORY_FILE)
+            self._journal = History_Journal(self._filepath)
 
         self.historymanager_logger = logging.getLogger("historymanager")
         self.simple_logger = logging.getLogger("simple_log")
@@ -32,67 +53,114 @@ class History_Manager(object):
         if advanced_logging:
             self.simple_logger.handlers = [h for h in self.simple_logger.handlers if type(h) != logging.StreamHandler]
         else:
-            self.historymanager_logger.handlers = [h for h in self.outlookclient_logger.handlers if type(h) != logging.StreamHandler]
+            self.historymanager_logger.handlers = [h for h in self.historymanager_logger.handlers if type(h) != logging.StreamHandler]
+
+        if self._journal is None:
+            self._history = SQLite_Shift_Store(self._filepath)
+        else:
+            self._history = Shift_Store()
+            self._journal.replay(self._history)
 
     def __enter__(self):
-        return json.loads(self._file.read())
+        return self
 
-    def __exit__(self):
-        self._file.close()
+    def __exit__(self, *exc_info):
+        self.close()
 
     @property
     def history(self):
         return self._history
 
+    def record(self, record):
+        '''
+        Provided a journal record, append it and compact the journal when it is
+        due. The sqlite backend commits the change instead
+        '''
+        if self._journal is None:
+            self.history.commit()
+        elif self._journal.append(record):
+            self.compact()
+
     def save(self):
-        self._file.truncate()
-        self._file.write(str(self._history))
-        self.historymanager_logger.info("Saving %d history shifts to %s" % (len(self.history), self._file.name))
+        '''Every change is already journaled (or committed), push the journal to disk
+        '''
+        if self._journal is not None:
+            self._journal.flush()
+        self.historymanager_logger.info("Saved history of %d shifts to %s" % (len(self.history), self._filepath))
+
+    def compact(self):
+        '''Rewrite the snapshot from the history and empty the journal
+        '''
+        if self._journal is not None:
+            self._journal.compact(self.history)
+
+    def close(self):
+        '''Compact the history and close the journal, or close the database
+        '''
+        if self._journal is None:
+            self.history.close()
+        else:
+            self.compact()
+            self._journal.close()
 
     def add_shift(self, shift):
         '''Check if the shift isn't in the history, then add it to 'history'
         '''
-        if shift not in self.history:
-            self.history.append(shift)
+        if self.history.add(shift):
+            self.record({"op":"add", "shift":shift})
+            return True
+        return False
 
     def remove_shift(self, shift):
         '''index and remove provided shift in history
         '''
         self.history.remove(shift)
+        self.record({"op":"remove", "shift":shift})
 
     def replace_shift(self, old_shift, new_shift):
         '''index and remove old shift, then add new_shift
         '''
-        self.remove_shift(old_shift)
-        self.add_shift(new_shift)
+        self.history.remove(old_shift)
+        self.history.add(new_shift)
+        self.record({"op":"update", "old":old_shift, "new":new_shift})
 
     def update_shift(self, shift, update_info={}):
         '''provided a shift and a dict, replace the shift with new info
         '''
-        self.replace(shift, shift.update(update_info))
+        new_shift = dict(shift)
+        new_shift.update(update_info)
+        self.replace_shift(shift, new_shift)
 
-    def transform_perm_shift(self, perm_shift):
+    def iter_perm_shift(self, perm_shift, start=None, end=None):
         '''
-        Input a perm_shift and transform it to a bunch of temp_shifts
-        each containing their own weekly shift
+        Input a perm_shift and yield its weekly temp_shifts, only the ones
+        dated within start and end when given. The first and last week in the
+        window are computed directly, so a short window costs the same for a
+        perm_shift of any length
         '''
         assert perm_shift["start_date"] <= perm_shift["end_date"], "Start must be before the end"
 
         if perm_shift["type"] != "PermShift":
-            return [perm_shift]
+            yield perm_shift
+            return
 
-        shifts = []
-        weeks = (shift["end_date"] - shift["start_date"]).days / 7
-        for week_num in range(weeks):
-            decomposed_shift = deepcopy(perm_shift)
-            decomposed_shift["start_date"] = shift["start_date"] + datetime.timedelta(weeks=week_num)
-            decomposed_shift["end_date"] = decomposed_shift["start_date"]
-            decomposed_shift["type"] = "TempShift"
-            decomposed_shift["actions"] = "TempTake"
+        first_week = 0
+        last_week = int((perm_shift["end_date"] - perm_shift["start_date"]).total_seconds() // WEEK_SECONDS)
+        if start is not None:
+            first_week = max(first_week, int(math.ceil((start - perm_shift["start_date"]).total_seconds() / WEEK_SECONDS)))
+        if end is not None:
+            last_week = min(last_week, int((end - perm_shift["start_date"]).total_seconds() // WEEK_SECONDS))
 
-            shifts.append(decomposed_shift)
+        for week_num in xrange(first_week, last_week+1):
+            shift_date = perm_shift["start_date"] + datetime.timedelta(weeks=week_num)
+            yield dict(perm_shift, start_date=shift_date, end_date=shift_date, type="TempShift", actions="TempTake")
 
-        return shifts
+    def transform_perm_shift(self, perm_shift):
+        '''
+        Input a perm_shift and transform it to a bunch of temp_shifts
+        each containing their own weekly shift
+        '''
+        return list(self.iter_perm_shift(perm_shift))
 
     def get_shifts_in_date_range(self, start, end):
         '''
@@ -104,33 +172,21 @@ class History_Manager(object):
         assert start <= end, "Start must be before the end"
 
         in_arg_range = lambda d: start <= d <= end
-        in_shift_range = lambda shift, date: shift["start_date"] <= date <= shift["end_date"]
 
-        delete_shifts = []
         return_shifts = []
-        for shift in self.history:
-            if shift["type"] == "TempShift":
-                assert shift["start_date"] == shift["end_date"], "Improper shift label"
-                if in_arg_range(shift["start_date"]):
-                    return_shifts.append(shift)
-            elif shift["type"] == "PermShift":
-                if in_arg_range(shift["start_date"]) and in_arg_range(shift["end_date"]):
-                    return_shifts.append(shift)
-                    
-                deconstructed_temp_shifts = self.transform_perm_shift(shift)
-
-                filtered_temp_shifts = []
-                for deconstructed_temp_shift in deconstructed_temp_shifts:
-                    if start <= deconstructed_temp_shift["start_date"] <= end:
-                        filtered_temp_shifts.append(deconstructed_temp_shift)
-
-                return_shifts.extend(filtered_temp_shifts)
-            else:
-                self.historymanager_logger.error("Improperly labeled shift %s" % (shift))
-                self.historymanager_logger.error("Deleting shift")
-                delete_shifts.append(shift)
-        
-        for delete_shift in delete_shifts:
+        for shift in self.history.temp_shifts_in_date_range(start, end):
+            assert shift["start_date"] == shift["end_date"], "Improper shift label"
+            return_shifts.append(shift)
+
+        for shift in self.history.perm_shifts_in_date_range(start, end):
+            if in_arg_range(shift["start_date"]) and in_arg_range(shift["end_date"]):
+                return_shifts.append(shift)
+
+            return_shifts.extend(self.iter_perm_shift(shift, start, end))
+
+        for delete_shift in self.history.untyped_shifts():
+            self.historymanager_logger.error("Improperly labeled shift %s" % (delete_shift))
+            self.historymanager_logger.error("Deleting shift")
             self.remove_shift(delete_shift)
 
         return return_shifts
@@ -0,0 +1,255 @@
+import os
+import sys
+import ast
+import sqlite3
+import datetime
+from os.path import dirname, realpath, join, isdir, exists
+
+import logging
+import logging.config
+
+from constants import *
+from history_journal import History_Journal, DATETIME_FORMAT, dumps, loads
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shifts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    shift TEXT NOT NULL UNIQUE,
+    type TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    weekday TEXT,
+    start_time TEXT,
+    location TEXT
+);
+CREATE TABLE IF NOT EXISTS shift_actions (
+    shift_id INTEGER NOT NULL REFERENCES shifts(id) ON DELETE CASCADE,
+    action TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shifts_type_start_date ON shifts (type, start_date);
+CREATE INDEX IF NOT EXISTS shifts_type_end_date ON shifts (type, end_date);
+CREATE INDEX IF NOT EXISTS shifts_start_date ON shifts (start_date);
+CREATE INDEX IF NOT EXISTS shifts_weekday ON shifts (weekday);
+CREATE INDEX IF NOT EXISTS shifts_start_time ON shifts (start_time);
+CREATE INDEX IF NOT EXISTS shifts_location ON shifts (location);
+CREATE INDEX IF NOT EXISTS shift_actions_action ON shift_actions (action);
+CREATE INDEX IF NOT EXISTS shift_actions_shift_id ON shift_actions (shift_id);
+'''
+
+def column_datetime(value):
+    '''
+    Provided a shift value, return it as sortable text (DATETIME_FORMAT) if it
+    is a datetime. isoformat() also takes the years before 1900 a range query
+    can reach, which strftime() refuses
+    '''
+    if isinstance(value, datetime.datetime):
+        return value.replace(microsecond=0).isoformat()
+    return value
+
+def column_weekday(shift):
+    '''Provided a shift, return its weekday name
+    '''
+    weekday = shift.get("weekday_name", shift.get("weekday"))
+    if isinstance(weekday, datetime.datetime):
+        return weekday.strftime("%A")
+    return weekday
+
+def column_actions(shift):
+    '''Provided a shift, return its actions as a list
+    '''
+    actions = shift.get("actions") or []
+    if isinstance(actions, basestring):
+        return [actions]
+    return list(actions)
+
+class SQLite_Shift_Store(object):
+    '''
+    Shift history kept in a sqlite database, a drop in for Shift_Store. Every
+    shift is stored as its json (sorted keys, so equal shifts give equal json)
+    next to indexed columns for type, start_date, weekday, start_time, location
+    and, in shift_actions, action. The json is unique, so a dedup check is a
+    single index lookup.
+
+    Changes are made inside a transaction which is committed by commit(), so
+    the manager can commit once per add, remove or update.
+    '''
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        database_dir = dirname(filepath)
+        if database_dir and not isdir(database_dir):
+            os.makedirs(database_dir)
+
+        self.connection = sqlite3.connect(filepath)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+        self.historymanager_logger = logging.getLogger("historymanager")
+        self.historymanager_logger.info("Opened sqlite history %s with %d shifts" % (filepath, len(self)))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM shifts").fetchone()[0]
+
+    def __iter__(self):
+        for row in self.connection.execute("SELECT shift FROM shifts ORDER BY id"):
+            yield loads(row[0])
+
+    def __contains__(self, shift):
+        return self.connection.execute("SELECT 1 FROM shifts WHERE shift = ?", (dumps(shift),)).fetchone() is not None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def select_shifts(self, where, args=()):
+        '''Provided a where clause and its arguments, return the matching shifts ordered by date
+        '''
+        rows = self.connection.execute("SELECT shift FROM shifts WHERE %s ORDER BY start_date, id" % (where), args)
+        return [loads(row[0]) for row in rows]
+
+    def add(self, shift):
+        '''Provided a shift, add it unless an equal shift is stored. Return True if added
+        '''
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO shifts (shift, type, start_date, end_date, weekday, start_time, location) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (dumps(shift), shift.get("type"), column_datetime(shift.get("start_date")), column_datetime(shift.get("end_date")),
+             column_weekday(shift), column_datetime(shift.get("start_time")), shift.get("location")))
+        if cursor.rowcount == 0:
+            return False
+
+        shift_id = cursor.lastrowid
+        self.connection.executemany("INSERT INTO shift_actions (shift_id, action) VALUES (?, ?)",
+                                    [(shift_id, action) for action in column_actions(shift)])
+        return True
+
+    def remove(self, shift):
+        '''Provided a shift, remove the stored shift equal to it. Raise ValueError if none is
+        '''
+        cursor = self.connection.execute("DELETE FROM shifts WHERE shift = ?", (dumps(shift),))
+        if cursor.rowcount == 0:
+            raise ValueError("Shift not in history: %s" % (shift))
+
+    def commit(self):
+        '''Commit the changes made since the last commit
+        '''
+        self.connection.commit()
+
+    def close(self):
+        '''Commit and close the database
+        '''
+        self.connection.commit()
+        self.connection.close()
+
+    def untyped_shifts(self):
+        '''return the stored shifts that are neither TempShift nor PermShift
+        '''
+        return self.select_shifts("type IS NULL OR type NOT IN (%s)" % (", ".join("?" * len(SHIFT_TYPES))), SHIFT_TYPES)
+
+    def temp_shifts_in_date_range(self, start, end):
+        '''Provided a start and an end, return the TempShifts dated within them
+        '''
+        return self.select_shifts("type = 'TempShift' AND start_date BETWEEN ? AND ?", (column_datetime(start), column_datetime(end)))
+
+    def perm_shifts_in_date_range(self, start, end):
+        '''Provided a start and an end, return the PermShifts overlapping them
+        '''
+        return self.select_shifts("type = 'PermShift' AND start_date <= ? AND end_date >= ?", (column_datetime(end), column_datetime(start)))
+
+    def shifts_with_action(self, action):
+        '''Provided an action, return the stored shifts offering it
+        '''
+        return self.select_shifts("id IN (SELECT shift_id FROM shift_actions WHERE action = ?)", (action,))
+
+
+LEGACY_HISTORY_NAMES = {"None":None, "True":True, "False":False}
+LEGACY_HISTORY_CALLS = {"datetime":datetime.datetime, "date":datetime.date}
+
+def legacy_history_value(node):
+    '''
+    Provided a node of a parsed legacy history, return its value. Only
+    literals and datetime.datetime(...)/datetime.date(...) of literal numbers
+    are accepted, anything else raises ValueError
+    '''
+    if isinstance(node, ast.Expression):
+        return legacy_history_value(node.body)
+    if isinstance(node, ast.Str):
+        return node.s
+    if isinstance(node, ast.Num):
+        return node.n
+    if isinstance(node, ast.Name) and node.id in LEGACY_HISTORY_NAMES:
+        return LEGACY_HISTORY_NAMES[node.id]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Num):
+        return -node.operand.n
+    if isinstance(node, ast.List):
+        return [legacy_history_value(element) for element in node.elts]
+    if isinstance(node, ast.Tuple):
+        return tuple(legacy_history_value(element) for element in node.elts)
+    if isinstance(node, ast.Dict):
+        return dict((legacy_history_value(key), legacy_history_value(value)) for key, value in zip(node.keys, node.values))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "datetime" and node.func.attr in LEGACY_HISTORY_CALLS
+            and not (node.keywords or node.starargs or node.kwargs)
+            and all(isinstance(arg, ast.Num) and isinstance(arg.n, (int, long)) for arg in node.args)):
+        return LEGACY_HISTORY_CALLS[node.func.attr](*[arg.n for arg in node.args])
+    raise ValueError("Unexpected %s in legacy history at line %s" % (node.__class__.__name__, getattr(node, "lineno", "?")))
+
+def read_legacy_history(filepath):
+    '''
+    Provided the file History_Manager used to write (str of its shift list,
+    datetimes included), return the shifts in it. The file is parsed, never
+    run, so it can only hold literals and datetimes
+    '''
+    with open(filepath) as history_file:
+        history_str = history_file.read().strip()
+    if not history_str:
+        return []
+    try:
+        return legacy_history_value(ast.parse(history_str, filepath, "eval"))
+    except SyntaxError, e:
+        raise ValueError("Unable to parse legacy history %s: %s" % (filepath, e))
+
+def import_json_history(json_filepath, database_filepath):
+    '''
+    Provided a json history and a sqlite database path, copy every shift into
+    the database and return how many were added. Both the journaled snapshot
+    (with its journal) and the old str(list) history file are understood.
+    Shifts already in the database are skipped, so importing twice is harmless
+    '''
+    historymanager_logger = logging.getLogger("historymanager")
+
+    store = SQLite_Shift_Store(database_filepath)
+    before = len(store)
+    try:
+        journal = History_Journal(json_filepath)
+        try:
+            if exists(journal.journal_filepath):
+                journal.replay(store)
+                journal.close()
+            else:
+                with open(json_filepath) as snapshot_file:
+                    shifts = loads(snapshot_file.read() or "[]")
+                for shift in shifts:
+                    store.add(shift)
+        except ValueError:
+            historymanager_logger.info("%s is not a json snapshot, reading it as a legacy history" % (json_filepath))
+            for shift in read_legacy_history(json_filepath):
+                store.add(shift)
+        store.commit()
+        imported = len(store) - before
+    finally:
+        store.close()
+
+    historymanager_logger.info("Imported %d shifts from %s into %s" % (imported, json_filepath, database_filepath))
+    return imported
+
+
+if __name__ == "__main__":
+    json_filepath = sys.argv[1] if len(sys.argv) > 1 else join(current_filepath, PATH_TO_DEFAULT_HISTORY_FILE)
+    database_filepath = sys.argv[2] if len(sys.argv) > 2 else join(current_filepath, PATH_TO_DEFAULT_HISTORY_DB)
+    print "Imported %d shifts into %s" % (import_json_history(json_filepath, database_filepath), database_filepath)
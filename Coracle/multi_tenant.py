@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+from os.path import dirname, realpath, join, isdir, isfile
+
+import logging
+import logging.config
+
+from constants import *
+from Coracle import Coracle
+from session_pool import Fair_Share
+from schedule_snapshot import Schedule_Snapshot_Cache
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+class Tenant_Runner(object):
+    '''
+    Tenant_Runner runs a Coracle for every tenant of a directory in one
+    process. Each tenant is a subdirectory holding its own settings.json and
+    creds.json, and keeps its own IMAP connection, email uid state and ITS
+    session pool.
+
+    The tenants share the process, the parsing caches, one schedule snapshot
+    cache, and a Fair_Share of 'slots' ITS tasks running at once, handed out so
+    that one busy tenant cannot starve the others. A tenant that fails to load
+    or stops with an error does not stop the rest.
+    '''
+
+    def __init__(self, tenants_dirpath, slots=TENANT_ITS_SLOTS, event_loop=False):
+        self.tenants_dirpath = tenants_dirpath
+        self.event_loop = event_loop
+
+        self.share = Fair_Share(slots)
+        self.schedule_snapshots = Schedule_Snapshot_Cache()
+        self.tenants = OrderedDict()
+        self.errors = {}
+
+        self.coracle_logger = logging.getLogger("Coracle")
+        self.simple_logger = logging.getLogger("simple_log")
+
+    def find_tenants(self):
+        '''Given the tenants directory, return (name, settings filepath, credentials filepath) of every tenant in it
+        '''
+        tenants = []
+        for name in sorted(os.listdir(self.tenants_dirpath)):
+            tenant_dirpath = join(self.tenants_dirpath, name)
+            settings_filepath = join(tenant_dirpath, TENANT_SETTINGS_FILENAME)
+            credentials_filepath = join(tenant_dirpath, TENANT_CREDENTIALS_FILENAME)
+            if not isdir(tenant_dirpath):
+                continue
+            if not (isfile(settings_filepath) and isfile(credentials_filepath)):
+                self.coracle_logger.warning("Skipping tenant %s, it needs both %s and %s" % (name, TENANT_SETTINGS_FILENAME, TENANT_CREDENTIALS_FILENAME))
+                continue
+            tenants.append((name, settings_filepath, credentials_filepath))
+        return tenants
+
+    def load(self):
+        '''Given the tenants directory, configure a Coracle for every tenant that validates
+        '''
+        for name, settings_filepath, credentials_filepath in self.find_tenants():
+            coracle = Coracle()
+            try:
+                coracle.dict_configure(settings_filepath=settings_filepath, credentials_filepath=credentials_filepath, uid_state_filepath=join(self.tenants_dirpath, name, TENANT_UID_STATE_FILENAME))
+            except Exception, e:
+                self.coracle_logger.error("Tenant %s has invalid settings or credentials: %s" % (name, e))
+                self.errors[name] = e
+                continue
+            self.tenants[name] = coracle
+
+        self.coracle_logger.info("Loaded %d tenant(s) from %s" % (len(self.tenants), self.tenants_dirpath))
+        return self.tenants
+
+    def run_tenant(self, name, coracle):
+        '''Provided a tenant's name and Coracle, run it on the shared resources until it finishes
+        '''
+        self.coracle_logger.info("Tenant %s starting" % (name))
+        run = coracle.run_event_loop if self.event_loop else coracle.run
+        try:
+            run(share=self.share, schedule_snapshots=self.schedule_snapshots, tenant=name)
+        except Exception, e:
+            self.coracle_logger.exception("Tenant %s stopped with an error: %s" % (name, e))
+            self.errors[name] = e
+        self.coracle_logger.info("Tenant %s finished" % (name))
+
+    def run(self):
+        '''TIME TO RUN, every tenant at once, returning when all of them are done
+        '''
+        if not self.tenants:
+            self.load()
+
+        workers = []
+        for name, coracle in self.tenants.iteritems():
+            worker = threading.Thread(target=self.run_tenant, args=(name, coracle), name="Coracle-%s" % (name))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(1)
+        finally:
+            self.coracle_logger.info("Tenant fair share metrics: %s" % (self.share.metrics()))
+            self.coracle_logger.info("Shared schedule snapshot metrics: %s" % (self.schedule_snapshots.metrics()))
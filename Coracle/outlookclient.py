@@ -1,7 +1,15 @@
 import imaplib
 import email
+import json
+import os
+import re
+import email.utils
 import smtplib
 import datetime
+import socket
+import time
+import threading
+import Queue
 from os.path import abspath, dirname, realpath, join
 import email.mime.multipart
 
@@ -23,9 +31,26 @@ class outlookclient(object):
     outlook client grabs email from ITS, and parsers through the email for specific information.
     '''
 
-    def __init__(self, advanced_logging=False):
+    def __init__(self, advanced_logging=False, host=IMAP4_OUTLOOK_HOST, port=None, ssl=True, state_filepath=None, lean_fetch=True, batch_size=ITS_EMAIL_FETCH_BATCH_SIZE):
         self.is_login = False
 
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.exists = 0
+        self.uidvalidity = None
+        self.selected_folder = None
+        self.idle_tag = None
+        self.idle_exists = 0
+
+        self.state_filepath = state_filepath or join(current_filepath, PATH_TO_DEFAULT_UID_STATE_FILE)
+        self.state = {}
+
+        self.lean_fetch = lean_fetch
+        self.batch_size = batch_size
+        self.fetched_bytes = 0
+        self.cycle_fetched_bytes = 0
+
         self.today = (datetime.datetime.now()-datetime.timedelta(1)).strftime("%d-%b-%Y")
         self.imap = None
 
@@ -46,14 +71,64 @@ class outlookclient(object):
         else:
             self.outlookclient_logger.handlers = [h for h in self.outlookclient_logger.handlers if type(h) != logging.StreamHandler]
 
+        self.load_state()
         self.outlookclient_logger.info("%s object initialized" % (self.__class__))
 
+    def load_state(self):
+        '''Given a state filepath, load the per folder uidvalidity and last processed uid
+        '''
+        try:
+            with open(self.state_filepath) as state_file:
+                self.state = json.load(state_file)
+            self.outlookclient_logger.info("Loaded uid state from %s" % (self.state_filepath))
+        except IOError:
+            self.outlookclient_logger.info("No uid state at %s, starting fresh" % (self.state_filepath))
+            self.state = {}
+        except ValueError:
+            self.outlookclient_logger.warning("Corrupt uid state at %s, starting fresh" % (self.state_filepath))
+            self.state = {}
+
+    def save_state(self):
+        '''Given the uid state, write it next to the old file then swap it in
+        '''
+        state_dir = dirname(self.state_filepath)
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+
+        temp_filepath = self.state_filepath + ".tmp"
+        with open(temp_filepath, "w") as state_file:
+            json.dump(self.state, state_file)
+        try:
+            os.rename(temp_filepath, self.state_filepath)
+        except OSError:
+            os.remove(self.state_filepath)
+            os.rename(temp_filepath, self.state_filepath)
+
+    def get_last_uid(self, folder=ITS_EMAIL_FOLDER):
+        '''Given the uid state, return the last processed uid of a folder, 0 if none
+        '''
+        folder_state = self.state.get(folder)
+        if not folder_state or folder_state["uidvalidity"] != self.uidvalidity:
+            return 0
+        return folder_state["last_uid"]
+
+    def mark_processed(self, uid, folder=ITS_EMAIL_FOLDER):
+        '''Provided a uid, raise the folder's high-water mark to it and persist it
+        '''
+        if int(uid) <= self.get_last_uid(folder):
+            return
+        self.state[folder] = {"uidvalidity": self.uidvalidity, "last_uid": int(uid)}
+        self.save_state()
+
     def init_IMAP(self):
-        '''Given self.imap, initialize imap ssl with the specific constant hostname
+        '''Given self.imap, initialize imap (ssl by default) with the configured host and port
         '''
         self.outlookclient_logger.info("Initializing imap client")
         try:
-            self.imap = imaplib.IMAP4_SSL(IMAP4_OUTLOOK_HOST)
+            imap_class = imaplib.IMAP4_SSL if self.ssl else imaplib.IMAP4
+            port = self.port or (imaplib.IMAP4_SSL_PORT if self.ssl else imaplib.IMAP4_PORT)
+            self.imap = imap_class(self.host, port)
+            self.selected_folder = None
         except KeyboardInterrupt, e:
             self.outlookclient_logger.error("Keyboard Interrupt, Stopping program")
             raise e
@@ -78,7 +153,7 @@ class outlookclient(object):
                 if success != "OK":
                     raise imaplib.IMAP4.abort("Login failed.\nInvalid Username: %s or invalid Password: %s" % (username, password))
 
-                self.outlookclient_logger.info("Login Success to outlook.office365.com")
+                self.outlookclient_logger.info("Login Success to %s" % (self.host))
                 self.simple_logger.info("LOGIN SUCCESS")
                 self.is_login = True
                 break
@@ -97,28 +172,71 @@ class outlookclient(object):
         
         return self.is_login
 
-    def select(self, select_str):
-        '''Provided a string, select that folder with imap
+    def disconnect(self):
+        '''Given an imap, drop the connection without waiting on the server and forget the login
+        '''
+        if self.imap is not None:
+            self.outlookclient_logger.info("Disconnecting imap client")
+            try:
+                self.imap.shutdown()
+            except Exception, e:
+                self.outlookclient_logger.warning("Error while disconnecting imap client: %s" % (e))
+        self.imap = None
+        self.is_login = False
+        self.selected_folder = None
+        self.idle_tag = None
+
+    def noop(self):
+        '''Given a logged in imap, send a NOOP to check the connection and pick up new EXISTS counts
+        '''
+        success, response = self.imap.noop()
+        if success != "OK":
+            self.outlookclient_logger.error("NOOP came back with %s" % (success))
+            raise imaplib.IMAP4.abort("NOOP came back with %s success response" % (success))
+
+        exists = self.imap.response("EXISTS")[1][-1]
+        if exists:
+            self.exists = int(exists)
+        return success, response
+
+    def select(self, select_str, refresh=False):
+        '''
+        Provided a string, select that folder with imap. The folder stays
+        selected for the session, so selecting it again is answered from the
+        cached SELECT state unless refresh is set
         '''
         if not self.is_login:
             self.outlookclient_logger.error("Attempting select without login. NO RESPONSE")
             self.simple_logger.error("MUST LOGIN FIRST BEFORE ACTING")
             return 
 
-        self.outlookclient_logger.info("Attempting select %s" % (select_str))
-        return self.imap.select(select_str)
+        if not refresh and self.selected_folder == select_str:
+            return "OK", [str(self.exists)]
 
-    def get_ITS_email_ids(self, unseen=False):
+        self.outlookclient_logger.info("Attempting select %s" % (select_str))
+        success, response = self.imap.select(select_str)
+        if success == "OK":
+            self.selected_folder = select_str
+            self.exists = int(response[0])
+            uidvalidity = self.imap.response("UIDVALIDITY")[1][0]
+            self.uidvalidity = int(uidvalidity) if uidvalidity else None
+
+            folder_state = self.state.get(select_str)
+            if folder_state and folder_state["uidvalidity"] != self.uidvalidity:
+                self.outlookclient_logger.warning("UIDVALIDITY of %s changed, forgetting last processed uid" % (select_str))
+        return success, response
+
+    def get_ITS_email_ids(self, unseen=False, uid=False):
         '''
         given an imap, and provided an unseen flag, return all or unseen 
-        emails from ITS from the current semester.
+        emails (ids or uids) from ITS from the current semester.
         '''
         if not self.is_login:
             self.outlookclient_logger.error("Attempting to get IDS without login. NO RESPONSE")
             self.simple_logger.error("MUST LOGIN FIRST BEFORE ACTING")
             return
 
-        self.select("Notes")
+        self.select(ITS_EMAIL_FOLDER)
 
         search_args = [None]
         
@@ -137,7 +255,10 @@ class outlookclient(object):
 
         self.outlookclient_logger.info("Submitting IMAP search query %s" % (str(search_args)))
         try:
-            success, response = self.imap.search(*search_args)
+            if uid:
+                success, response = self.imap.uid("SEARCH", *search_args[1:])
+            else:
+                success, response = self.imap.search(*search_args)
             if success != "OK":
                 self.outlookclient_logger.error("Unsuccessful response. Throwing IMAP4 abort")
                 raise imaplib.IMAP4.abort("Invalid search")
@@ -146,17 +267,26 @@ class outlookclient(object):
             self.outlookclient_logger.error("Search failed, exception caught, rethrowing IMAP4 abort")
             raise e            
 
+    def get_text_from_email(self, select_email):
+        '''
+        Provided an email, return its text with the Content-Transfer-Encoding
+        (quoted-printable, base64) decoded, or None if it is multipart
+        '''
+        if select_email.is_multipart():
+            return None
+        return select_email.get_payload(decode=True)
+
     def is_authentic_email(self, select_email):
         '''
         Provided an email, return bool based on email being from ITS and containing
         the correct information. Correct type, payload is a single message, source
-        is from ITS, and content contains 'Visit Punchcard'
+        is from ITS, and decoded content contains 'Visit Punchcard'
         '''
         authentic = True
 
         authentic &= (select_email.__module__ == email.message.__name__)
         authentic &= (isinstance(select_email.get_payload(), str))
-        authentic &= ("Visit PunchCard" in select_email.get_payload())
+        authentic &= ("Visit PunchCard" in (self.get_text_from_email(select_email) or ""))
         authentic &= (select_email.get("From") == "<%s>" % (ITS_EMAIL))
 
         return authentic
@@ -167,6 +297,29 @@ class outlookclient(object):
         date = email["date"]
         return datetime.datetime.strptime(date.strip(), "%a, %d %b %Y %H:%M:%S")
 
+    def get_timestamp_from_email(self, select_email):
+        '''Provided an email return the epoch seconds it was sent, timezone included
+        '''
+        date = email.utils.parsedate_tz(select_email["date"] or "")
+        if date is None:
+            return None
+        return email.utils.mktime_tz(date)
+
+    def get_info_from_email(self, select_email):
+        '''
+        Provided an email, authenticate the email and return the info dict from
+        status, user, and shift information. Return None if the email is invalid
+        '''
+        if not self.is_authentic_email(select_email):
+            return None
+
+        email_info = dict(parse_ITS_email(self.get_text_from_email(select_email))._asdict())
+
+        email_info["location"] = "" #location is not provided in email
+        email_info["sent"] = self.get_timestamp_from_email(select_email)
+
+        return email_info
+
     def get_info_from_emails(self, emails):
         '''
         Provided a list of emails, authenticate the email, if email is invalid, skip
@@ -178,31 +331,77 @@ class outlookclient(object):
         non_authentic_emails = 0
 
         for select_email in emails:
-            if not self.is_authentic_email(select_email):
+            email_info = self.get_info_from_email(select_email)
+            if email_info is None:
                 non_authentic_emails += 1
                 continue
 
-            email_info = {}
-            email_info["user"] = get_person_from_email(select_email.get_payload())
+            authentic_emails += 1
+            yield email_info
+        self.outlookclient_logger.info("Finish iterating through emails. Authentic: %d, Non Authentic: %d" % (authentic_emails, non_authentic_emails))
 
-            start_date, end_date, weekday, start_time, end_time, shift_type, actions = get_time_range_from_email(select_email.get_payload())
+    def iter_batches(self, ids, fetch_batch):
+        '''
+        Provided ids and a function fetching a list of them, yield the fetched
+        items batch_size ids at a time. The next batch is fetched on a background
+        thread while the caller works through the current one, and at most one
+        fetched batch waits ahead. Nothing else may use imap until this is done
+        '''
+        batches = Queue.Queue(maxsize=1)
+        stop = threading.Event()
 
-            email_info["type"] = shift_type
-            email_info["actions"] = actions
-            email_info["start_date"] = start_date
-            email_info["end_date"] = end_date
-            email_info["weekday"] = weekday
-            email_info["start_time"] = start_time
-            email_info["end_time"] = end_time
+        def fetch_batches():
+            try:
+                for start in range(0, len(ids), self.batch_size):
+                    if stop.is_set():
+                        return
+                    batches.put(fetch_batch(ids[start:start+self.batch_size]))
+                batches.put(None)
+            except Exception, e:
+                batches.put(e)
 
-            email_info["location"] = "" #location is not provided in email
+        fetcher = threading.Thread(target=fetch_batches, name="outlookclient-fetcher")
+        fetcher.daemon = True
+        fetcher.start()
 
-            authentic_emails += 1
-            yield email_info
-        self.outlookclient_logger.info("Finish iterating through emails. Authentic: %d, Non Authentic: %d" % (authentic_emails, non_authentic_emails))
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                for item in batch:
+                    yield item
+        finally:
+            stop.set()
+            while fetcher.is_alive():
+                try:
+                    batches.get_nowait()
+                except Queue.Empty:
+                    fetcher.join(0.05)
+
+    def fetch_emails(self, ids):
+        '''Provided a list of ids, return the emails using a single imap.fetch
+        '''
+        try:
+            success, response = self.imap.fetch(",".join(ids), "(RFC822)")
+            if success != "OK":
+                self.outlookclient_logger.error("Unable to complete fetch. %s" % (response))
+                raise imaplib.IMAP4.abort("Fetch came back with %s success response" % (success))
+        except imaplib.IMAP4.abort, e:
+            self.outlookclient_logger.error("Unable to get emails from imap. %s" % (e))
+            raise e
+
+        response_size = self.get_response_size(response)
+        self.fetched_bytes += response_size
+        self.cycle_fetched_bytes += response_size
+
+        self.outlookclient_logger.info("Fetching success, yielding %d emails" % (len(ids)))
+        return [email.message_from_string(response[email_index][1]) for email_index in range(0, len(response), 2)]
 
     def iter_emails_from_ids(self, ids, num_emails):
-        '''Provided a list of ids, yield the emails using imap.fetch
+        '''Provided a list of ids, yield the emails using imap.fetch, batch_size ids at a time
         '''
         if not self.is_login:
             self.outlookclient_logger.error("Attempting to get email from ids without login. Must login to proceed")
@@ -211,20 +410,103 @@ class outlookclient(object):
         
         ids = ids[:num_emails]
         self.outlookclient_logger.info("Reduced ids to %d id(s)" % (len(ids)))
-        
+        if not ids:
+            return
+
+        for select_email in self.iter_batches(ids, self.fetch_emails):
+            yield select_email
+
+    @staticmethod
+    def get_response_size(response):
+        '''Provided an imap fetch response, return the number of bytes it carried
+        '''
+        size = 0
+        for fetched in response:
+            if isinstance(fetched, tuple):
+                size += sum(len(part) for part in fetched)
+            else:
+                size += len(fetched)
+        return size
+
+    def fetch_uid_emails(self, uids, lean=False):
+        '''
+        Provided a list of uids, return (uid, email) pairs using a single imap uid
+        fetch. If lean, only the From/Date and content headers and the first
+        ITS_EMAIL_PEEK_BYTES of the text are fetched, without setting the seen flag.
+        The content headers keep the text decodable
+        '''
+        if lean:
+            fetch_items = "(UID BODY.PEEK[HEADER.FIELDS (FROM DATE CONTENT-TYPE CONTENT-TRANSFER-ENCODING)] BODY.PEEK[TEXT]<0.%d>)" % (ITS_EMAIL_PEEK_BYTES)
+        else:
+            fetch_items = "(UID RFC822)"
+
         try:
-            success, response = self.imap.fetch(",".join(ids), "(RFC822)")
+            success, response = self.imap.uid("FETCH", ",".join(uids), fetch_items)
             if success != "OK":
-                self.outlookclient_logger.error("Unable to complete fetch. %s" % (response))
-                raise imaplib.IMAP4.abort("Fetch came back with %s success response" % (success))
-            
-            self.outlookclient_logger.info("Fetching success, yielding %d emails" % (len(ids)))
-            for email_index in range(0, len(response), 2):
-                yield email.message_from_string(response[email_index][1])
+                self.outlookclient_logger.error("Unable to complete uid fetch. %s" % (response))
+                raise imaplib.IMAP4.abort("UID fetch came back with %s success response" % (success))
         except imaplib.IMAP4.abort, e:
-            self.outlookclient_logger.error("Unable to get emails from imap. %s")
+            self.outlookclient_logger.error("Unable to get emails from imap by uid")
             raise e
-        
+
+        response_size = self.get_response_size(response)
+        self.fetched_bytes += response_size
+        self.cycle_fetched_bytes += response_size
+
+        # a message spans every response part from its "<seq> (" line to the next,
+        # and the header literal must come before the text literal
+        messages = []
+        for fetched in response:
+            envelope = fetched[0] if isinstance(fetched, tuple) else fetched
+            if re.match(r"\d+ \(", envelope):
+                messages.append([None, [], []])
+            if not messages:
+                continue
+
+            uid_match = re.search(r"UID (\d+)", envelope)
+            if uid_match:
+                messages[-1][0] = uid_match.group(1)
+            if isinstance(fetched, tuple):
+                if "HEADER" in envelope.upper():
+                    messages[-1][1].append(fetched[1])
+                else:
+                    messages[-1][2].append(fetched[1])
+
+        return [(uid, email.message_from_string("".join(headers) + "".join(texts))) for uid, headers, texts in messages]
+
+    def iter_uid_emails(self, uids, lean=False):
+        '''Provided a list of uids, yield (uid, email) pairs, batch_size uids at a time
+        '''
+        if not uids:
+            return
+
+        for uid_email in self.iter_batches(uids, lambda batch: self.fetch_uid_emails(batch, lean)):
+            yield uid_email
+
+    def get_info_from_lean_email(self, uid, select_email):
+        '''
+        Provided a uid and its lean email, return the info dict, or None if it
+        is not authentic or does not parse from the partial text
+        '''
+        try:
+            return self.get_info_from_email(select_email)
+        except (ParseException, ValueError, IndexError), e:
+            self.outlookclient_logger.warning("Unable to parse lean email %s: %s" % (uid, e))
+            return None
+
+    def get_info_from_full_email(self, uid, select_email):
+        '''
+        Provided a uid and its full email, return the info dict, or None if it
+        is not authentic or does not parse, so it is skipped rather than
+        stalling every email after it
+        '''
+        try:
+            return self.get_info_from_email(select_email)
+        except (ParseException, ValueError, IndexError), e:
+            self.outlookclient_logger.error("Skipping email %s, unable to parse it: %s" % (uid, e))
+            self.simple_logger.error("UNABLE TO PARSE ITS EMAIL, SKIPPING IT")
+            return None
+
     def get_ITS_email_info(self, unseen_flag=False, num_emails=-1):
         '''
         MAIN FUNCTION
@@ -250,6 +532,211 @@ class outlookclient(object):
         self.outlookclient_logger.info("Yielding info from ITS email iterator")
         for ITS_email in self.get_info_from_emails(ITS_emails):
             yield ITS_email
+
+    def get_new_ITS_email_uids(self):
+        '''
+        Given a selected folder, return the uids of ITS emails past the last
+        processed uid, oldest first. Without a last processed uid (first run or
+        UIDVALIDITY changed) fall back to the unseen emails of the semester
+        '''
+        last_uid = self.get_last_uid()
+        if not last_uid:
+            self.outlookclient_logger.info("No last processed uid, searching unseen emails of the semester")
+            return sorted(self.get_ITS_email_ids(True, uid=True), key=int)
+
+        self.outlookclient_logger.info("Submitting IMAP uid search past uid %d" % (last_uid))
+        try:
+            success, response = self.imap.uid("SEARCH", "UID", "%d:*" % (last_uid + 1), "FROM", ITS_EMAIL)
+            if success != "OK":
+                self.outlookclient_logger.error("Unsuccessful response. Throwing IMAP4 abort")
+                raise imaplib.IMAP4.abort("Invalid uid search")
+        except imaplib.IMAP4.abort, e:
+            self.outlookclient_logger.error("UID search failed, exception caught, rethrowing IMAP4 abort")
+            raise e
+
+        # n:* always matches the highest uid, even when it is below n
+        return sorted([uid for uid in response[0].split() if int(uid) > last_uid], key=int)
+
+    def get_new_ITS_email_info(self):
+        '''
+        MAIN FUNCTION (incremental)
+        Given a logged in client, yield the info dict of every ITS email past the
+        last processed uid. A uid is marked processed once the caller is done with
+        its email, so a restart resumes right after it
+        '''
+        if not self.is_login:
+            self.outlookclient_logger.error("Attempting to get new email info without login. Must login to proceed")
+            self.simple_logger.error("MUST LOGIN FIRST BEFORE ACTING")
+            return
+
+        self.simple_logger.info("GETTING NEW EMAIL INFO")
+        self.select(ITS_EMAIL_FOLDER)
+        ITS_email_uids = self.get_new_ITS_email_uids()
+        self.outlookclient_logger.info("%d new uids retrieved" % (len(ITS_email_uids)))
+
+        # lean emails from ITS that do not parse are fetched in full once the
+        # stream is done, and the high-water mark waits for them
+        self.cycle_fetched_bytes = 0
+        full_fetch_uids = []
+        for uid, ITS_email in self.iter_uid_emails(ITS_email_uids, self.lean_fetch):
+            if self.lean_fetch:
+                email_info = self.get_info_from_lean_email(uid, ITS_email)
+                if email_info is None and ITS_email.get("From") == "<%s>" % (ITS_EMAIL):
+                    full_fetch_uids.append(uid)
+                    continue
+            else:
+                email_info = self.get_info_from_full_email(uid, ITS_email)
+
+            if email_info is not None:
+                email_info["uid"] = uid
+                yield email_info
+            if not full_fetch_uids:
+                self.mark_processed(uid)
+
+        if full_fetch_uids:
+            self.outlookclient_logger.info("Falling back to full fetch for %d email(s)" % (len(full_fetch_uids)))
+            for uid, ITS_email in self.iter_uid_emails(full_fetch_uids):
+                email_info = self.get_info_from_full_email(uid, ITS_email)
+                if email_info is not None:
+                    email_info["uid"] = uid
+                    yield email_info
+            self.mark_processed(ITS_email_uids[-1])
+
+        if ITS_email_uids and self.lean_fetch:
+            self.imap.uid("STORE", ",".join(ITS_email_uids), "+FLAGS.SILENT", "(\\Seen)")
+
+        self.outlookclient_logger.info("Fetched %d bytes for %d email(s) this cycle, %d bytes in total" % (self.cycle_fetched_bytes, len(ITS_email_uids), self.fetched_bytes))
+
+    def supports_idle(self):
+        '''Given a logged in imap, check the server advertises the IDLE capability
+        '''
+        return "IDLE" in self.imap.capabilities
+
+    def idle_socket(self):
+        '''Given an imap, return the socket imaplib reads responses from
+        '''
+        return getattr(self.imap, "sslobj", None) or self.imap.sock
+
+    def start_idle(self):
+        '''Given a selected folder, issue IDLE and return once the server accepts it
+        '''
+        tag = self.imap._new_tag()
+        self.imap.send("%s IDLE\r\n" % (tag))
+
+        response = self.imap.readline()
+        if not response.startswith("+"):
+            self.outlookclient_logger.error("IDLE rejected by server: %s" % (response.strip()))
+            raise imaplib.IMAP4.abort("IDLE rejected: %s" % (response.strip()))
+
+        self.idle_tag = tag
+        self.idle_exists = self.exists
+
+    def read_idle_response(self, response):
+        '''Provided a line read while idling, track the EXISTS and EXPUNGE counts in it
+        '''
+        untagged = response.split()
+        if len(untagged) < 3 or untagged[0] != "*" or not untagged[1].isdigit():
+            return
+        if untagged[2].upper() == "EXISTS":
+            self.exists = int(untagged[1])
+        elif untagged[2].upper() == "EXPUNGE":
+            #only an expunge among the messages there before the IDLE moves where the new ones start
+            if int(untagged[1]) <= self.idle_exists:
+                self.idle_exists -= 1
+            self.exists -= 1
+
+    def end_idle(self):
+        '''
+        Given an IDLE in progress, send DONE and read up to its completion.
+        Return the (first, last) sequence numbers of the messages that arrived
+        while idling, or None if nothing arrived
+        '''
+        self.imap.send("DONE\r\n")
+        while True:
+            response = self.imap.readline()
+            if not response:
+                raise imaplib.IMAP4.abort("Connection closed ending IDLE")
+            if response.startswith(self.idle_tag):
+                break
+            self.read_idle_response(response)
+
+        self.idle_tag = None
+        if response.split()[1] != "OK":
+            self.outlookclient_logger.error("IDLE ended with %s" % (response.strip()))
+            raise imaplib.IMAP4.abort("IDLE ended with %s" % (response.strip()))
+
+        if self.exists > self.idle_exists:
+            return self.idle_exists + 1, self.exists
+        return None
+
+    def idle(self, timeout=IMAP4_IDLE_TIMEOUT):
+        '''
+        Given a selected folder, issue IDLE and block until the server reports
+        new messages or the timeout runs out. Return the (first, last) sequence
+        numbers of the new messages, or None if nothing arrived
+        '''
+        self.start_idle()
+
+        idle_socket = self.idle_socket()
+        idle_socket.settimeout(timeout)
+        try:
+            while self.exists <= self.idle_exists:
+                response = self.imap.readline()
+                if not response:
+                    raise imaplib.IMAP4.abort("Connection closed during IDLE")
+                self.read_idle_response(response)
+        except socket.timeout:
+            self.outlookclient_logger.info("IDLE timed out after %d seconds" % (timeout))
+        finally:
+            idle_socket.settimeout(None)
+
+        return self.end_idle()
+
+    def listen(self, refresh, deadline=None):
+        '''
+        MAIN FUNCTION (push mode)
+        Given a logged in client, block on IMAP IDLE and yield the info dict of
+        every new ITS email (past the last processed uid) as soon as the server
+        reports it, until the deadline
+        (epoch seconds). Falls back to polling every 'refresh' seconds when the
+        server does not support IDLE
+        '''
+        if not self.is_login:
+            self.outlookclient_logger.error("Attempting to listen without login. Must login to proceed")
+            self.simple_logger.error("MUST LOGIN FIRST BEFORE ACTING")
+            return
+
+        is_active = lambda: deadline is None or time.time() < deadline
+
+        if not self.supports_idle():
+            self.outlookclient_logger.warning("Server does not support IDLE, polling every %d seconds" % (refresh))
+            while is_active():
+                for ITS_email in self.get_new_ITS_email_info():
+                    yield ITS_email
+                time.sleep(refresh)
+            return
+
+        self.simple_logger.info("LISTENING FOR EMAILS")
+        for ITS_email in self.get_new_ITS_email_info():
+            yield ITS_email
+
+        while is_active():
+            timeout = IMAP4_IDLE_TIMEOUT
+            if deadline is not None:
+                timeout = max(min(timeout, deadline - time.time()), 1)
+
+            idle_start = time.time()
+            new_messages = self.idle(timeout)
+            notified_at = time.time()
+            if new_messages is None:
+                continue
+
+            self.outlookclient_logger.info("IDLE notified of messages %d:%d after waiting %.2f seconds" % (new_messages[0], new_messages[1], notified_at - idle_start))
+            for ITS_email in self.get_new_ITS_email_info():
+                if ITS_email["sent"] is not None:
+                    ITS_email["notification_latency"] = notified_at - ITS_email["sent"]
+                    self.outlookclient_logger.info("Notification arrived %.2f seconds after the email was sent" % (ITS_email["notification_latency"]))
+                yield ITS_email
             
 
 
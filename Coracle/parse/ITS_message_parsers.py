@@ -1,11 +1,75 @@
 import datetime
+import re
+import threading
+import timeit
+from collections import namedtuple, OrderedDict
 from string import printable
 
 from ..constants import *
+from ..coracle_exceptions import ParseException
 
 norm = lambda s:filter(lambda i:i in set(printable),str(s)).lower().replace(" ", "")
 normeq = lambda x, y: norm(x) == norm(y)
 
+class Token_Cache(object):
+    '''
+    Bounded least recently used cache of strptime results keyed by (token, format).
+    The ITS site and emails reuse a small vocabulary of times, weekdays and
+    month/day pairs, so after warming up nearly every conversion is a lookup.
+    '''
+
+    def __init__(self, size=TOKEN_CACHE_SIZE):
+        self.size = size
+        self.tokens = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def strptime(self, token, date_format):
+        '''Provided a token and its format, return the cached datetime, parsing it on a miss
+        '''
+        key = (token, date_format)
+        with self.lock:
+            if key in self.tokens:
+                self.hits += 1
+                value = self.tokens.pop(key)
+                self.tokens[key] = value
+                return value
+
+        value = datetime.datetime.strptime(token, date_format)
+
+        with self.lock:
+            self.misses += 1
+            self.tokens[key] = value
+            if len(self.tokens) > self.size:
+                self.tokens.popitem(last=False)
+        return value
+
+    def info(self):
+        '''return the hit/miss counters and current size of the cache
+        '''
+        return {"hits":self.hits, "misses":self.misses, "size":len(self.tokens), "max_size":self.size}
+
+    def clear(self):
+        '''empty the cache and reset its counters
+        '''
+        with self.lock:
+            self.tokens.clear()
+            self.hits = 0
+            self.misses = 0
+
+token_cache = Token_Cache()
+
+def cached_strptime(token, date_format):
+    '''provided a token and its format, return its datetime through the shared token cache
+    '''
+    return token_cache.strptime(token, date_format)
+
+def token_cache_info():
+    '''return the hit/miss counters of the shared token cache
+    '''
+    return token_cache.info()
+
 def get_info_from_schedule_block(info):
     '''provided a string of 'info' return the relevant information
     '''
@@ -22,8 +86,8 @@ def get_time_range(time_str):
     time_str = time_str.replace(" ","")
     start, end = time_str.split("-")
     
-    start_time = datetime.datetime.strptime(start, "%I:%M%p")
-    end_time = datetime.datetime.strptime(end, "%I:%M%p")
+    start_time = cached_strptime(start, "%I:%M%p")
+    end_time = cached_strptime(end, "%I:%M%p")
 
     return start_time, end_time
 
@@ -33,8 +97,8 @@ def get_date_range(date_str):
     date_str = date_str.replace(" ","")
     start, end = date_str.split("-") if "-" in date_str else [date_str, date_str]
 
-    start_date = datetime.datetime.strptime(start, "%m/%d")
-    end_date = datetime.datetime.strptime(end, "%m/%d")
+    start_date = cached_strptime(start, "%m/%d")
+    end_date = cached_strptime(end, "%m/%d")
 
     return start_date, end_date
 
@@ -79,9 +143,9 @@ def get_day_time_from_string(day_time_str):
     start_time_str = time_range_str.split("-")[0].strip()
     end_time_str = time_range_str.split("-")[1].strip()
 
-    weekday = datetime.datetime.strptime(weekday_str.strip(), "%A")
-    start_time = datetime.datetime.strptime(start_time_str.strip(), "%I:%M %p")
-    end_time = datetime.datetime.strptime(end_time_str.strip(), "%I:%M %p")
+    weekday = cached_strptime(weekday_str.strip(), "%A")
+    start_time = cached_strptime(start_time_str.strip(), "%I:%M%p")
+    end_time = cached_strptime(end_time_str.strip(), "%I:%M%p")
 
     return weekday, start_time, end_time
 
@@ -92,8 +156,8 @@ def get_time_range_from_shift_info(shift_info_str):
 
     if shift_identifier.lower() == "temp":
         start_date_str, end_date_str = "".join(shift_info_str.split()[3:6]).split("to")
-        start_date = datetime.datetime.strptime(start_date_str.strip(), "%m/%d")
-        end_date = datetime.datetime.strptime(end_date_str.strip(), "%m/%d")
+        start_date = cached_strptime(start_date_str.strip(), "%m/%d")
+        end_date = cached_strptime(end_date_str.strip(), "%m/%d")
         
         location = "".join(shift_info_str.split()[-1]).strip().replace(".","")
         shift_type = SHIFT_TYPES[0]
@@ -102,8 +166,8 @@ def get_time_range_from_shift_info(shift_info_str):
     elif shift_identifier.lower() == "shift":
         start_end_date_str = "".join(shift_info_str.split()[-3])
         
-        start_date = datetime.datetime.strptime(start_end_date_str.strip(), "%m/%d")
-        end_date = datetime.datetime.strptime(start_end_date_str.strip(), "%m/%d")
+        start_date = cached_strptime(start_end_date_str.strip(), "%m/%d")
+        end_date = cached_strptime(start_end_date_str.strip(), "%m/%d")
 
         location = "".join(shift_info_str.split()[-1]).strip().replace(".","")
         shift_type = SHIFT_TYPES[1]
@@ -167,3 +231,116 @@ def get_shift_status_from_email(ITS_email):
     '''provided an email, get the status of the shift
     '''
     return "".join(ITS_email.split('\n')[2].split()[:2]).replace(" ","")
+
+
+#Single pass ITS email parser, precompiled regex and lookup tables instead of strptime
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+ITS_Shift = namedtuple("ITS_Shift", ["user", "status", "type", "actions", "start_date", "end_date", "weekday", "weekday_name", "start_time", "end_time"])
+
+ITS_EMAIL_SHIFT_LINE = re.compile(r"^(Temp|Perm)(Take|Drop)-([A-Za-z]+),(\d{1,2}/\d{1,2})(?:-(\d{1,2}/\d{1,2}))?-(\d{1,2}:\d{2}[AaPp][Mm])-(\d{1,2}:\d{2}[AaPp][Mm])$")
+
+def build_weekday_lookup():
+    '''
+    return a dict of lowercase weekday name, full or abbreviated ("Mon", "Thu"),
+    to the strptime("%A") datetime and the full name of the weekday
+    '''
+    lookup = {}
+    for name in DAY_NAMES:
+        weekday = (datetime.datetime.strptime(name, "%A"), name)
+        lookup[name.lower()] = weekday
+        lookup[name[:3].lower()] = weekday
+    return lookup
+
+def build_time_lookup():
+    '''return a dict of every "h:mmAM/PM" (and "hh:mmAM/PM") string to its strptime datetime
+    '''
+    lookup = {}
+    for hour in range(24):
+        for minute in range(60):
+            time = datetime.datetime(1900, 1, 1, hour, minute)
+            meridiem = "AM" if hour < 12 else "PM"
+            lookup["%d:%02d%s" % (hour % 12 or 12, minute, meridiem)] = time
+            lookup["%02d:%02d%s" % (hour % 12 or 12, minute, meridiem)] = time
+    return lookup
+
+def build_date_lookup():
+    '''return a dict of every "m/d" string (padded or not) to its strptime("%m/%d") datetime
+    '''
+    lookup = {}
+    date = datetime.datetime(1900, 1, 1)
+    while date.year == 1900:
+        for date_format in ["%d/%d", "%02d/%d", "%d/%02d", "%02d/%02d"]:
+            lookup[date_format % (date.month, date.day)] = date
+        date += datetime.timedelta(1)
+    return lookup
+
+WEEKDAY_LOOKUP = build_weekday_lookup()
+TIME_LOOKUP = build_time_lookup()
+DATE_LOOKUP = build_date_lookup()
+
+def parse_ITS_email(ITS_email):
+    '''
+    provided an str email, return an ITS_Shift in a single pass. Gives the same
+    values as get_person_from_email and get_time_range_from_email on every
+    email those parse, and also takes abbreviated weekday names, which
+    strptime("%A") does not. Raises ParseException on anything it cannot parse
+    '''
+    lines = ITS_email.split("\n", 3)
+    if len(lines) < 3:
+        raise ParseException("Unable to parse email:\n%s" % (ITS_email))
+
+    match = ITS_EMAIL_SHIFT_LINE.match(lines[2].replace(" ", "").rstrip())
+    if match is None:
+        raise ParseException("Unable to parse email:\n%s" % (ITS_email))
+
+    kind, action, day_str, start_date_str, end_date_str, start_time_str, end_time_str = match.groups()
+    if (kind == "Perm") != (end_date_str is not None):
+        raise ParseException("Unable to parse email:\n%s" % (ITS_email))
+
+    try:
+        weekday, weekday_name = WEEKDAY_LOOKUP[day_str.lower()]
+        start_date = DATE_LOOKUP[start_date_str]
+        end_date = DATE_LOOKUP[end_date_str or start_date_str]
+        start_time = TIME_LOOKUP[start_time_str.upper()]
+        end_time = TIME_LOOKUP[end_time_str.upper()]
+    except KeyError:
+        raise ParseException("Unable to parse email:\n%s" % (ITS_email))
+
+    status = kind + action
+    if action == "Drop":
+        actions = ["TempTake"] if kind == "Temp" else ["PermTake"]
+    else:
+        actions = []
+
+    user = lines[0].split()[3:]
+
+    return ITS_Shift(user, status, SHIFT_TYPES[0], actions, start_date, end_date, weekday, weekday_name, start_time, end_time)
+
+def benchmark_email_parsers(number=10000):
+    '''run both email parsers over sample temp and perm emails, return emails parsed per second
+    '''
+    sample_emails = [
+        "Shift dropped by Adam Mrowca\r\n\r\nTemp Drop - Monday, 10/3 - 2:00PM - 3:00PM\r\nVisit PunchCard\r\n",
+        "Shift dropped by Adam Mrowca\r\n\r\nPerm Drop - Thursday, 9/1-12/8 - 10:00AM-12:30PM\r\nVisit PunchCard\r\n"
+    ]
+
+    def parse_split():
+        for ITS_email in sample_emails:
+            get_person_from_email(ITS_email)
+            get_time_range_from_email(ITS_email)
+
+    def parse_single_pass():
+        for ITS_email in sample_emails:
+            parse_ITS_email(ITS_email)
+
+    results = {}
+    for name, parse in [("split", parse_split), ("single_pass", parse_single_pass)]:
+        seconds = min(timeit.repeat(parse, number=number, repeat=3))
+        results[name] = number * len(sample_emails) / seconds
+    return results
+
+
+if __name__ == "__main__":
+    for name, emails_per_second in sorted(benchmark_email_parsers().items()):
+        print "%s: %d emails/second" % (name, emails_per_second)
@@ -1,12 +1,15 @@
 from os.path import abspath, dirname, realpath, join
+import os
 import json
+import time
 import datetime
+import tempfile
 import logging
 import logging.config
-from copy import deepcopy
 
 from ..constants import *
 from ..coracle_exceptions import ParseException
+from settings_model import Settings, Date_Preference, Weekday_Preference, Hour_Preference, weekday_numbers
 
 current_filepath = dirname(realpath(__file__))
 
@@ -24,6 +27,7 @@ class File_Parser(object):
     def __init__(self, filepath=None, advanced_logging=False):
         self.filepath = None
         self.input_dict = None
+        self.source = None
 
         self.parser_logger = logging.getLogger("parser")
         self.simple_logger = logging.getLogger("simple_log")
@@ -34,14 +38,20 @@ class File_Parser(object):
             self.parser_logger.handlers = [h for h in self.parser_logger.handlers if type(h) != logging.StreamHandler]
         if filepath != None:self.load(filepath) 
 
+    @staticmethod
+    def read_file(filepath):
+        '''Provided a string filepath, return the text of the file in ../settings/
+        '''
+        with open(join(current_filepath, filepath)) as json_file:
+            return json_file.read()
+
     @staticmethod
     def json_to_dict(filepath):
         '''
         Provided a string filepath, return a dictionary object from a json
         file in ../settings/
         '''
-        with open(join(current_filepath, filepath)) as json_file:
-            return json.load(json_file)
+        return json.loads(File_Parser.read_file(filepath))
         
     def get_dict(self):
         '''check if the dict has been loaded, if it has, then return the dict
@@ -76,7 +86,8 @@ class File_Parser(object):
             self.filepath = filepath
 
         self.parser_logger.info("Converting %s to dict" % (filepath))
-        self.input_dict = File_Parser.json_to_dict(self.filepath)
+        self.source = File_Parser.read_file(self.filepath)
+        self.input_dict = json.loads(self.source)
         self.parser_logger.info("Data conversion loading of %s is successful" % (self.filepath))
         return self
 
@@ -147,21 +158,71 @@ class Settings_Parser(File_Parser):
     '''
     settings_parse will parse a "settings.json" file for important
     paramaters needed to run coracle
+
+    Validating compiles the file into an immutable Settings (get_settings()).
+    Validating a file again is nearly free while its text is unchanged
     '''
+    def __init__(self, filepath=None, advanced_logging=False):
+        self.settings = None
+        self.validated_source = None
+        self.validated_dict = None
+        self.hour_ranges = {}
+        super(Settings_Parser, self).__init__(filepath, advanced_logging)
+
+    def get_settings(self):
+        '''check the settings have been validated, if they have, then return the compiled Settings
+        '''
+        if self.settings is None:
+            self.parser_logger.error("No settings have been validated in %s" % (self.__class__))
+            raise ParseException("No settings have been validated")
+        return self.settings
+
     def validate(self, filepath=PATH_TO_DEFAULT_SETTINGS_FILE):
         '''
         Given a filepath in the init of the class, parse the correct info
-        from the file and create an authenticated "settings" dict
+        from the file and create an authenticated "settings" dict, compiled
+        into a Settings. If the file is the same as when it was last
+        validated, its Settings are kept
         '''
         self.load(filepath)
 
+        if self.settings is not None and self.source == self.validated_source:
+            self.parser_logger.info("%s unchanged since it was validated, keeping its settings" % (self.filepath))
+            self.input_dict = self.validated_dict
+            return self.get_dict()
+
         self.parser_logger.info("Validating %s in %s" % (self.filepath, self.__class__))
 
         self.is_valid_active()
         self.is_valid_logging()
         self.is_valid_notification_email()
         self.is_valid_refresh()
-        self.is_valid_dates()
+        self.is_valid_idle()
+        self.is_valid_fetch_batch_size()
+        self.is_valid_its_engine()
+        self.is_valid_phantomjs_profile()
+        self.is_valid_its_sessions()
+        self.is_valid_watch_schedule()
+        self.is_valid_pre_arm()
+        dates = self.is_valid_dates()
+
+        settings_dict = self.get_dict()
+        self.settings = Settings(
+            active=settings_dict["active"],
+            advanced_logging=settings_dict.get("advanced_logging", False),
+            notification_email=settings_dict["notification_email"],
+            refresh=settings_dict["refresh"],
+            idle=settings_dict["idle"],
+            fetch_batch_size=settings_dict["fetch_batch_size"],
+            its_engine=settings_dict["its_engine"],
+            phantomjs_profile=settings_dict["phantomjs_profile"],
+            its_sessions=settings_dict["its_sessions"],
+            watch_schedule=settings_dict["watch_schedule"],
+            pre_arm=settings_dict["pre_arm"],
+            dates=dates
+        )
+        self.validated_source = self.source
+        self.validated_dict = settings_dict
 
         self.parser_logger.info("%s successfully validated in %s, no errors" % (self.filepath, self.__class__))
         self.simple_logger.info("SUCCESSFUL SETTINGS FORMAT")
@@ -237,6 +298,133 @@ class Settings_Parser(File_Parser):
             self.parser_logger.error("Missing paramater 'refresh' in %s" % (self.filepath))
             raise ParseException("No 'refresh' paramater set in %s" % (self.filepath))
 
+    def is_valid_idle(self):
+        '''provided a settings_dict, make sure "idle" is set properly
+        '''
+        self.check_loaded()
+
+        self.parser_logger.info("Validating 'idle' in %s" % (self.filepath))
+        try:
+            idle = self.get_dict()["idle"]
+
+            if not isinstance(idle, bool):
+                self.parser_logger.error("Invalid type %s for 'idle'" % (type(idle)))
+                raise TypeError("'idle' needs to be a bool in %s" % (self.filepath))
+        except KeyError, e:
+            self.parser_logger.warning("'idle' paramater not set, defaulting to polling")
+            self.get_dict()["idle"] = False
+
+    def is_valid_fetch_batch_size(self):
+        '''provided a settings_dict, make sure "fetch_batch_size" is set properly
+        '''
+        self.check_loaded()
+
+        self.parser_logger.info("Validating 'fetch_batch_size' in %s" % (self.filepath))
+        try:
+            fetch_batch_size = self.get_dict()["fetch_batch_size"]
+
+            if not isinstance(fetch_batch_size, int):
+                self.parser_logger.error("Invalid type %s for 'fetch_batch_size'" % (type(fetch_batch_size)))
+                raise TypeError("'fetch_batch_size' needs to be an integer in %s" % (self.filepath))
+            if fetch_batch_size < 1:
+                self.parser_logger.error("%s not within range for 'fetch_batch_size'" % (fetch_batch_size))
+                raise ValueError("'fetch_batch_size' is not within bounds 0 < x < infinity in %s" % (self.filepath))
+        except KeyError, e:
+            self.parser_logger.warning("'fetch_batch_size' paramater not set, defaulting to %d" % (ITS_EMAIL_FETCH_BATCH_SIZE))
+            self.get_dict()["fetch_batch_size"] = ITS_EMAIL_FETCH_BATCH_SIZE
+
+    def is_valid_its_engine(self):
+        '''provided a settings_dict, make sure "its_engine" is set properly
+        '''
+        self.check_loaded()
+
+        self.parser_logger.info("Validating 'its_engine' in %s" % (self.filepath))
+        try:
+            its_engine = self.get_dict()["its_engine"]
+
+            if not isinstance(its_engine, basestring):
+                self.parser_logger.error("Invalid type %s for 'its_engine'" % (type(its_engine)))
+                raise TypeError("'its_engine' needs to be a string in %s" % (self.filepath))
+            if its_engine not in ITS_ENGINES:
+                self.parser_logger.error("Unknown 'its_engine' %s" % (its_engine))
+                raise ValueError("'its_engine' needs to be one of %s in %s" % (", ".join(ITS_ENGINES), self.filepath))
+        except KeyError, e:
+            self.parser_logger.warning("'its_engine' paramater not set, defaulting to %s" % (ITS_ENGINES[0]))
+            self.get_dict()["its_engine"] = ITS_ENGINES[0]
+
+    def is_valid_phantomjs_profile(self):
+        '''provided a settings_dict, make sure "phantomjs_profile" is set properly
+        '''
+        self.check_loaded()
+
+        self.parser_logger.info("Validating 'phantomjs_profile' in %s" % (self.filepath))
+        try:
+            phantomjs_profile = self.get_dict()["phantomjs_profile"]
+
+            if not isinstance(phantomjs_profile, basestring):
+                self.parser_logger.error("Invalid type %s for 'phantomjs_profile'" % (type(phantomjs_profile)))
+                raise TypeError("'phantomjs_profile' needs to be a string in %s" % (self.filepath))
+            if phantomjs_profile not in PHANTOMJS_PROFILES:
+                self.parser_logger.error("Unknown 'phantomjs_profile' %s" % (phantomjs_profile))
+                raise ValueError("'phantomjs_profile' needs to be one of %s in %s" % (", ".join(PHANTOMJS_PROFILES), self.filepath))
+        except KeyError, e:
+            self.parser_logger.warning("'phantomjs_profile' paramater not set, defaulting to %s" % (PHANTOMJS_PROFILES[0]))
+            self.get_dict()["phantomjs_profile"] = PHANTOMJS_PROFILES[0]
+
+    def is_valid_its_sessions(self):
+        '''provided a settings_dict, make sure "its_sessions" is set properly
+        '''
+        self.check_loaded()
+
+        self.parser_logger.info("Validating 'its_sessions' in %s" % (self.filepath))
+        try:
+            its_sessions = self.get_dict()["its_sessions"]
+
+            if not isinstance(its_sessions, int):
+                self.parser_logger.error("Invalid type %s for 'its_sessions'" % (type(its_sessions)))
+                raise TypeError("'its_sessions' needs to be an integer in %s" % (self.filepath))
+            if its_sessions < 1:
+                self.parser_logger.error("%s not within range for 'its_sessions'" % (its_sessions))
+                raise ValueError("'its_sessions' is not within bounds 0 < x < infinity in %s" % (self.filepath))
+        except KeyError, e:
+            self.parser_logger.warning("'its_sessions' paramater not set, defaulting to %d" % (ITS_POOL_SIZE))
+            self.get_dict()["its_sessions"] = ITS_POOL_SIZE
+
+    def is_valid_watch_schedule(self):
+        '''provided a settings_dict, make sure "watch_schedule" is set properly
+        '''
+        self.check_loaded()
+
+        self.parser_logger.info("Validating 'watch_schedule' in %s" % (self.filepath))
+        try:
+            watch_schedule = self.get_dict()["watch_schedule"]
+
+            if not isinstance(watch_schedule, bool):
+                self.parser_logger.error("Invalid type %s for 'watch_schedule'" % (type(watch_schedule)))
+                raise TypeError("'watch_schedule' needs to be a bool in %s" % (self.filepath))
+        except KeyError, e:
+            self.parser_logger.warning("'watch_schedule' paramater not set, defaulting to email only")
+            self.get_dict()["watch_schedule"] = False
+
+    def is_valid_pre_arm(self):
+        '''provided a settings_dict, make sure "pre_arm" is set properly
+        '''
+        self.check_loaded()
+
+        self.parser_logger.info("Validating 'pre_arm' in %s" % (self.filepath))
+        try:
+            pre_arm = self.get_dict()["pre_arm"]
+
+            if not isinstance(pre_arm, int):
+                self.parser_logger.error("Invalid type %s for 'pre_arm'" % (type(pre_arm)))
+                raise TypeError("'pre_arm' needs to be an integer in %s" % (self.filepath))
+            if pre_arm < 0:
+                self.parser_logger.error("%s not within range for 'pre_arm'" % (pre_arm))
+                raise ValueError("'pre_arm' is not within bounds 0 <= x < infinity in %s" % (self.filepath))
+        except KeyError, e:
+            self.parser_logger.warning("'pre_arm' paramater not set, defaulting to %d" % (PRE_ARM_TARGETS))
+            self.get_dict()["pre_arm"] = PRE_ARM_TARGETS
+
     def is_valid_date_range(self, date_range):
         '''Provided a date_range, be sure the date_range is valid with datetime, or is "all"
         '''
@@ -256,6 +444,8 @@ class Settings_Parser(File_Parser):
         '''provided an hour_range, check to see if it is correctly formatted
         '''
         self.parser_logger.info("------Validating hour_range")
+        if hour_range in self.hour_ranges:
+            return self.hour_ranges[hour_range]
         try:
             if hour_range == "all":
                 return []
@@ -264,11 +454,12 @@ class Settings_Parser(File_Parser):
             t2 = datetime.datetime.strptime(time2, "%H:%M%p")
         except ValueError:
             self.parser_logger.error("Invalid format")
-            raise ValueError("hour_range %s is malformed, must be in hh:mmAM/PM format" % (date_range))
-        return [t1, t2]
+            raise ValueError("hour_range %s is malformed, must be in hh:mmAM/PM format" % (hour_range))
+        self.hour_ranges[hour_range] = (t1, t2)
+        return self.hour_ranges[hour_range]
 
-    def is_valid_weekday(self, weekday):
-        '''provided a weekday, be sure location, and hours are valid
+    def is_valid_weekday(self, weekday_key, weekday):
+        '''provided a weekday key and weekday, be sure location, and hours are valid and return its Weekday_Preference
         '''
         self.parser_logger.info("----Validating locations")
         try:
@@ -279,25 +470,24 @@ class Settings_Parser(File_Parser):
                 raise TypeError("'locations' must be a in 'list' format in %s" % (self.filepath))
             if locations == []:
                 self.parser_logger.warning("No 'locations' provided, default any location")
-                weekday["locations"] = LOCATIONS[:]
+                locations = LOCATIONS[:]
             if len(set(locations).difference(set(LOCATIONS))) > 0:
                 self.parser_logger.error("Invalid location(s) %s" % (set(locations).difference(set(LOCATIONS))))
                 raise ParseException("One or more locations in %s are invalid" % (locations))
         except KeyError:
             self.parser_logger.warning("No 'locations' provided, default any location")
-            weekday["locations"] = LOCATIONS[:]
+            locations = LOCATIONS[:]
 
         self.parser_logger.info("----Validating hours")
         try:
             hours = weekday["hours"]
-            new_hours = deepcopy(hours)
+            compiled_hours = []
 
             if not isinstance(hours, dict):
                 self.parser_logger.error("Invalid type %s for 'hours'" % (type(hours)))
                 raise TypeError("'hours' must be a in 'dict' format in %s" % (self.filepath))
             for hour_key, actions in hours.iteritems():
                 hour_range = self.is_valid_hour_range(hour_key)
-                new_hours[hour_key+"_range"] = hour_range
                 self.parser_logger.info("------Validating actions")
                 if not isinstance(actions, list):
                     self.parser_logger.error("Invalid type %s for 'actions'" % (type(actions)))
@@ -305,30 +495,34 @@ class Settings_Parser(File_Parser):
                 if len(set(actions).difference(set(SHIFT_ACTIONS))) > 0:
                     self.parser_logger.error("Invalid action(s) %s for 'actions'" % (str(actions)))
                     raise ParseException("One or more acitons in %s are invalid" % (actions))
-            return new_hours
+                compiled_hours.append(Hour_Preference.compile(hour_key, hour_range, actions))
         except KeyError:
             self.parser_logger.error("Missing paramater 'hours' in %s" % (self.filepath))
             raise ParseException("'hours' argument is missing from %s" % (self.filepath))
 
+        return Weekday_Preference(key=weekday_key, weekdays=weekday_numbers(weekday_key), locations=tuple(locations), hours=tuple(compiled_hours))
+
     def is_valid_dates(self):
-        '''provided settings dict, make sure each date is well formatted 
+        '''provided settings dict, make sure each date is well formatted and return their Date_Preferences
         '''
         self.check_loaded()
 
         self.parser_logger.info("Validating dates")
         try:
             dates = self.get_dict()["dates"]
-            new_dates = deepcopy(dates)
+            compiled_dates = []
             for date_key, date in dates.iteritems():
-                new_dates[date_key]["range"] = self.is_valid_date_range(date_key)
+                date_range = self.is_valid_date_range(date_key)
+                weekdays = []
                 for weekday_key, weekday in date.iteritems():
                     self.parser_logger.info("--Validating Weekday")
                     weekday_key = str(weekday_key)
                     if weekday_key not in WEEKDAYS and weekday_key not in WEEKDAYS_INITIALS and weekday_key != "all":
                         self.parser_logger.error("Invalid weekday %s" % (weekday_key))
                         raise ParseException("weekday %s is not valid" % (weekday_key))
-                    new_dates[date_key][weekday_key] = self.is_valid_weekday(weekday)
-            self.input_dict["dates"] = new_dates
+                    weekdays.append(self.is_valid_weekday(weekday_key, weekday))
+                compiled_dates.append(Date_Preference.compile(date_key, date_range, weekdays))
+            return tuple(compiled_dates)
         except KeyError, e:
             self.parser_logger.error("Missing paramater 'dates' in %s" % (self.filepath))
             raise ParseException("No 'dates' paramater set in " + self.filepath)
@@ -356,3 +550,42 @@ class Init_Parser(File_Parser):
             self.get_dict()["advanced_logging"] = False
 
         return self.get_dict()["advanced_logging"]
+
+
+def benchmark_settings_parser(date_ranges=200, hours=12, number=3):
+    '''
+    Write a settings file with 'date_ranges' date ranges, each with every
+    weekday key holding 'hours' hour ranges, then time validating it, and
+    validating it again unchanged. Return {name: seconds per validation}
+    '''
+    dates = {}
+    for offset in range(date_ranges):
+        start = datetime.date(2016, 1, 1) + datetime.timedelta(offset * 7)
+        end = start + datetime.timedelta(6)
+        date_key = "%s-%s" % (start.strftime("%m/%d/%y"), end.strftime("%m/%d/%y"))
+        weekday_hours = dict(("%d:00AM-%d:30AM" % (hour, hour), [SHIFT_ACTIONS[hour % len(SHIFT_ACTIONS)]]) for hour in range(1, hours + 1))
+        dates[date_key] = dict((weekday_key, {"locations":LOCATIONS[:1 + offset % len(LOCATIONS)], "hours":weekday_hours}) for weekday_key in ["all"] + WEEKDAYS + WEEKDAYS_INITIALS)
+
+    settings_file, settings_filepath = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(settings_file, "w") as json_file:
+            json.dump({"active":3600, "advanced_logging":False, "refresh":2, "dates":dates}, json_file)
+
+        results = {"validate":0.0, "revalidate":0.0}
+        for run in range(number):
+            parser = Settings_Parser(settings_filepath)
+            started = time.time()
+            parser.validate(settings_filepath)
+            results["validate"] += (time.time() - started) / number
+
+            started = time.time()
+            parser.validate(settings_filepath)
+            results["revalidate"] += (time.time() - started) / number
+        return results
+    finally:
+        os.remove(settings_filepath)
+
+
+if __name__ == "__main__":
+    for name, seconds in sorted(benchmark_settings_parser().items()):
+        print "%s: %.4f seconds" % (name, seconds)
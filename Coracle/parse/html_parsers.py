@@ -0,0 +1,218 @@
+import re
+from HTMLParser import HTMLParser, HTMLParseError
+from htmlentitydefs import name2codepoint
+
+from ..coracle_exceptions import ParseException
+
+VOID_TAGS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "wbr"])
+BLOCK_TAGS = frozenset(["address", "blockquote", "center", "div", "dl", "dt", "dd", "fieldset", "form", "h1", "h2", "h3", "h4",
+                        "h5", "h6", "hr", "li", "ol", "option", "p", "pre", "section", "table", "tbody", "thead", "tfoot", "tr", "ul"])
+HIDDEN_TAGS = frozenset(["script", "style", "head", "title"])
+
+#tags closed by the start of another tag (html lets you leave them open)
+IMPLIED_END_TAGS = {
+    "p":frozenset(["p", "div", "table", "ul", "ol", "form", "h1", "h2", "h3", "h4", "h5", "h6"]),
+    "li":frozenset(["li"]),
+    "option":frozenset(["option", "optgroup"]),
+    "td":frozenset(["td", "th", "tr"]),
+    "th":frozenset(["td", "th", "tr"]),
+    "tr":frozenset(["tr"]),
+}
+
+WHITESPACE = re.compile(r"\s+")
+
+class Element(object):
+    '''
+    A parsed html element. Only what ITShttpdriver needs from a browser DOM:
+    lookups by tag, id and class, attributes, and rendered text.
+    '''
+
+    def __init__(self, tag, attrs=(), parent=None):
+        self.tag = tag
+        self.attrs = dict((name, value if value is not None else "") for name, value in attrs)
+        self.parent = parent
+        self.children = []
+
+    def __repr__(self):
+        return "<%s %s>" % (self.tag, " ".join('%s="%s"' % item for item in sorted(self.attrs.items())))
+
+    def get(self, attr, default=None):
+        '''Provided an attribute name, return its value or default
+        '''
+        return self.attrs.get(attr, default)
+
+    @property
+    def classes(self):
+        return self.get("class", "").split()
+
+    def iter(self):
+        '''yield every descendant element in document order
+        '''
+        for child in self.children:
+            if isinstance(child, Element):
+                yield child
+                for descendant in child.iter():
+                    yield descendant
+
+    def find_all(self, tag=None, id=None, class_name=None):
+        '''Provided a tag, id and/or class, return every matching descendant
+        '''
+        return [element for element in self.iter()
+                if (tag is None or element.tag == tag)
+                and (id is None or element.get("id") == id)
+                and (class_name is None or class_name in element.classes)]
+
+    def find(self, tag=None, id=None, class_name=None):
+        '''Provided a tag, id and/or class, return the first matching descendant or None
+        '''
+        for element in self.find_all(tag, id, class_name):
+            return element
+        return None
+
+    def children_by_tag(self, tag):
+        '''Provided a tag, return the direct children with that tag
+        '''
+        return [child for child in self.children if isinstance(child, Element) and child.tag == tag]
+
+    def ancestor(self, tag):
+        '''Provided a tag, return the closest enclosing element with that tag or None
+        '''
+        parent = self.parent
+        while parent is not None and parent.tag != tag:
+            parent = parent.parent
+        return parent
+
+    def render(self, pieces, skip):
+        '''Provided a list, append the text pieces of this element to it
+        '''
+        for child in self.children:
+            if not isinstance(child, Element):
+                pieces.append(WHITESPACE.sub(" ", child))
+            elif child.tag == "br":
+                pieces.append("\n")
+            elif child.tag not in HIDDEN_TAGS and child.tag not in skip:
+                block = child.tag in BLOCK_TAGS
+                if block:
+                    pieces.append("\n")
+                child.render(pieces, skip)
+                if block:
+                    pieces.append("\n")
+
+    def get_text(self, skip=()):
+        '''
+        return the text as a browser shows it, one line per block element or
+        <br>, skipping the content of any tag in skip
+        '''
+        pieces = []
+        self.render(pieces, frozenset(skip))
+        lines = [line.strip() for line in "".join(pieces).split("\n")]
+        return "\n".join(line for line in lines if line)
+
+    @property
+    def text(self):
+        return self.get_text()
+
+class Tree_Builder(HTMLParser):
+    '''
+    HTMLParser that builds a tree of Elements, closing the tags html allows to
+    be left open and ignoring end tags that close nothing
+    '''
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.root = Element("document")
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        while self.stack[-1].tag in IMPLIED_END_TAGS and tag in IMPLIED_END_TAGS[self.stack[-1].tag]:
+            self.stack.pop()
+
+        element = Element(tag, attrs, self.stack[-1])
+        self.stack[-1].children.append(element)
+        if tag not in VOID_TAGS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        for index in range(len(self.stack)-1, 0, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+    def handle_entityref(self, name):
+        if name in name2codepoint:
+            self.handle_data(unichr(name2codepoint[name]))
+        else:
+            self.handle_data("&%s;" % (name))
+
+    def handle_charref(self, name):
+        try:
+            if name.lower().startswith("x"):
+                self.handle_data(unichr(int(name[1:], 16)))
+            else:
+                self.handle_data(unichr(int(name)))
+        except ValueError:
+            self.handle_data("&#%s;" % (name))
+
+def parse_html(html):
+    '''Provided an html string, return the root Element of its tree
+    '''
+    builder = Tree_Builder()
+    try:
+        builder.feed(html)
+        builder.close()
+    except HTMLParseError, e:
+        raise ParseException("Unable to parse html: %s" % (e))
+    return builder.root
+
+def get_option_value(option):
+    '''Provided an option element, return the value a browser submits for it
+    '''
+    return option.get("value", option.text)
+
+def get_form_fields(form):
+    '''
+    Provided a form element, return the (name, value) pairs a browser would
+    submit for it without any button pressed
+    '''
+    fields = []
+    for element in form.iter():
+        name = element.get("name")
+        if not name or "disabled" in element.attrs:
+            continue
+
+        if element.tag == "input":
+            input_type = element.get("type", "text").lower()
+            if input_type in ("submit", "button", "image", "reset", "file"):
+                continue
+            if input_type in ("checkbox", "radio") and "checked" not in element.attrs:
+                continue
+            fields.append((name, element.get("value", "on" if input_type in ("checkbox", "radio") else "")))
+        elif element.tag == "select":
+            options = element.find_all("option")
+            selected = [option for option in options if "selected" in option.attrs] or options[:1]
+            for option in selected:
+                fields.append((name, get_option_value(option)))
+        elif element.tag == "textarea":
+            fields.append((name, element.text))
+    return fields
+
+def set_form_field(fields, name, value):
+    '''Provided form fields, a name and a value, return the fields with name set to value
+    '''
+    new_fields = []
+    for field_name, field_value in fields:
+        if field_name != name:
+            new_fields.append((field_name, field_value))
+        elif (name, value) not in new_fields:
+            new_fields.append((name, value))
+    if (name, value) not in new_fields:
+        new_fields.append((name, value))
+    return new_fields
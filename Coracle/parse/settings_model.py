@@ -0,0 +1,91 @@
+import datetime
+
+from ..constants import *
+
+MINUTES_IN_DAY = 24 * 60
+
+def weekday_numbers(weekday_key):
+    '''Provided a validated settings weekday key, return the weekday numbers it covers (0 is Monday)
+    '''
+    if weekday_key == "all":
+        return tuple(range(7))
+    if weekday_key in WEEKDAYS:
+        return (WEEKDAYS.index(weekday_key),)
+    return (WEEKDAYS_INITIALS.index(weekday_key),)
+
+class Frozen(object):
+    '''
+    Base of the compiled settings classes. Fields are the class' __slots__,
+    all given to __init__ and never changed afterwards
+    '''
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable" % (self.__class__.__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is immutable" % (self.__class__.__name__))
+
+    def __eq__(self, other):
+        return type(self) == type(other) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, " ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__))
+
+class Hour_Preference(Frozen):
+    '''
+    One "hours" entry of a weekday: its key, the times it spans (None for
+    "all"), those times as minutes since midnight, and the actions wanted
+    '''
+    __slots__ = ("key", "start", "end", "start_minute", "end_minute", "actions")
+
+    @classmethod
+    def compile(cls, key, hour_range, actions):
+        '''Provided an hours key, its validated hour_range and actions, return its Hour_Preference
+        '''
+        if hour_range:
+            start, end = hour_range
+            return cls(key=key, start=start, end=end, start_minute=start.hour * 60 + start.minute, end_minute=end.hour * 60 + end.minute, actions=tuple(actions))
+        return cls(key=key, start=None, end=None, start_minute=0, end_minute=MINUTES_IN_DAY - 1, actions=tuple(actions))
+
+class Weekday_Preference(Frozen):
+    '''
+    One weekday entry of a date range: its key, the weekday numbers it
+    covers, the locations wanted and its Hour_Preferences
+    '''
+    __slots__ = ("key", "weekdays", "locations", "hours")
+
+class Date_Preference(Frozen):
+    '''
+    One "dates" entry: its key, the dates it spans (None for "all"), those
+    dates as ordinals, and its Weekday_Preferences
+    '''
+    __slots__ = ("key", "start", "end", "start_ordinal", "end_ordinal", "weekdays")
+
+    @classmethod
+    def compile(cls, key, date_range, weekdays):
+        '''Provided a dates key, its validated date_range and Weekday_Preferences, return its Date_Preference
+        '''
+        if date_range:
+            start, end = date_range
+            return cls(key=key, start=start, end=end, start_ordinal=start.toordinal(), end_ordinal=end.toordinal(), weekdays=tuple(weekdays))
+        return cls(key=key, start=None, end=None, start_ordinal=datetime.date.min.toordinal(), end_ordinal=datetime.date.max.toordinal(), weekdays=tuple(weekdays))
+
+class Settings(Frozen):
+    '''
+    Validated settings.json, compiled once by Settings_Parser.validate().
+    Every optional setting holds its value or its default, and dates holds
+    a Date_Preference per date range
+    '''
+    __slots__ = ("active", "advanced_logging", "notification_email", "refresh", "idle", "fetch_batch_size",
+                 "its_engine", "phantomjs_profile", "its_sessions", "watch_schedule", "pre_arm", "dates")
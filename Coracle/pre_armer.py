@@ -0,0 +1,157 @@
+import sys
+import time
+import datetime
+import threading
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+from schedule_snapshot import Schedule_Snapshot_Cache
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+ARM_PRIORITY = (sys.float_info.max,) #after every armed grab, before the pool stops
+
+class Pre_Armer(object):
+    '''
+    Pre_Armer keeps one dedicated ITS session armed for the 'targets' best
+    ranked preferences. The nearest upcoming day (within 'days') one of them
+    covers is armed ahead of time: its schedule is loaded, its url kept and
+    its blocks located. The day is re-armed every 'interval' seconds, which
+    also keeps the session logged in, so the pre-armer adds one page load per
+    interval to the ITS load.
+
+    A matching shift on the armed day skips the login checks, calendar
+    navigation and grid scan of a usual grab. The armed session selects the
+    action on the located block and confirms, reloading the day's url only
+    when the armed page is older than the shift. The latency from the trigger
+    (the shift being read) to the confirm is logged for every attempt.
+    '''
+
+    def __init__(self, pool, matcher, targets, days=PRE_ARM_DAYS, interval=PRE_ARM_INTERVAL):
+        self.pool = pool
+        self.matcher = matcher
+        self.days = days
+        self.interval = interval
+
+        self.ranks = set(rule.rank for rule in matcher.rules[:targets])
+        self.armed_date = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.worker = None
+
+        self.arms = 0
+        self.attempts = 0
+        self.grabbed = 0
+        self.latencies = []
+
+        self.coracle_logger = logging.getLogger("Coracle")
+
+    def target_day(self, today=None):
+        '''return the nearest day from today on, within the horizon, that a target preference covers, None if there is none
+        '''
+        today = today or datetime.datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(self.days):
+            day = today + datetime.timedelta(days=offset)
+            if self.matcher.ranks_on_day(day) & self.ranks:
+                return day
+        return None
+
+    @staticmethod
+    def arm_day(ITSdr, day):
+        '''Provided an ITS session and a day, arm the session for that day
+        '''
+        return ITSdr.arm(day) is not None
+
+    def arm(self):
+        '''arm the target day on the session, behind any armed grab, and return the day armed or None
+        '''
+        day = self.target_day()
+        armed_date = None
+        if day is not None:
+            task = self.pool.submit_priority(ARM_PRIORITY, self.arm_day, day)
+            try:
+                if task.wait():
+                    armed_date = day
+            except Exception, e:
+                self.coracle_logger.warning("Unable to arm %s: %s" % (day.strftime("%d-%b-%Y"), e))
+
+        with self.lock:
+            self.armed_date = armed_date
+            self.arms += 1
+        self.coracle_logger.info("Pre-armed %s" % (armed_date.strftime("%d-%b-%Y") if armed_date else "no day"))
+        return armed_date
+
+    def watch(self):
+        '''re-arm every interval until stopped
+        '''
+        while not self.stopping.is_set():
+            started = time.time()
+            try:
+                self.arm()
+            except Exception, e:
+                self.coracle_logger.error("Pre-arming failed: %s" % (e))
+            self.stopping.wait(max(0, self.interval - (time.time() - started)))
+
+    def is_armed(self, ITS_email, rules):
+        '''Provided an ITS email and the rules it matched, check its best rule is a target and its day is the armed one
+        '''
+        with self.lock:
+            if self.armed_date is None or rules[0].rank not in self.ranks:
+                return False
+            return Schedule_Snapshot_Cache.day(ITS_email["start_date"]) == Schedule_Snapshot_Cache.day(self.armed_date)
+
+    def grab(self, ITSdr, matcher, ITS_email, triggered):
+        '''
+        Provided an armed ITS session, the matcher, an email and when it
+        triggered the grab, attempt its matching actions in order until one is
+        confirmed, logging the trigger to confirm latency of each attempt
+        '''
+        for action, locations in matcher.match(ITS_email):
+            shift = dict(ITS_email, action=action, locations=locations)
+            grabbed = ITSdr.grab_armed_shift(shift)
+            latency = time.time() - triggered
+
+            with self.lock:
+                self.attempts += 1
+                self.grabbed += 1 if grabbed else 0
+                self.latencies.append(latency)
+            self.coracle_logger.info("Pre-armed %s of the shift starting %s %s, %.2f seconds from trigger to confirm" % (action, shift["start_time"].strftime("%I:%M%p"), "confirmed" if grabbed else "not confirmed", latency))
+            if grabbed:
+                return True
+        return False
+
+    def start(self):
+        '''start the pool and arm on a worker of its own
+        '''
+        self.coracle_logger.info("Pre-arming %d preference(s) on the nearest day they cover within %d day(s)" % (len(self.ranks), self.days))
+        self.pool.start()
+        self.worker = threading.Thread(target=self.watch, name="ITS-pre-arm")
+        self.worker.daemon = True
+        self.worker.start()
+
+    def stop(self):
+        '''stop re-arming, then let the pool finish its grabs and stop
+        '''
+        self.stopping.set()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+        self.pool.stop()
+
+    def metrics(self):
+        '''return the day armed, how often it was armed, and the armed grab attempts and their latencies
+        '''
+        with self.lock:
+            return {
+                "armed_day":self.armed_date.strftime("%d-%b-%Y") if self.armed_date else None,
+                "arms":self.arms,
+                "attempts":self.attempts,
+                "grabbed":self.grabbed,
+                "mean_latency":sum(self.latencies) / len(self.latencies) if self.latencies else None,
+                "max_latency":max(self.latencies) if self.latencies else None
+            }
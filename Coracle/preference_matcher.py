@@ -0,0 +1,195 @@
+from bisect import bisect_right
+from collections import namedtuple
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+from parse.ITS_message_parsers import DAY_NAMES
+from schedule_urls import resolve_year
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+Preference_Rule = namedtuple("Preference_Rule", ["rank", "date_key", "weekday_key", "hour_key", "locations", "actions"])
+
+class Interval_Index(object):
+    '''
+    Static stabbing index over closed integer intervals. The number line is cut
+    into elementary segments at every interval boundary, and every segment keeps
+    the set of interval keys covering it, so a point lookup is a single bisect.
+    '''
+
+    def __init__(self, intervals):
+        bounds = set()
+        for low, high, key in intervals:
+            bounds.add(low)
+            bounds.add(high + 1)
+
+        self.bounds = sorted(bounds)
+        self.segments = []
+        for bound in self.bounds:
+            self.segments.append(frozenset(key for low, high, key in intervals if low <= bound <= high))
+
+    def query(self, point):
+        '''Provided an integer point, return the keys of every interval containing it
+        '''
+        index = bisect_right(self.bounds, point) - 1
+        if index < 0:
+            return frozenset()
+        return self.segments[index]
+
+class Preference_Matcher(object):
+    '''
+    Preference_Matcher compiles the Date_Preferences of the validated
+    Settings into interval indexes once, so every shift is matched with a few bisects instead of
+    walking date ranges, weekdays and hours for every email.
+
+    Rules are indexed by weekday (0 is Monday), each weekday keeps its own
+    index of hour intervals, and date ranges share one index.
+    '''
+
+    def __init__(self, dates, today=None):
+        self.today = today
+
+        self.rules = []
+        self.date_index = None
+        self.weekday_indexes = {}
+        self.weekday_ranks = {}
+
+        self.coracle_logger = logging.getLogger("Coracle")
+
+        self.compile(dates)
+
+    @staticmethod
+    def weekday_indexes_from_key(weekday_key):
+        '''Provided a settings weekday key, return the weekday numbers it covers
+        '''
+        if weekday_key == "all":
+            return range(7)
+        if weekday_key in WEEKDAYS:
+            return [WEEKDAYS.index(weekday_key)]
+        if weekday_key in WEEKDAYS_INITIALS:
+            return [WEEKDAYS_INITIALS.index(weekday_key)]
+        return [DAY_NAMES.index(weekday_key.capitalize())]
+
+    @staticmethod
+    def minutes(time):
+        '''Provided a datetime, return the minutes since midnight
+        '''
+        return time.hour * 60 + time.minute
+
+    def ordinal(self, date):
+        '''
+        Provided a datetime, return its ordinal. Dates parsed without a year
+        (ITS emails only say mm/dd) are moved into the year closest to today,
+        like every other part of Coracle does with resolve_year
+        '''
+        return resolve_year(date, self.today).toordinal()
+
+    def shift_weekday(self, shift):
+        '''
+        Provided a shift, return its weekday number, from "weekday_name" when the
+        parser gave one. Weekdays parsed with strptime("%A") carry no real date,
+        so datetimes fall back to start_date
+        '''
+        weekday = shift.get("weekday_name", shift["weekday"])
+        if isinstance(weekday, basestring):
+            return self.weekday_indexes_from_key(weekday)[0]
+
+        return resolve_year(shift["start_date"], self.today).weekday()
+
+    @staticmethod
+    def rank_key(rule_info):
+        '''Specific date ranges, weekdays and hours are tried before "all"
+        '''
+        date_key, weekday_key, hour_key = rule_info[:3]
+        return (date_key == "all", weekday_key == "all", hour_key == "all", date_key, weekday_key, hour_key)
+
+    def compile(self, dates):
+        '''Provided the Date_Preferences of the validated Settings, build the rule list and its indexes
+        '''
+        self.coracle_logger.info("Compiling preference matcher from %d date range(s)" % (len(dates)))
+
+        rule_infos = []
+        for date in dates:
+            for weekday in date.weekdays:
+                for hour in weekday.hours:
+                    rule_infos.append((date.key, weekday.key, hour.key, date, weekday, hour))
+
+        rule_infos.sort(key=self.rank_key)
+
+        date_intervals = []
+        weekday_intervals = dict((weekday_number, []) for weekday_number in range(7))
+        for rank, (date_key, weekday_key, hour_key, date, weekday, hour) in enumerate(rule_infos):
+            self.rules.append(Preference_Rule(rank, date_key, weekday_key, hour_key, list(weekday.locations), list(hour.actions)))
+
+            date_intervals.append((date.start_ordinal, date.end_ordinal, rank))
+            hour_interval = (hour.start_minute, hour.end_minute, rank)
+
+            for weekday_number in weekday.weekdays:
+                weekday_intervals[weekday_number].append(hour_interval)
+                self.weekday_ranks.setdefault(weekday_number, set()).add(rank)
+
+        self.date_index = Interval_Index(date_intervals)
+        self.weekday_indexes = dict((weekday, Interval_Index(intervals)) for weekday, intervals in weekday_intervals.iteritems())
+
+        self.coracle_logger.info("Preference matcher compiled with %d rule(s)" % (len(self.rules)))
+
+    def match_rules(self, shift):
+        '''
+        Provided a shift (email info dict), return every rule whose date range
+        and hours contain the whole shift, best ranked first
+        '''
+        hour_index = self.weekday_indexes[self.shift_weekday(shift)]
+
+        ranks = hour_index.query(self.minutes(shift["start_time"]))
+        if ranks:
+            ranks = ranks & hour_index.query(self.minutes(shift["end_time"]))
+        if ranks:
+            ranks = ranks & self.date_index.query(self.ordinal(shift["start_date"]))
+        if ranks:
+            ranks = ranks & self.date_index.query(self.ordinal(shift["end_date"]))
+
+        return [self.rules[rank] for rank in sorted(ranks)]
+
+    def ranks_on_day(self, date):
+        '''Provided a datetime, return the ranks of the rules whose date range and weekdays include it
+        '''
+        ranks = self.weekday_ranks.get(date.weekday(), set())
+        return ranks & self.date_index.query(self.ordinal(date))
+
+    def covers_day(self, date):
+        '''Provided a datetime, check some rule's date range and weekdays include it
+        '''
+        return bool(self.ranks_on_day(date))
+
+    def match(self, shift):
+        '''
+        Provided a shift, return the ordered list of (action, locations) to
+        attempt. Only actions the shift offers are returned, and an action
+        preferred by several rules is tried once with all of their locations.
+        A shift with a known location (one seen on the schedule) is only
+        attempted there, by the rules allowing it
+        '''
+        offered = shift.get("actions")
+        located = shift.get("location")
+
+        attempts = []
+        attempt_locations = {}
+        for rule in self.match_rules(shift):
+            if located and located not in rule.locations:
+                continue
+            for action in rule.actions:
+                if offered is not None and action not in offered:
+                    continue
+                if action not in attempt_locations:
+                    attempt_locations[action] = []
+                    attempts.append((action, attempt_locations[action]))
+                for location in ([located] if located else rule.locations):
+                    if location not in attempt_locations[action]:
+                        attempt_locations[action].append(location)
+
+        return attempts
@@ -0,0 +1,213 @@
+import time
+import threading
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+from parse.ITS_message_parsers import normeq
+from schedule_urls import resolve_year
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+class Schedule_Block(object):
+    '''
+    One block of a day's schedule grid: its location, position in the
+    location's column, time and date range, and the actions its select offers
+    (none when the shift is taken). element is whatever the driver needs to act
+    on the block later, if anything
+    '''
+
+    def __init__(self, location, position, start_time, end_time, start_date, end_date, actions, element=None):
+        self.location = location
+        self.position = position
+        self.start_time = start_time
+        self.end_time = end_time
+        self.start_date = start_date
+        self.end_date = end_date
+        self.actions = actions
+        self.element = element
+
+    @property
+    def times(self):
+        return self.start_time, self.end_time, self.start_date, self.end_date
+
+    @property
+    def key(self):
+        '''what identifies the block between two snapshots of the same day
+        '''
+        return (self.location,) + self.times
+
+    def covers(self, shift):
+        '''Provided a shift, check the block spans its times and dates
+        '''
+        time_check_start = (self.start_time <= shift["start_time"] <= self.end_time)
+        time_check_end = (self.start_time <= shift["end_time"] <= self.end_time)
+
+        date_check_start = (self.start_date <= shift["start_date"] <= self.end_date)
+        date_check_end = (self.start_date <= shift["end_date"] <= self.end_date)
+
+        return time_check_start and time_check_end and date_check_start and date_check_end
+
+    def find_action(self, action):
+        '''Provided an action, return the option offering it or None
+        '''
+        for option in self.actions:
+            if normeq(option, action):
+                return option
+        return None
+
+    def is_available(self):
+        '''check the block can be taken, a block only offering drops is the user's own shift
+        '''
+        return any(self.find_action(action) is not None for action in SHIFT_ACTIONS_MAP["Take"])
+
+    def __repr__(self):
+        return "<Schedule_Block %s %s-%s %s>" % (self.location, self.start_time.strftime("%I:%M%p"), self.end_time.strftime("%I:%M%p"), self.actions)
+
+class Schedule_Snapshot(object):
+    '''
+    Every block of one day's schedule, parsed once and indexed by location so
+    any number of shifts on that day can be checked without the page. url,
+    page and taken_by (the driver) are where it was taken from, for drivers
+    that can act on it later. parse_seconds is how long reading the grid took
+    '''
+
+    def __init__(self, date, blocks, url=None, page=None, taken_at=None, taken_by=None, parse_seconds=None):
+        self.date = resolve_year(date)
+        self.blocks = blocks
+        self.url = url
+        self.page = page
+        self.taken_by = taken_by
+        self.parse_seconds = parse_seconds
+        self.taken_at = taken_at or time.time()
+        self.expired = False
+
+        self.blocks_by_location = {}
+        for block in blocks:
+            self.blocks_by_location.setdefault(block.location, []).append(block)
+
+    def covering(self, shift):
+        '''Provided a shift, return every block covering it in its locations' order
+        '''
+        return [block for location in shift["locations"] for block in self.blocks_by_location.get(location, []) if block.covers(shift)]
+
+    def offering(self, shift):
+        '''Provided a shift, return the first block covering it that offers its action, None if there is none
+        '''
+        for block in self.covering(shift):
+            if block.find_action(shift["action"]) is not None:
+                return block
+        return None
+
+    def available(self):
+        '''return the blocks that can be taken, not the user's own or a placeholder option
+        '''
+        return [block for block in self.blocks if block.is_available()]
+
+    def diff(self, older):
+        '''Provided an older snapshot of the same day, return the blocks available now that were not then
+        '''
+        was_available = set(block.key for block in older.available())
+        return [block for block in self.available() if block.key not in was_available]
+
+    def is_fresh(self, ttl, not_before=None):
+        '''Provided a ttl and optionally the earliest time it may be from, check the snapshot can still be used
+        '''
+        if self.expired or time.time() - self.taken_at > ttl:
+            return False
+        return not_before is None or self.taken_at >= not_before
+
+class Schedule_Snapshot_Cache(object):
+    '''
+    Keeps the latest Schedule_Snapshot of each day. A snapshot is used for
+    ttl seconds, or until invalidate() after a grab changes the day. Every new
+    snapshot is diffed against the previous one of its day, so shifts freed
+    since then are found without waiting for their email.
+
+    One cache can be shared by every driver of a process, the schedule is the
+    same for every session.
+    '''
+
+    def __init__(self, ttl=ITS_SCHEDULE_SNAPSHOT_TTL):
+        self.ttl = ttl
+        self.snapshots = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.freed = 0
+        self.parsed = 0
+        self.parse_seconds = 0.0
+        self.max_parse_seconds = 0.0
+
+        self.ITSdriver_logger = logging.getLogger("ITSdriver")
+
+    @staticmethod
+    def day(date):
+        date = resolve_year(date)
+        return (date.year, date.month, date.day)
+
+    def get(self, date, not_before=None):
+        '''
+        Provided a date and optionally the earliest time (epoch) the snapshot
+        may be taken at, return the fresh snapshot of that day or None
+        '''
+        with self.lock:
+            snapshot = self.snapshots.get(self.day(date))
+            if snapshot is not None and snapshot.is_fresh(self.ttl, not_before):
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            return None
+
+    def latest(self, date):
+        '''Provided a date, return its last snapshot, fresh or not, or None
+        '''
+        with self.lock:
+            return self.snapshots.get(self.day(date))
+
+    def put(self, snapshot):
+        '''Provided a new snapshot, keep it and return the blocks freed since the previous one of its day
+        '''
+        with self.lock:
+            if snapshot.parse_seconds is not None:
+                self.parsed += 1
+                self.parse_seconds += snapshot.parse_seconds
+                self.max_parse_seconds = max(self.max_parse_seconds, snapshot.parse_seconds)
+
+            previous = self.snapshots.get(self.day(snapshot.date))
+            self.snapshots[self.day(snapshot.date)] = snapshot
+            if previous is None:
+                return []
+            freed = snapshot.diff(previous)
+            self.freed += len(freed)
+
+        if freed:
+            self.ITSdriver_logger.info("%d shift(s) freed on %s since the last snapshot: %s" % (len(freed), snapshot.date.strftime("%d-%b-%Y"), freed))
+        return freed
+
+    def invalidate(self, date):
+        '''Provided a date, stop using its snapshot (it stays the baseline for the next diff)
+        '''
+        with self.lock:
+            snapshot = self.snapshots.get(self.day(date))
+            if snapshot is not None:
+                snapshot.expired = True
+
+    def metrics(self):
+        '''return the snapshot hits, misses, freed shifts and the time spent parsing a day's grid so far
+        '''
+        with self.lock:
+            return {
+                "days":len(self.snapshots),
+                "hits":self.hits,
+                "misses":self.misses,
+                "freed":self.freed,
+                "parsed":self.parsed,
+                "mean_parse_seconds":self.parse_seconds / self.parsed if self.parsed else None,
+                "max_parse_seconds":self.max_parse_seconds if self.parsed else None
+            }
@@ -0,0 +1,136 @@
+import urllib
+import urlparse
+import datetime
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+#ways a date may be written in a url, most specific first
+DATE_URL_FORMATS = [
+    "{year:04d}-{month:02d}-{day:02d}",
+    "{month:02d}/{day:02d}/{year:04d}",
+    "{month:d}/{day:d}/{year:04d}",
+    "{month:02d}-{day:02d}-{year:04d}",
+    "{month:d}-{day:d}-{year:04d}",
+    "{year:04d}{month:02d}{day:02d}",
+]
+DATE_PART_FORMATS = ["{%s:02d}", "{%s:d}"]
+
+def resolve_year(date, today=None):
+    '''
+    Provided a datetime, return it in a real year. Dates parsed without one
+    (year 1900) are moved into the year closest to today
+    '''
+    if date.year != 1900:
+        return date
+    today = today or datetime.datetime.today()
+    candidates = [date.replace(year=year) for year in (today.year-1, today.year, today.year+1)]
+    return min(candidates, key=lambda candidate: abs(candidate - today))
+
+def escape_template(url):
+    '''Provided part of a url, escape it for use in a str.format template
+    '''
+    return url.replace("{", "{{").replace("}", "}}")
+
+def learn_date_template(url, date):
+    '''
+    Provided a url and the date it shows, return a template for the url of
+    any date (filled with str.format(year=, month=, day=)), None if the date
+    is not written in the url
+    '''
+    fields = {"year":date.year, "month":date.month, "day":date.day}
+
+    for date_format in DATE_URL_FORMATS:
+        date_str = date_format.format(**fields)
+        for written, written_format in [(date_str, date_format), (urllib.quote(date_str, safe=""), urllib.quote(date_format, safe="{}:"))]:
+            if url.count(written) == 1:
+                before, after = url.split(written)
+                return escape_template(before) + written_format + escape_template(after)
+
+    #year, month and day as their own query parameters
+    parts = urlparse.urlsplit(url)
+    query = urlparse.parse_qsl(parts.query, keep_blank_values=True)
+    template_query = []
+    found = set()
+    for name, value in query:
+        matches = [(field, part_format % (field)) for field in ("year", "month", "day") for part_format in DATE_PART_FORMATS
+                   if value == (part_format % (field)).format(**fields)]
+        fields_matched = set(field for field, part_format in matches)
+        if len(fields_matched) == 1 and not fields_matched & found:
+            found |= fields_matched
+            template_query.append("%s=%s" % (escape_template(urllib.quote_plus(name)), matches[0][1]))
+        else:
+            template_query.append(escape_template(urllib.urlencode([(name, value)])))
+
+    if found != set(["year", "month", "day"]):
+        return None
+    return escape_template(urlparse.urlunsplit(parts[:3] + ("", ""))) + "?" + "&".join(template_query)
+
+class Schedule_URL_Cache(object):
+    '''
+    Remembers how the ITS schedule addresses a date, so a driver can load the
+    schedule of any date in one navigation instead of clicking through the
+    calendar. The url template is learned from any schedule url or calendar
+    day link whose date is known, and is dropped when it leads somewhere else.
+    '''
+
+    def __init__(self):
+        self.template = None
+        self.urls = {}
+
+        self.hits = 0
+        self.misses = 0
+
+        self.ITSdriver_logger = logging.getLogger("ITSdriver")
+
+    def learn(self, date, url):
+        '''Provided a date and a url showing its schedule, learn the url template from it
+        '''
+        if self.template is not None:
+            return True
+        if urlparse.urlsplit(url or "").scheme not in ("http", "https"):
+            return False
+
+        template = learn_date_template(url, date)
+        if template is not None:
+            self.template = template
+            self.ITSdriver_logger.info("Learned schedule url template %s" % (template))
+        return template is not None
+
+    def learn_calendar(self, month_date, day_links):
+        '''Provided the month shown on a calendar and its (day, url) links, learn from the first usable link
+        '''
+        for day, url in day_links:
+            try:
+                if self.learn(month_date.replace(day=int(day)), url):
+                    return True
+            except ValueError:
+                continue
+        return False
+
+    def url_for(self, date):
+        '''Provided a date, return the url of its schedule or None if it is not known yet
+        '''
+        key = (date.year, date.month, date.day)
+        if key not in self.urls and self.template is not None:
+            self.urls[key] = self.template.format(year=date.year, month=date.month, day=date.day)
+
+        if key in self.urls:
+            self.hits += 1
+            return self.urls[key]
+        self.misses += 1
+        return None
+
+    def forget(self):
+        '''Drop the template and every url built from it
+        '''
+        self.ITSdriver_logger.warning("Forgetting schedule url template %s" % (self.template))
+        self.template = None
+        self.urls.clear()
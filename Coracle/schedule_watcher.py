@@ -0,0 +1,167 @@
+import sys
+import time
+import datetime
+import threading
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+from schedule_snapshot import Schedule_Snapshot_Cache
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+SCAN_PRIORITY = (sys.float_info.max,) #after every grab, before the pool stops
+
+def shift_from_block(block, day, seen, detection_latency=None):
+    '''
+    Provided a takeable schedule block, the day it was seen on, when it was
+    seen and how long it may have been free before, return the info dict of its
+    shift in the same shape as an ITS email's. Unlike an email's, its location
+    is known, so it is only grabbed at the block's location
+    '''
+    day = day.replace(year=1900) #like the dates parsed from emails
+    return {
+        "user":[],
+        "status":"ScheduleOpen",
+        "type":SHIFT_TYPES[1] if block.start_date != block.end_date else SHIFT_TYPES[0],
+        "actions":[action for action in SHIFT_ACTIONS_MAP["Take"] if block.find_action(action) is not None],
+        "start_date":day,
+        "end_date":day,
+        "weekday":day,
+        "weekday_name":day.strftime("%A"),
+        "start_time":block.start_time,
+        "end_time":block.end_time,
+        "location":block.location,
+        "sent":seen,
+        "source":"schedule",
+        "detection_latency":detection_latency
+    }
+
+class Schedule_Watcher(object):
+    '''
+    Schedule_Watcher finds takeable shifts on the ITS schedule itself instead
+    of waiting for their email. It scans every day the preferences cover
+    within the next 'days' days on the ITS session pool, behind any grab, and
+    diffs each day against its last scan. Every block that became takeable
+    (and every takeable block on a day's first scan) goes to on_shift, the
+    same path emails take.
+
+    Scans start every min_interval seconds and back off up to max_interval
+    while nothing changes. A change brings them back to min_interval.
+    '''
+
+    def __init__(self, pool, matcher, on_shift, min_interval=SCHEDULE_WATCH_MIN_INTERVAL, max_interval=SCHEDULE_WATCH_MAX_INTERVAL, days=SCHEDULE_WATCH_DAYS):
+        self.pool = pool
+        self.matcher = matcher
+        self.on_shift = on_shift
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.days = days
+
+        self.interval = min_interval
+        self.snapshots = Schedule_Snapshot_Cache()
+        self.stopping = threading.Event()
+        self.worker = None
+
+        self.scans = 0
+        self.found = 0
+
+        self.coracle_logger = logging.getLogger("Coracle")
+
+    def watched_days(self, today=None):
+        '''return the days from today on, within the horizon, that some preference covers
+        '''
+        today = today or datetime.datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+        days = [today + datetime.timedelta(days=offset) for offset in range(self.days)]
+        return [day for day in days if self.matcher.covers_day(day)]
+
+    @staticmethod
+    def scan_day(ITSdr, day):
+        '''Provided an ITS session and a day, load that day's schedule and return its snapshot
+        '''
+        if not ITSdr.navigate_calander(day):
+            return None
+        return ITSdr.take_schedule_snapshot(day)
+
+    def found_blocks(self, snapshot):
+        '''Provided a new snapshot, return its newly takeable blocks and how long they may have been free
+        '''
+        previous = self.snapshots.latest(snapshot.date)
+        freed = self.snapshots.put(snapshot)
+        if previous is None:
+            return snapshot.available(), None
+        return freed, snapshot.taken_at - previous.taken_at
+
+    def scan(self):
+        '''scan every watched day once, hand what became takeable to on_shift, return how many were found
+        '''
+        days = self.watched_days()
+        tasks = [(day, self.pool.submit_priority(SCAN_PRIORITY, self.scan_day, day)) for day in days]
+
+        found = 0
+        for day, task in tasks:
+            try:
+                snapshot = task.wait()
+            except Exception, e:
+                self.coracle_logger.warning("Unable to scan the schedule of %s: %s" % (day.strftime("%d-%b-%Y"), e))
+                continue
+            if snapshot is None:
+                continue
+
+            blocks, detection_latency = self.found_blocks(snapshot)
+            for block in blocks:
+                shift = shift_from_block(block, snapshot.date, snapshot.taken_at, detection_latency)
+                if not shift["actions"]:
+                    continue
+                self.coracle_logger.info("Schedule shows %s takeable on %s" % (block, snapshot.date.strftime("%d-%b-%Y")))
+                found += 1
+                try:
+                    self.on_shift(shift)
+                except (KeyError, ValueError, TypeError), e:
+                    self.coracle_logger.error("Skipping unmatchable schedule shift %s: %r" % (shift, e))
+
+        self.scans += 1
+        self.found += found
+        return found
+
+    def watch(self):
+        '''scan until stopped, adapting the interval between scans
+        '''
+        while not self.stopping.is_set():
+            started = time.time()
+            try:
+                found = self.scan()
+            except Exception, e:
+                self.coracle_logger.error("Schedule scan failed: %s" % (e))
+                found = 0
+
+            if found:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
+            self.stopping.wait(max(0, self.interval - (time.time() - started)))
+
+    def start(self):
+        '''start watching on a worker of its own
+        '''
+        self.coracle_logger.info("Watching the schedule of %d day(s)" % (len(self.watched_days())))
+        self.worker = threading.Thread(target=self.watch, name="ITS-schedule-watch")
+        self.worker.daemon = True
+        self.worker.start()
+
+    def stop(self):
+        '''stop after the scan in progress
+        '''
+        self.stopping.set()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+
+    def metrics(self):
+        '''return how many scans ran, how many takeable shifts they found, and the current interval
+        '''
+        return {"scans":self.scans, "found":self.found, "interval":self.interval}
@@ -0,0 +1,319 @@
+import time
+import threading
+from itertools import count
+from Queue import PriorityQueue, Empty
+from os.path import dirname, realpath, join
+
+import logging
+import logging.config
+
+from constants import *
+from coracle_exceptions import SessionException
+from step_timings import Step_Timings
+
+current_filepath = dirname(realpath(__file__))
+
+logging.config.fileConfig(join(current_filepath, PATH_TO_DEFAULT_LOGGING_FILE))
+
+POOL_STOP_PRIORITY = (float("inf"),) #after every queued task
+
+class Pool_Task(object):
+    '''
+    A call waiting for, or done on, an ITS session. wait() blocks until it is
+    done and returns its result, or raises what it raised
+    '''
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        '''Given a submitted task, wait for it and return its result
+        '''
+        if not self.done.wait(timeout):
+            raise SessionException("ITS session task not done after %s seconds" % (timeout))
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class Fair_Share(object):
+    '''
+    Fair_Share lets at most 'slots' tasks run at once across every tenant
+    sharing the process. When tasks wait for a slot, the next one goes to the
+    tenant with the fewest tasks running, then to the tenant served least
+    recently, then to the task that waited longest, so one busy tenant cannot
+    starve the others.
+    '''
+
+    def __init__(self, slots=TENANT_ITS_SLOTS):
+        self.slots = slots
+        self.running = 0
+        self.active = {}
+        self.waiting = []
+        self.tickets = count()
+        self.grants = count()
+        self.last_granted = {}
+        self.condition = threading.Condition()
+
+        self.granted = {}
+        self.wait_seconds = {}
+
+    def next_ticket(self):
+        '''Given tasks waiting, return the (tenant, ticket) to run next
+        '''
+        return min(self.waiting, key=lambda waiting: (self.active.get(waiting[0], 0), self.last_granted.get(waiting[0], -1), waiting[1]))
+
+    def acquire(self, tenant):
+        '''Provided a tenant, wait for a slot to run one of its tasks
+        '''
+        waited_from = time.time()
+        with self.condition:
+            ticket = (tenant, next(self.tickets))
+            self.waiting.append(ticket)
+            while self.running >= self.slots or self.next_ticket() != ticket:
+                self.condition.wait()
+
+            self.waiting.remove(ticket)
+            self.running += 1
+            self.active[tenant] = self.active.get(tenant, 0) + 1
+            self.granted[tenant] = self.granted.get(tenant, 0) + 1
+            self.last_granted[tenant] = next(self.grants)
+            self.wait_seconds[tenant] = self.wait_seconds.get(tenant, 0.0) + time.time() - waited_from
+            self.condition.notify_all()
+
+    def release(self, tenant):
+        '''Provided a tenant, give back the slot one of its tasks held
+        '''
+        with self.condition:
+            self.running -= 1
+            self.active[tenant] -= 1
+            self.condition.notify_all()
+
+    def metrics(self):
+        '''return the slots in use, and per tenant the tasks run and seconds spent waiting for a slot
+        '''
+        with self.condition:
+            return {
+                "slots":self.slots,
+                "running":self.running,
+                "waiting":len(self.waiting),
+                "granted":dict(self.granted),
+                "wait_seconds":dict(self.wait_seconds)
+            }
+
+class ITS_Session_Pool(object):
+    '''
+    ITS_Session_Pool keeps 'size' logged in ITS sessions (ITSdriver or
+    ITShttpdriver) warm, each owned by its own worker thread. Submitted tasks
+    go to whichever session is idle, so several grabs run in parallel.
+
+    Tasks are taken lowest priority first (then in submission order), and
+    with a queue_size submitting blocks while that many tasks are waiting.
+
+    An idle session is re-validated every revalidate_interval seconds and
+    logged in again when the ITS website has dropped it. A task failing with a
+    SessionException also gets its session logged in again and is retried once.
+
+    Pools of several tenants in one process can share a Fair_Share, every
+    task then waits for one of its slots under the pool's tenant name.
+    '''
+
+    def __init__(self, make_driver, username, password, size=ITS_POOL_SIZE, revalidate_interval=ITS_POOL_REVALIDATE_INTERVAL, queue_size=0, share=None, tenant=None):
+        self.make_driver = make_driver
+        self.username = username
+        self.password = password
+        self.size = size
+        self.revalidate_interval = revalidate_interval
+        self.share = share
+        self.tenant = tenant or username
+
+        self.tasks = PriorityQueue(queue_size)
+        self.sequence = count()
+        self.workers = []
+        self.drivers = [None] * size
+        self.logged_in = [False] * size
+
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.busy_seconds = 0.0
+        self.completed = 0
+        self.failed = 0
+        self.logins = 0
+        self.relogins = 0
+        self.started = None
+
+        self.ITSdriver_logger = logging.getLogger("ITSdriver")
+        self.simple_logger = logging.getLogger("simple_log")
+
+    def start(self, wait=True):
+        '''
+        Start a worker per session, each creating and logging in its driver.
+        With wait, return once every session has tried to log in
+        '''
+        self.started = time.time()
+        ready = [threading.Event() for session in range(self.size)]
+        for session in range(self.size):
+            worker = threading.Thread(target=self.work, args=(session, ready[session]), name="ITS-session-%d" % (session))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+        if wait:
+            for event in ready:
+                event.wait()
+        self.ITSdriver_logger.info("ITS session pool started, %d/%d sessions logged in" % (sum(self.logged_in), self.size))
+
+    def login(self, session, relogin=False):
+        '''
+        Provided a session number, (re)create its driver if needed and log it
+        in. Only a driver login returning True counts as logged in
+        '''
+        try:
+            if self.drivers[session] is None:
+                self.drivers[session] = self.make_driver()
+            logged_in = self.drivers[session].login(self.username, self.password) is True
+        except Exception, e:
+            self.logged_in[session] = False
+            self.ITSdriver_logger.error("ITS session #%d unable to log in: %s" % (session, e))
+            return False
+
+        self.logged_in[session] = logged_in
+        if not logged_in:
+            self.ITSdriver_logger.error("ITS session #%d not logged in" % (session))
+            return False
+
+        with self.lock:
+            self.logins += 1
+            if relogin:
+                self.relogins += 1
+        self.ITSdriver_logger.info("ITS session #%d logged in" % (session))
+        return True
+
+    def validate(self, session):
+        '''Provided a session number, check it is still logged in and log it in again if not
+        '''
+        if self.logged_in[session] and self.drivers[session].is_logged_in():
+            return True
+        self.ITSdriver_logger.warning("ITS session #%d expired, logging in again" % (session))
+        return self.login(session, relogin=True)
+
+    def work(self, session, ready):
+        '''Provided a session number, log it in and run tasks on it until stopped
+        '''
+        self.login(session)
+        ready.set()
+
+        while True:
+            try:
+                priority, sequence, task = self.tasks.get(timeout=self.revalidate_interval)
+            except Empty:
+                self.validate(session)
+                continue
+            if task is None:
+                break
+            self.run(session, task)
+
+        if self.drivers[session] is not None:
+            try:
+                self.drivers[session].quit()
+            except Exception, e:
+                self.ITSdriver_logger.warning("ITS session #%d did not quit cleanly: %s" % (session, e))
+
+    def run(self, session, task):
+        '''Provided a session number and a task, run the task on that session's driver
+        '''
+        if self.share is not None:
+            self.share.acquire(self.tenant)
+        with self.lock:
+            self.busy += 1
+        task.started = time.time()
+        try:
+            if not self.logged_in[session]:
+                self.login(session, relogin=True)
+            try:
+                task.result = task.func(self.drivers[session], *task.args)
+            except SessionException, e:
+                self.ITSdriver_logger.warning("ITS session #%d failed a task (%s), logging in again and retrying" % (session, e))
+                if not self.login(session, relogin=True):
+                    raise
+                task.result = task.func(self.drivers[session], *task.args)
+        except Exception, e:
+            task.error = e
+            self.ITSdriver_logger.error("ITS session #%d task failed: %s" % (session, e))
+        finally:
+            task.finished = time.time()
+            with self.lock:
+                self.busy -= 1
+                self.busy_seconds += task.finished - task.started
+                self.completed += 1
+                if task.error is not None:
+                    self.failed += 1
+            if self.share is not None:
+                self.share.release(self.tenant)
+            task.done.set()
+
+    def submit(self, func, *args):
+        '''Provided a function and its arguments, queue func(driver, *args) on the next idle session
+        '''
+        return self.submit_priority((), func, *args)
+
+    def submit_priority(self, priority, func, *args):
+        '''
+        Provided a priority tuple, a function and its arguments, queue
+        func(driver, *args) ahead of every task with a higher priority. Blocks
+        while the queue is full
+        '''
+        task = Pool_Task(func, args)
+        self.tasks.put((priority, next(self.sequence), task))
+        return task
+
+    def grab_shift(self, shift):
+        '''Provided a shift, grab it on an idle session and return whether it was grabbed
+        '''
+        return self.submit(lambda driver, shift: driver.grab_shift(shift), shift).wait()
+
+    def stop(self):
+        '''Let the queued tasks finish, then log out every session
+        '''
+        for worker in self.workers:
+            self.tasks.put((POOL_STOP_PRIORITY, next(self.sequence), None))
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.ITSdriver_logger.info("ITS session pool stopped %s" % (self.metrics()))
+
+    def step_metrics(self):
+        '''return the step timings of every session's driver together
+        '''
+        steps = Step_Timings()
+        for driver in self.drivers:
+            if getattr(driver, "step_timings", None) is not None:
+                steps.merge(driver.step_timings)
+        return steps.metrics()
+
+    def metrics(self):
+        '''return the pool size, how many sessions are logged in and busy, utilisation and step timings so far
+        '''
+        steps = self.step_metrics()
+        with self.lock:
+            elapsed = time.time() - self.started if self.started else 0
+            return {
+                "size":self.size,
+                "logged_in":sum(self.logged_in),
+                "busy":self.busy,
+                "idle":self.size - self.busy,
+                "queued":self.tasks.qsize(),
+                "completed":self.completed,
+                "failed":self.failed,
+                "logins":self.logins,
+                "relogins":self.relogins,
+                "utilisation":self.busy_seconds / (elapsed * self.size) if elapsed else 0.0,
+                "steps":steps
+            }
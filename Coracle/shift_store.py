@@ -0,0 +1,181 @@
+import datetime
+import random
+import timeit
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from itertools import count
+
+from constants import *
+
+def freeze(value):
+    '''Provided a shift or one of its values, return a hashable copy of it
+    '''
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.iteritems()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def shift_key(shift):
+    '''Provided a shift, return its identity. Two shifts share a key exactly when they are equal
+    '''
+    return freeze(shift)
+
+class Shift_Store(object):
+    '''
+    In memory shift history indexed two ways. A hash on shift identity makes
+    add, dedup and remove O(1), and date sorted lists of (date, sequence, key)
+    let range queries bisect straight to the matching shifts. TempShifts are
+    sorted by their date, PermShifts both by their start and by their end
+    date, and shifts of any other type are kept aside so the manager can
+    clean them up.
+    '''
+
+    def __init__(self, shifts=()):
+        self.shifts = OrderedDict()
+        self.sequences = {}
+        self.temp_dates = []
+        self.perm_dates = []
+        self.perm_end_dates = []
+        self.untyped = OrderedDict()
+        self.counter = count()
+
+        for shift in shifts:
+            self.add(shift)
+
+    def __len__(self):
+        return len(self.shifts)
+
+    def __iter__(self):
+        return self.shifts.itervalues()
+
+    def __contains__(self, shift):
+        return shift_key(shift) in self.shifts
+
+    def __repr__(self):
+        return repr(self.shifts.values())
+
+    def date_list(self, shift):
+        '''Provided a shift, return the date index it belongs in, None if untyped
+        '''
+        if shift["type"] == "TempShift":
+            return self.temp_dates
+        if shift["type"] == "PermShift":
+            return self.perm_dates
+        return None
+
+    def add(self, shift):
+        '''Provided a shift, add it unless an equal shift is stored. Return True if added
+        '''
+        key = shift_key(shift)
+        if key in self.shifts:
+            return False
+
+        sequence = next(self.counter)
+        self.shifts[key] = shift
+        self.sequences[key] = sequence
+
+        date_list = self.date_list(shift)
+        if date_list is None:
+            self.untyped[key] = shift
+        else:
+            insort(date_list, (shift["start_date"], sequence, key))
+        if date_list is self.perm_dates:
+            insort(self.perm_end_dates, (shift["end_date"], sequence, key))
+        return True
+
+    def remove(self, shift):
+        '''Provided a shift, remove the stored shift equal to it. Raise ValueError if none is
+        '''
+        key = shift_key(shift)
+        if key not in self.shifts:
+            raise ValueError("Shift not in history: %s" % (shift))
+
+        stored_shift = self.shifts.pop(key)
+        sequence = self.sequences.pop(key)
+
+        date_list = self.date_list(stored_shift)
+        if date_list is None:
+            del self.untyped[key]
+        else:
+            del date_list[bisect_left(date_list, (stored_shift["start_date"], sequence))]
+        if date_list is self.perm_dates:
+            del self.perm_end_dates[bisect_left(self.perm_end_dates, (stored_shift["end_date"], sequence))]
+
+    def untyped_shifts(self):
+        '''return the stored shifts that are neither TempShift nor PermShift
+        '''
+        return self.untyped.values()
+
+    def temp_shifts_in_date_range(self, start, end):
+        '''Provided a start and an end, return the TempShifts dated within them
+        '''
+        low = bisect_left(self.temp_dates, (start,))
+        high = bisect_right(self.temp_dates, (end, float("inf")))
+        return [self.shifts[key] for date, sequence, key in self.temp_dates[low:high]]
+
+    def perm_shifts_in_date_range(self, start, end):
+        '''
+        Provided a start and an end, return the PermShifts overlapping them,
+        sorted by start date. Only the smaller of the shifts starting by the
+        end and the shifts ending from the start is scanned
+        '''
+        high = bisect_right(self.perm_dates, (end, float("inf")))
+        low = bisect_left(self.perm_end_dates, (start,))
+
+        if high <= len(self.perm_end_dates) - low:
+            perm_shifts = [self.shifts[key] for date, sequence, key in self.perm_dates[:high]]
+            return [shift for shift in perm_shifts if shift["end_date"] >= start]
+
+        overlapping = sorted((self.shifts[key]["start_date"], sequence, key) for date, sequence, key in self.perm_end_dates[low:] if self.shifts[key]["start_date"] <= end)
+        return [self.shifts[key] for date, sequence, key in overlapping]
+
+
+def benchmark_shift_store(sizes=(10000, 100000), operations=200):
+    '''
+    Fill a plain list (the old history) and a Shift_Store with 'size' random
+    TempShifts, then time dedup checks, removals and one week range queries.
+    Return {size: {name: seconds per operation}}
+    '''
+    def random_shift(rng):
+        date = datetime.datetime(1900, 1, 1) + datetime.timedelta(rng.randint(0, 364))
+        hour = rng.randint(8, 20)
+        return {
+            "type":"TempShift",
+            "actions":["TempTake"],
+            "start_date":date,
+            "end_date":date,
+            "start_time":datetime.datetime(1900, 1, 1, hour),
+            "end_time":datetime.datetime(1900, 1, 1, hour+1),
+            "location":rng.choice(LOCATIONS),
+            "user":["User", str(rng.randint(0, 10**9))]
+        }
+
+    def list_range(history, start, end):
+        return [shift for shift in history if start <= shift["start_date"] <= end]
+
+    results = {}
+    for size in sizes:
+        rng = random.Random(size)
+        shifts = [random_shift(rng) for shift_num in range(size)]
+        probes = rng.sample(shifts, operations)
+        week = datetime.datetime(1900, 6, 1), datetime.datetime(1900, 6, 7)
+
+        history = list(shifts)
+        store = Shift_Store(shifts)
+
+        results[size] = {
+            "list_dedup":timeit.timeit(lambda: [probe in history for probe in probes], number=1) / operations,
+            "store_dedup":timeit.timeit(lambda: [probe in store for probe in probes], number=1) / operations,
+            "list_range":timeit.timeit(lambda: list_range(history, *week), number=10) / 10,
+            "store_range":timeit.timeit(lambda: store.temp_shifts_in_date_range(*week), number=10) / 10,
+            "list_remove":timeit.timeit(lambda: [history.remove(probe) for probe in probes], number=1) / operations,
+            "store_remove":timeit.timeit(lambda: [store.remove(probe) for probe in probes], number=1) / operations,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    for size, result in sorted(benchmark_shift_store().items()):
+        for name, seconds in sorted(result.items()):
+            print "%d shifts, %s: %.6f ms/op" % (size, name, seconds * 1000)
@@ -0,0 +1,47 @@
+import time
+import threading
+from contextlib import contextmanager
+
+class Step_Timings(object):
+    '''
+    Durations of the named steps a driver goes through (loading a page,
+    logging in, navigating, submitting), so the step dominating grab latency
+    can be found and its waits tuned
+    '''
+
+    def __init__(self):
+        self.steps = {}
+        self.lock = threading.Lock()
+
+    def record(self, step, seconds):
+        '''Provided a step name and how long it took, add it to the step's timings
+        '''
+        with self.lock:
+            count, total, longest = self.steps.get(step, (0, 0.0, 0.0))
+            self.steps[step] = (count + 1, total + seconds, max(longest, seconds))
+
+    @contextmanager
+    def timed(self, step):
+        '''Provided a step name, time the block run under it
+        '''
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.record(step, time.time() - started)
+
+    def merge(self, other):
+        '''Provided another Step_Timings, add its timings to these
+        '''
+        with other.lock:
+            steps = dict(other.steps)
+        with self.lock:
+            for step, (count, total, longest) in steps.iteritems():
+                own_count, own_total, own_longest = self.steps.get(step, (0, 0.0, 0.0))
+                self.steps[step] = (own_count + count, own_total + total, max(own_longest, longest))
+
+    def metrics(self):
+        '''return how often each step ran and its mean and max duration
+        '''
+        with self.lock:
+            return dict((step, {"count":count, "mean":total / count, "max":longest}) for step, (count, total, longest) in self.steps.iteritems())
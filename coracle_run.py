@@ -1,15 +1,24 @@
 import Coracle
 from Coracle.constants import *
+from Coracle.multi_tenant import Tenant_Runner
 import argparse
 
 parser = argparse.ArgumentParser(description='Perform Coracle')
 
 parser.add_argument('-s', action="store", dest="settings_filepath", default=PATH_TO_DEFAULT_SETTINGS_FILE, help='path for settings configuration')
 parser.add_argument('-c', action="store", dest="credentials_filepath", default=PATH_TO_DEFAULT_CREDENTIALS_FILE, help='path for credentials configuration')
+parser.add_argument('-t', action="store", dest="tenants_dirpath", default=None, help='directory of tenants to run in one process, each a directory holding settings.json and creds.json')
+parser.add_argument('--event-loop', action="store_true", dest="event_loop", help='wait for emails on a single threaded event loop')
 
 args = parser.parse_args()
 kwargs = dict(args._get_kwargs())
 
-c = Coracle.Coracle()
-c.dict_configure(**kwargs)
-c.run()
+if args.tenants_dirpath:
+    Tenant_Runner(args.tenants_dirpath, event_loop=args.event_loop).run()
+else:
+    c = Coracle.Coracle()
+    c.dict_configure(**kwargs)
+    if args.event_loop:
+        c.run_event_loop()
+    else:
+        c.run()
@@ -0,0 +1,242 @@
+import re
+import threading
+import SocketServer
+
+ITS_EMAIL_TEMPLATE = "From: <atat@ALBANY.EDU>\r\nDate: %s\r\nSubject: Shift Dropped\r\n%s\r\n%s"
+ITS_EMAIL_BODY_TEMPLATE = "Shift dropped by Adam Mrowca\r\n\r\n%s\r\nVisit PunchCard\r\n"
+ITS_EMAIL_ENCODED_HEADERS = "Content-Type: text/plain; charset=us-ascii\r\nContent-Transfer-Encoding: %s\r\n"
+
+def ITS_email(shift_line="Temp Drop - Monday, 10/3 - 2:00PM - 3:00PM", date="Mon, 03 Oct 2016 12:00:00 +0000", encoding=None):
+    '''Provided the shift line of an ITS email, and optionally "quoted-printable" or "base64", return the raw email ITS would send'''
+    body = ITS_EMAIL_BODY_TEMPLATE % (shift_line)
+    if encoding is None:
+        return ITS_EMAIL_TEMPLATE % (date, "", body)
+    encoded = body.encode({"quoted-printable":"quopri", "base64":"base64"}[encoding])
+    return ITS_EMAIL_TEMPLATE % (date, ITS_EMAIL_ENCODED_HEADERS % (encoding), encoded.replace("\r\n", "\n").replace("\n", "\r\n"))
+
+class Fake_IMAP_Handler(SocketServer.StreamRequestHandler):
+    '''
+    Speaks just enough IMAP4rev1 for outlookclient: CAPABILITY, LOGIN,
+    SELECT, NOOP, LOGOUT, IDLE (RFC 2177) and the UID forms of SEARCH, FETCH
+    and STORE
+    '''
+
+    def handle(self):
+        server = self.server
+        server.connected(self)
+        self.send("* OK [CAPABILITY %s] fake IMAP ready" % (server.capabilities()))
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.rstrip("\r\n")
+            server.commands.append(line)
+
+            tag, command, args = (line.split(" ", 2) + ["", ""])[:3]
+            command = command.upper()
+            uid = command == "UID"
+            if uid:
+                command, _, args = args.partition(" ")
+                command = command.upper()
+
+            handler = getattr(self, "do_%s" % (command), None)
+            if handler is None:
+                self.send("%s BAD unknown command %s" % (tag, command))
+                continue
+            if handler(tag, args, uid) is False:
+                break
+        server.disconnected(self)
+
+    def send(self, line):
+        self.wfile.write(line + "\r\n")
+        self.wfile.flush()
+
+    def do_CAPABILITY(self, tag, args, uid):
+        self.send("* CAPABILITY %s" % (self.server.capabilities()))
+        self.send("%s OK CAPABILITY completed" % (tag))
+
+    def do_LOGIN(self, tag, args, uid):
+        username, password = [arg.strip('"') for arg in args.split(" ", 1)]
+        if (username, password) != self.server.credentials:
+            self.send("%s NO LOGIN failed" % (tag))
+            return
+        self.send("%s OK LOGIN completed" % (tag))
+
+    def do_SELECT(self, tag, args, uid):
+        with self.server.lock:
+            self.send("* %d EXISTS" % (len(self.server.messages)))
+            self.send("* OK [UIDVALIDITY %d] UIDs valid" % (self.server.uidvalidity))
+            self.send("* OK [UIDNEXT %d] Predicted next UID" % (self.server.next_uid))
+        self.send("%s OK [READ-WRITE] SELECT completed" % (tag))
+
+    def do_NOOP(self, tag, args, uid):
+        with self.server.lock:
+            self.send("* %d EXISTS" % (len(self.server.messages)))
+        self.send("%s OK NOOP completed" % (tag))
+
+    def do_IDLE(self, tag, args, uid):
+        if not self.server.idle:
+            self.send("%s BAD unknown command IDLE" % (tag))
+            return
+        if self.server.reject_idle:
+            self.send("%s NO IDLE not allowed now" % (tag))
+            return
+
+        with self.server.lock:
+            self.send("+ idling")
+            self.server.idling.append(self)
+        done = self.rfile.readline().rstrip("\r\n")
+        with self.server.lock:
+            self.server.idling.remove(self)
+        self.server.commands.append(done)
+
+        if done.upper() != "DONE" or self.server.reject_done:
+            self.send("%s BAD expected DONE" % (tag))
+            return
+        self.send("%s OK IDLE terminated" % (tag))
+
+    def do_LOGOUT(self, tag, args, uid):
+        self.send("* BYE fake IMAP logging out")
+        self.send("%s OK LOGOUT completed" % (tag))
+        return False
+
+    def do_SEARCH(self, tag, args, uid):
+        criteria = args.split()
+        with self.server.lock:
+            messages = list(enumerate(self.server.messages, 1))
+            if "UID" in criteria:
+                uids = self.server.uid_set(criteria[criteria.index("UID") + 1])
+                messages = [(seq, message) for seq, message in messages if message["uid"] in uids]
+            if "UNSEEN" in criteria:
+                messages = [(seq, message) for seq, message in messages if "\\Seen" not in message["flags"]]
+            if "FROM" in criteria:
+                sender = criteria[criteria.index("FROM") + 1].strip('"').lower()
+                messages = [(seq, message) for seq, message in messages if sender in message["raw"].split("\r\n", 1)[0].lower()]
+        found = [str(message["uid"] if uid else seq) for seq, message in messages]
+        self.send(" ".join(["* SEARCH"] + found))
+        self.send("%s OK SEARCH completed" % (tag))
+
+    def do_FETCH(self, tag, args, uid):
+        message_set, _, items = args.partition(" ")
+        with self.server.lock:
+            if uid:
+                uids = self.server.uid_set(message_set)
+                fetched = [(seq, message) for seq, message in enumerate(self.server.messages, 1) if message["uid"] in uids]
+            else:
+                fetched = [(seq, self.server.messages[seq - 1]) for seq in map(int, message_set.split(","))]
+
+            for seq, message in fetched:
+                headers, _, text = message["raw"].partition("\r\n\r\n")
+                literals = []
+                if re.search(r"\bRFC822\b", items):
+                    message["flags"].add("\\Seen")
+                    literals.append(("RFC822", message["raw"]))
+
+                header_fields = re.search(r"BODY\.PEEK\[HEADER\.FIELDS \(([^)]*)\)\]", items)
+                if header_fields:
+                    names = header_fields.group(1).upper().split()
+                    kept = [header for header in headers.split("\r\n") if header.split(":", 1)[0].upper() in names]
+                    literals.append(("BODY[HEADER.FIELDS (%s)]" % (header_fields.group(1)), "\r\n".join(kept) + "\r\n\r\n"))
+
+                text_peek = re.search(r"BODY\.PEEK\[TEXT\]<0\.(\d+)>", items)
+                if text_peek:
+                    literals.append(("BODY[TEXT]<0>", text[:int(text_peek.group(1))]))
+
+                response = "* %d FETCH (UID %d" % (seq, message["uid"])
+                for name, literal in literals:
+                    response += " %s {%d}\r\n%s" % (name, len(literal), literal)
+                self.send(response + ")")
+        self.send("%s OK FETCH completed" % (tag))
+
+    def do_STORE(self, tag, args, uid):
+        message_set, _, flags = args.partition(" ")
+        with self.server.lock:
+            uids = self.server.uid_set(message_set)
+            for message in self.server.messages:
+                if message["uid"] in uids and "\\Seen" in flags:
+                    message["flags"].add("\\Seen")
+        self.send("%s OK STORE completed" % (tag))
+
+class Fake_IMAP_Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    '''
+    A fake IMAP server on a free localhost port, holding its messages in
+    memory. Every command line it is sent is kept in 'commands'. IDLE is
+    advertised and accepted unless 'idle' is off, 'reject_idle' answers it
+    with NO and 'reject_done' answers its DONE with BAD. Clients idling are
+    told of every message delivered or expunged
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, credentials=("user", "password"), idle=True):
+        SocketServer.TCPServer.__init__(self, ("127.0.0.1", 0), Fake_IMAP_Handler)
+        self.credentials = credentials
+        self.idle = idle
+        self.reject_idle = False
+        self.reject_done = False
+        self.idling = []
+        self.uidvalidity = 7
+        self.next_uid = 1
+        self.messages = []
+        self.commands = []
+        self.clients = []
+        self.lock = threading.RLock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def capabilities(self):
+        return "IMAP4rev1 IDLE" if self.idle else "IMAP4rev1"
+
+    def connected(self, client):
+        with self.lock:
+            self.clients.append(client)
+
+    def disconnected(self, client):
+        with self.lock:
+            self.clients.remove(client)
+
+    def uid_set(self, message_set):
+        '''Provided an IMAP uid set, return the uids of the messages it covers'''
+        with self.lock:
+            highest = self.messages[-1]["uid"] if self.messages else 0
+            uids = set()
+            for part in message_set.split(","):
+                first, _, last = part.partition(":")
+                first = highest if first == "*" else int(first)
+                last = first if not last else highest if last == "*" else int(last)
+                uids.update(range(min(first, last), max(first, last) + 1))
+            return uids
+
+    def deliver(self, raw):
+        '''Provided a raw email, append it to the mailbox and return its uid'''
+        with self.lock:
+            uid = self.next_uid
+            self.next_uid += 1
+            self.messages.append({"uid":uid, "raw":raw, "flags":set()})
+            self.notify("* %d EXISTS" % (len(self.messages)))
+            return uid
+
+    def expunge(self, uid):
+        '''Provided a uid, remove its message from the mailbox'''
+        with self.lock:
+            seq = [message["uid"] for message in self.messages].index(uid) + 1
+            del self.messages[seq - 1]
+            self.notify("* %d EXPUNGE" % (seq))
+
+    def notify(self, line):
+        '''Provided an untagged response, send it to every client idling'''
+        with self.lock:
+            for client in self.idling:
+                client.send(line)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="fake-imap")
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,208 @@
+import cgi
+import urllib
+import calendar
+import datetime
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+from os.path import dirname, realpath, join
+
+PAGES_DIRPATH = join(dirname(realpath(__file__)), "pages")
+
+BASE_PATH = "/punchcard/ut/"
+SESSION_COOKIE = "PHPSESSID"
+LOCATIONS = ["LC-27a", "LC-27b", "LI-Circ", "LI-106", "SciLib"]
+HOURS = [13, 14, 15]
+
+#what the login form's hidden token holds once its entity refs are decoded
+LOGIN_TOKEN = u"caf\xe9&co!"
+
+#option values as the schedule page writes them, entity refs included
+ACTION_OPTIONS = {
+    "TempTake":("Temp&#160;Take", "Temp Take"),
+    "PermTake":("Perm&#160;Take", "Perm Take"),
+    "TempDrop":("Temp&#160;Drop", "Temp Drop"),
+    "PermDrop":("Perm&#160;Drop", "Perm Drop")
+}
+
+def page(name, **values):
+    '''Provided a recorded page's name and its placeholders, return the page'''
+    with open(join(PAGES_DIRPATH, name)) as page_file:
+        return page_file.read() % values
+
+def option_value(action):
+    '''Provided an action, return the value a browser submits for its option'''
+    return ACTION_OPTIONS[action][0].replace("&#160;", u"\xa0").encode("utf-8")
+
+def month_of(date, months):
+    '''Provided a date, return the first day of the month 'months' away'''
+    month = date.year * 12 + date.month - 1 + months
+    return datetime.date(month // 12, month % 12 + 1, 1)
+
+def render_calendar(date):
+    '''Provided the selected date, return the rows of its month's calendar'''
+    rows = []
+    for week in calendar.Calendar(6).monthdatescalendar(date.year, date.month):
+        cells = []
+        for day in week:
+            if day == date:
+                day_class = ' class="highlighted"'
+            elif day.month != date.month:
+                day_class = ' class="prevMonth"' if day < date else ' class="nextMonth"'
+            else:
+                day_class = ""
+            cells.append('<td%s><a href="show_shifts.php?date=%s">%d</a></td>' % (day_class, day.isoformat(), day.day))
+        rows.append("<tr>%s</tr>" % ("".join(cells)))
+    return "\n".join(rows)
+
+def render_locations(date, shifts):
+    '''Provided a date and the actions offered per (location, hour), return the schedule's location columns'''
+    columns = []
+    for location in LOCATIONS:
+        blocks = []
+        for hour in HOURS:
+            actions = shifts.get((location, hour), [])
+            select = ""
+            if actions:
+                options = ['<option value="">--</option>'] + ['<option value="%s">%s</option>' % ACTION_OPTIONS[action] for action in actions]
+                select = '<br><select name="shift[%s][%d]">%s</select>' % (location, hour, "".join(options))
+            blocks.append('<div class="shift"><div class="shift_%s">%d:00PM - %d:00PM<br>%d/%d - %d/%d%s</div></div>'
+                          % ("open" if actions else "taken", hour - 12, hour - 11, date.month, date.day, date.month, date.day, select))
+        columns.append("<td>%s</td>" % ("".join(blocks)))
+    return "".join(columns)
+
+class ITS_Stub_Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    Serves the recorded ITS punchcard pages: login, index.php, show_shifts.php
+    and shift_confirm.php. Every page but login needs the session cookie the
+    login sets, without it the request is redirected back to login
+    '''
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        self.server.connections += 1
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def respond(self, body="", status=200, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location, status=302, headers=()):
+        self.respond("", status, [("Location", location)] + list(headers))
+
+    def session(self):
+        cookies = dict(cookie.strip().split("=", 1) for cookie in (self.headers.getheader("Cookie") or "").split(";") if "=" in cookie)
+        return cookies.get(SESSION_COOKIE)
+
+    def route(self, method):
+        url = urlparse.urlsplit(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        fields = {}
+        if method == "POST":
+            fields = dict(urlparse.parse_qsl(self.rfile.read(int(self.headers.getheader("Content-Length") or 0)), keep_blank_values=True))
+        self.server.requests.append((method, self.path, fields))
+
+        if not url.path.startswith(BASE_PATH):
+            return self.respond("Not Found", 404)
+        name = url.path[len(BASE_PATH):]
+
+        if name in ("", "login.php"):
+            return self.login(method, fields)
+        if self.session() not in self.server.sessions:
+            return self.redirect(BASE_PATH)
+        if name == "index.php":
+            return self.respond(page("index.html"))
+        if name == "show_shifts.php":
+            date = datetime.datetime.strptime(query["date"], "%Y-%m-%d").date() if "date" in query else self.server.today
+            return self.respond(self.schedule(date))
+        if name == "shift_confirm.php" and method == "POST":
+            return self.confirm(fields)
+        return self.respond("Not Found", 404)
+
+    def login(self, method, fields):
+        if method == "POST":
+            if fields.get("token") != LOGIN_TOKEN.encode("utf-8"):
+                return self.respond("Bad token", 400)
+            if (fields.get("username"), fields.get("password")) == self.server.credentials:
+                session = "session%d" % (len(self.server.sessions) + 1)
+                self.server.sessions.add(session)
+                return self.redirect("index.php", headers=[("Set-Cookie", "%s=%s; path=%s" % (SESSION_COOKIE, session, BASE_PATH))])
+        return self.respond(page("login.html"))
+
+    def schedule(self, date):
+        return page("show_shifts.html",
+                    month=date.strftime("%B %Y"),
+                    previous_month=month_of(date, -1).isoformat(),
+                    next_month=month_of(date, 1).isoformat(),
+                    calendar=render_calendar(date),
+                    date=date.isoformat(),
+                    locations=render_locations(date, self.server.shifts_on(date)))
+
+    def confirm(self, fields):
+        date = datetime.datetime.strptime(fields["date"], "%Y-%m-%d").date()
+        if "confirm" not in fields:
+            changes = [(name, value) for name, value in sorted(fields.items()) if name.startswith("shift[") and value]
+            return self.respond(page("shift_confirm.html", date=date.isoformat(), changes=cgi.escape(urllib.urlencode(changes), True)))
+
+        for name, value in urlparse.parse_qsl(fields["changes"]):
+            location, hour = name[len("shift["):-1].split("][")
+            self.server.confirm(date, location, int(hour), value)
+        return self.redirect("show_shifts.php?date=%s" % (date.isoformat()), 303)
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+class ITS_Stub_Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    An ITS punchcard stub on a free localhost port. 'shifts' holds the actions
+    offered per (location, hour) on every day, confirmed changes go to
+    'confirmed' and take the shift off the schedule of their day. Every
+    request is kept in 'requests' as (method, path, posted fields)
+    '''
+    daemon_threads = True
+
+    def __init__(self, credentials=("user", "password"), today=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), ITS_Stub_Handler)
+        self.credentials = credentials
+        self.today = today or datetime.date.today()
+        self.shifts = {("SciLib", 14):["TempTake", "PermTake"], ("LI-106", 13):["TempDrop"]}
+        self.sessions = set()
+        self.confirmed = []
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:%d%s" % (self.server_address[1], BASE_PATH)
+
+    def shifts_on(self, date):
+        with self.lock:
+            taken = set((location, hour) for confirmed_date, location, hour, value in self.confirmed if confirmed_date == date)
+            return dict((key, actions) for key, actions in self.shifts.iteritems() if key not in taken)
+
+    def confirm(self, date, location, hour, value):
+        with self.lock:
+            self.confirmed.append((date, location, hour, value))
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="its-stub")
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
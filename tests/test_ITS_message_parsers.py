@@ -0,0 +1,40 @@
+import unittest
+
+from Coracle.parse.ITS_message_parsers import parse_ITS_email, get_person_from_email, get_time_range_from_email, ParseException
+
+ITS_EMAIL_TEMPLATE = "Shift dropped by Adam Mrowca\r\n\r\n%s\r\nVisit PunchCard\r\n"
+
+SHIFT_LINES = [
+    "Temp Drop - Monday, 10/3 - 2:00PM - 3:00PM",
+    "Temp Take - saturday, 10/8 - 9:00AM - 11:30AM",
+    "Perm Drop - Thursday, 9/1-12/8 - 10:00AM-12:30PM"
+]
+
+ABBREVIATED_SHIFT_LINES = [
+    ("Temp Drop - Mon, 10/3 - 2:00PM - 3:00PM", SHIFT_LINES[0]),
+    ("Temp Take - sat, 10/8 - 9:00AM - 11:30AM", SHIFT_LINES[1]),
+    ("Perm Drop - Thu, 9/1-12/8 - 10:00AM-12:30PM", SHIFT_LINES[2])
+]
+
+class Parse_ITS_Email_Test(unittest.TestCase):
+
+    def test_same_values_as_the_strptime_parsers(self):
+        for shift_line in SHIFT_LINES:
+            ITS_email = ITS_EMAIL_TEMPLATE % (shift_line)
+            shift = parse_ITS_email(ITS_email)
+            start_date, end_date, weekday, start_time, end_time, shift_type, actions = get_time_range_from_email(ITS_email)
+
+            self.assertEqual(shift.user, get_person_from_email(ITS_email))
+            self.assertEqual((shift.start_date, shift.end_date, shift.weekday, shift.start_time, shift.end_time, shift.type, shift.actions),
+                             (start_date, end_date, weekday, start_time, end_time, shift_type, actions))
+
+    def test_abbreviated_weekday_parses_like_the_full_name(self):
+        for abbreviated_line, shift_line in ABBREVIATED_SHIFT_LINES:
+            self.assertEqual(parse_ITS_email(ITS_EMAIL_TEMPLATE % (abbreviated_line)), parse_ITS_email(ITS_EMAIL_TEMPLATE % (shift_line)))
+
+    def test_unknown_weekday_is_not_parsed(self):
+        self.assertRaises(ParseException, parse_ITS_email, ITS_EMAIL_TEMPLATE % ("Temp Drop - Mo, 10/3 - 2:00PM - 3:00PM"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import time
+import datetime
+import unittest
+
+from Coracle.ITShttpdriver import ITShttpdriver
+from Coracle.coracle_exceptions import SessionException
+
+from its_stub import ITS_Stub_Server, LOGIN_TOKEN, option_value, month_of
+
+def shift_on(date, hour, action, locations=("SciLib",)):
+    '''Provided a date, an hour and an action, return the shift an ITS email would give for it'''
+    day = datetime.datetime(1900, date.month, date.day)
+    return {
+        "user":["Adam", "Mrowca"],
+        "actions":[action],
+        "action":action,
+        "locations":list(locations),
+        "start_date":day,
+        "end_date":day,
+        "start_time":datetime.datetime(1900, 1, 1, hour),
+        "end_time":datetime.datetime(1900, 1, 1, hour + 1)
+    }
+
+class ITShttpdriver_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ITS_Stub_Server(today=datetime.date.today()).start()
+        self.driver = ITShttpdriver(base_url=self.server.base_url)
+        self.day = month_of(self.server.today, 1).replace(day=10)
+
+    def tearDown(self):
+        self.driver.quit()
+        self.server.stop()
+
+    def login(self):
+        self.assertTrue(self.driver.login(*self.server.credentials))
+
+    def posts_to(self, path):
+        return [fields for method, request_path, fields in self.server.requests if method == "POST" and request_path.endswith(path)]
+
+    def test_login_scrapes_and_posts_the_form(self):
+        self.login()
+
+        login_post, = self.posts_to("login.php")
+        self.assertEqual(login_post["token"], LOGIN_TOKEN.encode("utf-8"))
+        self.assertEqual(login_post["username"], "user")
+        self.assertEqual(login_post["login"], "Log In")
+        self.assertNotIn("remember", login_post)
+
+        self.assertTrue(self.driver.at_location("home"))
+        self.assertEqual([cookie.name for cookie in self.driver.session.cookies], ["PHPSESSID"])
+        self.assertTrue(self.driver.is_logged_in())
+        self.assertEqual(self.driver.session.connects, 1)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_wrong_password_is_not_logged_in(self):
+        self.assertRaises(SessionException, self.driver.login, "user", "wrong")
+
+        self.assertFalse(self.driver.is_logged_in())
+        self.assertEqual(self.server.sessions, set())
+
+    def test_pages_redirect_to_login_without_the_cookie(self):
+        self.driver.init_session()
+        self.driver.go_to_location("schedule")
+
+        self.assertTrue(self.driver.at_location("login"))
+        self.assertRaises(SessionException, self.driver.wait_for, "shifts_by_day")
+
+    def test_get_user_shifts(self):
+        self.login()
+
+        shifts = self.driver.get_user_shifts()
+
+        self.assertEqual([(shift["location"], shift["type"], shift["start_time"].hour) for shift in shifts],
+                         [("SciLib", "PermShift", 14), ("LC-27a", "TempShift", 10)])
+
+    def test_navigate_calander_clicks_through_then_goes_direct(self):
+        self.login()
+
+        self.assertEqual(self.driver.navigate_calander(datetime.datetime(1900, self.day.month, self.day.day)).date(), self.day)
+        requests = len(self.server.requests)
+        other_day = self.day.replace(day=20)
+        self.assertEqual(self.driver.navigate_calander(datetime.datetime(other_day.year, other_day.month, other_day.day)).date(), other_day)
+
+        self.assertEqual(len(self.server.requests) - requests, 1)
+        self.assertTrue(self.server.requests[-1][1].endswith("show_shifts.php?date=%s" % (other_day.isoformat())))
+
+    def test_take_schedule_snapshot(self):
+        self.login()
+        self.driver.navigate_calander(datetime.datetime(self.day.year, self.day.month, self.day.day))
+
+        snapshot = self.driver.take_schedule_snapshot(datetime.datetime(self.day.year, self.day.month, self.day.day))
+
+        self.assertEqual(len(snapshot.blocks), 15)
+        self.assertEqual([(block.location, block.start_time.hour) for block in snapshot.available()], [("SciLib", 14)])
+
+    def test_grab_shift_submits_and_confirms(self):
+        self.login()
+
+        self.assertTrue(self.driver.grab_shift(shift_on(self.day, 14, "TempTake")))
+
+        schedule_post, confirm_post = self.posts_to("shift_confirm.php")
+        self.assertEqual(schedule_post["shift[SciLib][14]"], option_value("TempTake"))
+        self.assertEqual(schedule_post["shift[LI-106][13]"], "")
+        self.assertEqual(schedule_post["date"], self.day.isoformat())
+        self.assertEqual(confirm_post["confirm"], "Confirm")
+        self.assertEqual(self.server.confirmed, [(self.day, "SciLib", 14, option_value("TempTake"))])
+        self.assertTrue(self.driver.at_location("schedule"))
+
+    def test_grab_shift_tries_every_covering_block(self):
+        self.login()
+
+        self.assertTrue(self.driver.grab_shift(shift_on(self.day, 14, "TempTake", ["LC-27a", "SciLib"])))
+
+        self.assertEqual(self.server.confirmed, [(self.day, "SciLib", 14, option_value("TempTake"))])
+
+    def test_grab_shift_taken_or_not_offered(self):
+        self.login()
+        self.assertTrue(self.driver.grab_shift(shift_on(self.day, 14, "PermTake")))
+
+        self.assertFalse(self.driver.grab_shift(shift_on(self.day, 14, "TempTake")))
+        self.assertFalse(self.driver.grab_shift(shift_on(self.day, 13, "TempTake", ["LI-106"])))
+        self.assertFalse(self.driver.grab_shift(shift_on(self.day, 15, "TempTake")))
+        self.assertEqual(len(self.server.confirmed), 1)
+
+    def test_grab_armed_shift(self):
+        self.login()
+        self.assertIsNotNone(self.driver.arm(datetime.datetime(self.day.year, self.day.month, self.day.day)))
+        requests = len(self.server.requests)
+
+        self.assertTrue(self.driver.grab_armed_shift(shift_on(self.day, 14, "TempTake")))
+
+        self.assertEqual([method for method, path, fields in self.server.requests[requests:]], ["GET", "POST", "POST", "GET"])
+        self.assertEqual(self.server.confirmed, [(self.day, "SciLib", 14, option_value("TempTake"))])
+
+    def test_grab_armed_shift_skips_the_reload_of_a_fresh_page(self):
+        self.login()
+        shift = dict(shift_on(self.day, 14, "TempTake"), sent=time.time() - 1)
+        self.assertIsNotNone(self.driver.arm(datetime.datetime(self.day.year, self.day.month, self.day.day)))
+        requests = len(self.server.requests)
+
+        self.assertTrue(self.driver.grab_armed_shift(shift))
+
+        self.assertEqual([method for method, path, fields in self.server.requests[requests:]], ["POST", "POST", "GET"])
+        self.assertEqual(self.server.confirmed, [(self.day, "SciLib", 14, option_value("TempTake"))])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import socket
+import time
+import imaplib
+import unittest
+
+from Coracle import event_loop
+from Coracle.event_loop import Event_Loop, Mail_Watcher
+
+class Fake_Outlookclient(object):
+    '''An outlookclient whose IDLE fails 'idle_failures' times before it is accepted'''
+
+    def __init__(self, idle_failures=0):
+        self.idle_failures = idle_failures
+        self.idle_attempts = 0
+        self.disconnects = 0
+        self.server_socket, self.client_socket = socket.socketpair()
+
+    def supports_idle(self):
+        return True
+
+    def start_idle(self):
+        self.idle_attempts += 1
+        if self.idle_attempts <= self.idle_failures:
+            raise socket.error("connection reset")
+
+    def idle_socket(self):
+        return self.client_socket
+
+    def end_idle(self):
+        self.client_socket.setblocking(False)
+        try:
+            self.client_socket.recv(1024)
+            return 1, 1
+        except socket.error:
+            return None
+
+    def disconnect(self):
+        self.disconnects += 1
+
+class Fake_Manager(object):
+    '''A Connection_Manager whose reads fail the times listed in 'failing_reads' '''
+
+    def __init__(self, outlookcl, failing_reads=()):
+        self.outlookcl = outlookcl
+        self.failing_reads = failing_reads
+        self.reads = 0
+
+    def check(self):
+        return True
+
+    def reconnect(self, error):
+        return True
+
+    def iter_new_ITS_email_info(self):
+        self.reads += 1
+        if self.reads in self.failing_reads:
+            raise imaplib.IMAP4.abort("Unable to connect after 8 attempts")
+        return iter([{"sent":None}])
+
+class Mail_Watcher_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.base_delay = event_loop.IMAP4_RECONNECT_BASE_DELAY
+        event_loop.IMAP4_RECONNECT_BASE_DELAY = 0.01
+        self.loop = Event_Loop()
+        self.emails = []
+
+    def tearDown(self):
+        event_loop.IMAP4_RECONNECT_BASE_DELAY = self.base_delay
+
+    def test_poll_keeps_polling_after_a_failed_read(self):
+        manager = Fake_Manager(Fake_Outlookclient(), failing_reads=(2,))
+        watcher = Mail_Watcher(self.loop, manager, self.emails.append, 0.02, idle=False)
+
+        watcher.start()
+        self.loop.run_until(time.time() + 0.2)
+        watcher.stop()
+
+        self.assertGreater(manager.reads, 3)
+        self.assertEqual(len(self.emails), manager.reads - 1)
+        self.assertEqual(watcher.failures, 0)
+
+    def test_idle_is_retried_with_backoff(self):
+        outlookcl = Fake_Outlookclient(idle_failures=3)
+        watcher = Mail_Watcher(self.loop, Fake_Manager(outlookcl), self.emails.append, 60)
+
+        watcher.start()
+        self.assertEqual(watcher.retry_delay(), 0.01)
+        self.loop.run_until(time.time() + 0.2)
+
+        self.assertEqual(outlookcl.idle_attempts, 4)
+        self.assertEqual(outlookcl.disconnects, 3)
+        self.assertEqual(watcher.failures, 0)
+        self.assertIsNotNone(watcher.idle_socket)
+
+        outlookcl.server_socket.send("* 1 EXISTS\r\n")
+        self.loop.run_until(time.time() + 0.1)
+        watcher.stop()
+        self.assertEqual(len(self.emails), 2)
+
+    def test_idle_resumes_after_a_failed_read(self):
+        outlookcl = Fake_Outlookclient()
+        manager = Fake_Manager(outlookcl, failing_reads=(2,))
+        watcher = Mail_Watcher(self.loop, manager, self.emails.append, 60)
+
+        watcher.start()
+        outlookcl.server_socket.send("* 1 EXISTS\r\n")
+        self.loop.run_until(time.time() + 0.1)
+
+        self.assertEqual(outlookcl.idle_attempts, 2)
+        self.assertIsNotNone(watcher.idle_socket)
+        watcher.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
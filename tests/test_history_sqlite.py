@@ -0,0 +1,82 @@
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+from os.path import join
+
+from Coracle.history_sqlite import read_legacy_history, import_json_history
+
+LEGACY_SHIFTS = [
+    {
+        "user":[u"Adam", "Mrowca"],
+        "status":"TempDrop",
+        "type":"Temp",
+        "actions":["TempTake"],
+        "start_date":datetime.datetime(1900, 10, 3, 0, 0),
+        "end_date":datetime.datetime(1900, 10, 3, 0, 0),
+        "start_time":datetime.datetime(1900, 1, 1, 14, 0),
+        "end_time":datetime.datetime(1900, 1, 1, 15, 0),
+        "weekday_name":"Monday",
+        "location":"",
+        "sent":None,
+        "uid":-1
+    }
+]
+
+class Legacy_History_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.history_dir = tempfile.mkdtemp()
+        self.history_filepath = join(self.history_dir, "history.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.history_dir)
+
+    def write_history(self, history_str):
+        with open(self.history_filepath, "w") as history_file:
+            history_file.write(history_str)
+
+    def test_reads_what_history_manager_wrote(self):
+        self.write_history(str(LEGACY_SHIFTS))
+
+        self.assertEqual(read_legacy_history(self.history_filepath), LEGACY_SHIFTS)
+
+    def test_reads_dates_tuples_and_floats(self):
+        values = [(datetime.date(2016, 10, 3), 1.5, -2, True, False, None, u"\xe9")]
+        self.write_history(str(values))
+
+        self.assertEqual(read_legacy_history(self.history_filepath), values)
+
+    def test_empty_history(self):
+        self.write_history("\n")
+
+        self.assertEqual(read_legacy_history(self.history_filepath), [])
+
+    def test_rejects_anything_but_literals_and_datetimes(self):
+        touched = join(self.history_dir, "touched")
+        for history_str in [
+                "[__import__('os').system('touch %s')]" % (touched),
+                "[datetime.datetime.now()]",
+                "[datetime.timedelta(1)]",
+                "[datetime.datetime(*[2016, 10, 3])]",
+                "[datetime.datetime(year=2016, month=10, day=3)]",
+                "[datetime.datetime(2016, 10, int('3'))]",
+                "[{'a':1} if True else 2]",
+                "[1 + 1]",
+                "[os]",
+                "[1, 2"]:
+            self.write_history(history_str)
+            self.assertRaises(ValueError, read_legacy_history, self.history_filepath)
+        self.assertFalse(os.path.exists(touched))
+
+    def test_import_legacy_history(self):
+        self.write_history(str(LEGACY_SHIFTS))
+        database_filepath = join(self.history_dir, "history.db")
+
+        self.assertEqual(import_json_history(self.history_filepath, database_filepath), 1)
+        self.assertEqual(import_json_history(self.history_filepath, database_filepath), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
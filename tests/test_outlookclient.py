@@ -0,0 +1,173 @@
+import os
+import time
+import shutil
+import imaplib
+import tempfile
+import threading
+import unittest
+from os.path import join
+
+from Coracle.outlookclient import outlookclient
+
+from fake_imap import Fake_IMAP_Server, ITS_email
+
+class Fake_IMAP_Test(unittest.TestCase):
+    '''An outlookclient on a fresh fake IMAP server and uid state file'''
+    idle = True
+
+    def setUp(self):
+        self.server = Fake_IMAP_Server(idle=self.idle).start()
+        self.state_dir = tempfile.mkdtemp()
+        self.client = outlookclient(host="127.0.0.1", port=self.server.port, ssl=False, state_filepath=join(self.state_dir, "outlook_uids.json"))
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.server.stop()
+        shutil.rmtree(self.state_dir)
+
+    def login(self):
+        self.assertTrue(self.client.login(*self.server.credentials))
+
+class Outlookclient_Test(Fake_IMAP_Test):
+
+    def deliver_with_unparseable(self):
+        first = self.server.deliver(ITS_email("Temp Drop - Monday, 10/3 - 2:00PM - 3:00PM"))
+        unparseable = self.server.deliver(ITS_email("Temp Drop - Someday, 13/45 - 2:00PM - 3:00PM"))
+        last = self.server.deliver(ITS_email("Perm Drop - Thursday, 9/1-12/8 - 10:00AM-12:30PM"))
+        return first, unparseable, last
+
+    def test_new_email_info_skips_unparseable_email(self):
+        first, unparseable, last = self.deliver_with_unparseable()
+        self.login()
+
+        infos = list(self.client.get_new_ITS_email_info())
+
+        self.assertEqual([info["uid"] for info in infos], [str(first), str(last)])
+        self.assertEqual(infos[0]["status"], "TempDrop")
+        self.assertEqual(infos[1]["status"], "PermDrop")
+        self.assertEqual(self.client.get_last_uid(), last)
+        self.assertTrue(any("RFC822" in command and "FETCH %d " % (unparseable) in command for command in self.server.commands))
+        self.assertTrue(all("\\Seen" in message["flags"] for message in self.server.messages))
+
+    def test_new_email_info_skips_unparseable_email_without_lean_fetch(self):
+        first, unparseable, last = self.deliver_with_unparseable()
+        self.client.lean_fetch = False
+        self.login()
+
+        infos = list(self.client.get_new_ITS_email_info())
+
+        self.assertEqual([info["uid"] for info in infos], [str(first), str(last)])
+        self.assertEqual(self.client.get_last_uid(), last)
+
+    def test_new_email_info_resumes_past_unparseable_email(self):
+        self.deliver_with_unparseable()
+        self.login()
+        list(self.client.get_new_ITS_email_info())
+
+        next_uid = self.server.deliver(ITS_email("Temp Drop - Friday, 10/7 - 9:00AM - 11:00AM"))
+        infos = list(self.client.get_new_ITS_email_info())
+
+        self.assertEqual([info["uid"] for info in infos], [str(next_uid)])
+        self.assertEqual(outlookclient(state_filepath=self.client.state_filepath).state["Notes"]["last_uid"], next_uid)
+
+    def test_new_email_info_decodes_encoded_email(self):
+        quoted = self.server.deliver(ITS_email("Temp Drop - Monday, 10/3 - 2:00PM - 3:00PM", encoding="quoted-printable"))
+        encoded = self.server.deliver(ITS_email("Perm Drop - Thursday, 9/1-12/8 - 10:00AM-12:30PM", encoding="base64"))
+        self.login()
+
+        infos = list(self.client.get_new_ITS_email_info())
+
+        self.assertEqual([info["uid"] for info in infos], [str(quoted), str(encoded)])
+        self.assertEqual([info["status"] for info in infos], ["TempDrop", "PermDrop"])
+        self.assertFalse(any("RFC822" in command for command in self.server.commands))
+
+class Idle_Test(Fake_IMAP_Test):
+
+    def setUp(self):
+        Fake_IMAP_Test.setUp(self)
+        self.server.deliver(ITS_email())
+        self.server.deliver(ITS_email())
+        self.login()
+        self.client.select("Notes")
+
+    def deliver_later(self, delay, raw):
+        timer = threading.Timer(delay, self.server.deliver, [raw])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_idle_accepted_and_done(self):
+        self.assertTrue(self.client.supports_idle())
+        self.client.start_idle()
+
+        self.assertIsNotNone(self.client.idle_tag)
+        self.assertEqual(self.client.idle_exists, 2)
+        self.assertEqual(self.client.end_idle(), None)
+        self.assertIsNone(self.client.idle_tag)
+        self.assertEqual(self.server.commands[-2:], ["%s IDLE" % (self.server.commands[-2].split()[0]), "DONE"])
+        self.assertEqual(self.client.noop()[0], "OK")
+
+    def test_idle_rejected(self):
+        self.server.reject_idle = True
+
+        self.assertRaises(imaplib.IMAP4.abort, self.client.start_idle)
+        self.assertIsNone(self.client.idle_tag)
+        self.assertEqual(self.client.noop()[0], "OK")
+
+    def test_done_rejected(self):
+        self.server.reject_done = True
+        self.client.start_idle()
+
+        self.assertRaises(imaplib.IMAP4.abort, self.client.end_idle)
+
+    def test_exists_and_expunge_are_tracked(self):
+        self.client.start_idle()
+        self.server.expunge(1)
+        self.server.deliver(ITS_email())
+        self.server.deliver(ITS_email())
+        self.server.expunge(4)
+
+        self.assertEqual(self.client.end_idle(), (2, 2))
+        self.assertEqual(self.client.exists, 2)
+        self.assertEqual(self.client.idle_exists, 1)
+
+    def test_idle_returns_when_a_message_arrives(self):
+        self.deliver_later(0.1, ITS_email())
+
+        started = time.time()
+        self.assertEqual(self.client.idle(timeout=5), (3, 3))
+        self.assertLess(time.time() - started, 2)
+
+    def test_idle_times_out(self):
+        self.assertEqual(self.client.idle(timeout=1), None)
+        self.assertEqual(self.client.noop()[0], "OK")
+
+    def test_listen_yields_as_messages_arrive(self):
+        self.deliver_later(0.2, ITS_email("Temp Drop - Friday, 10/7 - 9:00AM - 11:00AM"))
+
+        infos = []
+        for info in self.client.listen(60, deadline=time.time() + 1.5):
+            infos.append(info)
+            if len(infos) == 3:
+                break
+
+        self.assertEqual([info["uid"] for info in infos], ["1", "2", "3"])
+        self.assertIn("notification_latency", infos[2])
+        self.assertTrue(any(command.endswith(" IDLE") for command in self.server.commands))
+
+class Poll_Test(Fake_IMAP_Test):
+    idle = False
+
+    def test_listen_polls_without_idle(self):
+        self.login()
+        self.assertFalse(self.client.supports_idle())
+        timer = threading.Timer(0.2, self.server.deliver, [ITS_email()])
+        timer.start()
+
+        infos = list(self.client.listen(0.1, deadline=time.time() + 0.6))
+
+        self.assertEqual([info["uid"] for info in infos], ["1"])
+        self.assertFalse(any(command.endswith(" IDLE") for command in self.server.commands))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import datetime
+import unittest
+
+from Coracle.parse.settings_model import Hour_Preference, Weekday_Preference, Date_Preference
+from Coracle.preference_matcher import Preference_Matcher
+
+def preferences(locations, actions=("TempTake",), date_range=None):
+    '''Provided the locations and actions wanted, and optionally a date range, return the Date_Preferences of one rule covering every day and hour'''
+    hours = (Hour_Preference.compile("all", None, actions),)
+    date_key = "%s-%s" % tuple(date.strftime("%m/%d/%y") for date in date_range) if date_range else "all"
+    return [Date_Preference.compile(date_key, date_range, [Weekday_Preference(key="all", weekdays=tuple(range(7)), locations=tuple(locations), hours=hours)])]
+
+def shift(location="", actions=("TempTake",), day=datetime.datetime(1900, 10, 3)):
+    '''Provided a location (empty like an email's), the actions offered and a day without its year, return a 2-3PM shift'''
+    return {
+        "actions":list(actions),
+        "start_date":day,
+        "end_date":day,
+        "weekday":day,
+        "start_time":datetime.datetime(1900, 1, 1, 14),
+        "end_time":datetime.datetime(1900, 1, 1, 15),
+        "location":location
+    }
+
+class Preference_Matcher_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = Preference_Matcher(preferences(["LC-27a", "SciLib"]), today=datetime.datetime(2016, 10, 1))
+
+    def test_email_shift_is_tried_at_every_preferred_location(self):
+        self.assertEqual(self.matcher.match(shift()), [("TempTake", ["LC-27a", "SciLib"])])
+
+    def test_schedule_shift_is_only_tried_at_its_location(self):
+        self.assertEqual(self.matcher.match(shift("SciLib")), [("TempTake", ["SciLib"])])
+
+    def test_schedule_shift_at_an_unwanted_location_is_not_tried(self):
+        self.assertEqual(self.matcher.match(shift("LI-106")), [])
+
+    def test_dates_without_a_year_are_in_the_nearest_year(self):
+        january = (datetime.datetime(2017, 1, 1), datetime.datetime(2017, 1, 31))
+        matcher = Preference_Matcher(preferences(["SciLib"], date_range=january), today=datetime.datetime(2016, 12, 28))
+        new_years_week = shift(day=datetime.datetime(1900, 1, 3))
+
+        self.assertEqual(matcher.match(new_years_week), [("TempTake", ["SciLib"])])
+        self.assertEqual(matcher.shift_weekday(new_years_week), datetime.datetime(2017, 1, 3).weekday())
+        self.assertTrue(matcher.covers_day(datetime.datetime(2017, 1, 3)))
+        self.assertEqual(Preference_Matcher(preferences(["SciLib"], date_range=january), today=datetime.datetime(2016, 6, 1)).match(new_years_week), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import datetime
+import unittest
+
+from Coracle.schedule_snapshot import Schedule_Block, Schedule_Snapshot
+from Coracle.schedule_watcher import shift_from_block
+
+DAY = datetime.datetime(2016, 10, 3)
+
+def block(position, actions):
+    '''Provided a position and the actions its select offers, return a one hour Science Library block'''
+    start_time = datetime.datetime(1900, 1, 1, 9 + position)
+    return Schedule_Block("Science Library", position, start_time, start_time + datetime.timedelta(hours=1), DAY, DAY, actions)
+
+class Schedule_Snapshot_Test(unittest.TestCase):
+
+    def test_only_takeable_blocks_are_available(self):
+        takeable = block(0, ["-", "Temp Take", "Perm Take"])
+        own = block(1, ["-", "Temp Drop", "Perm Drop"])
+        taken = block(2, [])
+
+        self.assertTrue(takeable.is_available())
+        self.assertFalse(own.is_available())
+        self.assertFalse(taken.is_available())
+        self.assertEqual(Schedule_Snapshot(DAY, [takeable, own, taken]).available(), [takeable])
+
+    def test_diff_ignores_blocks_becoming_droppable(self):
+        older = Schedule_Snapshot(DAY, [block(0, []), block(1, [])])
+        newer = Schedule_Snapshot(DAY, [block(0, ["-", "Temp Drop"]), block(1, ["-", "Temp Take"])])
+
+        self.assertEqual([freed.position for freed in newer.diff(older)], [1])
+
+    def test_shift_from_block_only_offers_takes(self):
+        shift = shift_from_block(block(0, ["-", "Temp Take", "Temp Drop"]), DAY, 0)
+
+        self.assertEqual(shift["actions"], ["TempTake"])
+        self.assertEqual(shift["location"], "Science Library")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import datetime
+import unittest
+
+from Coracle.ITShttpdriver import ITShttpdriver
+from Coracle.session_pool import ITS_Session_Pool
+
+from its_stub import ITS_Stub_Server
+
+class Unconfirmed_Driver(object):
+    '''A driver whose login neither raises nor confirms it logged in'''
+
+    def login(self, username, password):
+        return None
+
+    def quit(self):
+        pass
+
+class ITS_Session_Pool_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ITS_Stub_Server(today=datetime.date.today()).start()
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.stop()
+        self.server.stop()
+
+    def start_pool(self, make_driver, password):
+        self.pool = ITS_Session_Pool(make_driver, self.server.credentials[0], password, size=1)
+        self.pool.start()
+        return self.pool.metrics()
+
+    def test_logged_in_session_is_counted(self):
+        metrics = self.start_pool(lambda: ITShttpdriver(base_url=self.server.base_url), self.server.credentials[1])
+
+        self.assertEqual((metrics["logged_in"], metrics["logins"]), (1, 1))
+
+    def test_rejected_login_is_not_counted(self):
+        metrics = self.start_pool(lambda: ITShttpdriver(base_url=self.server.base_url), "wrong")
+
+        self.assertEqual((metrics["logged_in"], metrics["logins"]), (0, 0))
+        self.assertEqual(self.pool.logged_in, [False])
+
+    def test_unconfirmed_login_is_not_counted(self):
+        metrics = self.start_pool(Unconfirmed_Driver, "password")
+
+        self.assertEqual((metrics["logged_in"], metrics["logins"]), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
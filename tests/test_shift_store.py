@@ -0,0 +1,132 @@
+import shutil
+import datetime
+import tempfile
+import unittest
+from os.path import join
+
+from Coracle.shift_store import Shift_Store
+from Coracle.history_sqlite import SQLite_Shift_Store
+
+def perm_shift(start_month, end_month, hour=10):
+    '''Provided the months a PermShift starts and ends in, return the shift'''
+    return {
+        "type":"PermShift",
+        "actions":["PermTake"],
+        "start_date":datetime.datetime(1900, start_month, 1),
+        "end_date":datetime.datetime(1900, end_month, 28),
+        "start_time":datetime.datetime(1900, 1, 1, hour),
+        "end_time":datetime.datetime(1900, 1, 1, hour + 1),
+        "location":"SciLib",
+        "user":["Adam", "Mrowca"]
+    }
+
+def temp_shift(month, day, hour=10, shift_type="TempShift"):
+    '''Provided the month and day of a TempShift, return the shift'''
+    date = datetime.datetime(1900, month, day)
+    return {
+        "type":shift_type,
+        "actions":["TempTake"],
+        "start_date":date,
+        "end_date":date,
+        "start_time":datetime.datetime(1900, 1, 1, hour),
+        "end_time":datetime.datetime(1900, 1, 1, hour + 1),
+        "location":"SciLib",
+        "user":["Adam", "Mrowca"]
+    }
+
+RANGES = [
+    (datetime.datetime(1900, 1, 1), datetime.datetime(1900, 1, 7)),
+    (datetime.datetime(1900, 6, 1), datetime.datetime(1900, 6, 7)),
+    (datetime.datetime(1900, 12, 1), datetime.datetime(1900, 12, 31)),
+    (datetime.datetime(1899, 1, 1), datetime.datetime(1899, 12, 31)),
+    (datetime.datetime(1901, 1, 1), datetime.datetime(1901, 1, 7))
+]
+
+class Shift_Store_Test(unittest.TestCase):
+    '''The in memory store. SQLite_Shift_Store_Test runs every test against the sqlite store too'''
+
+    def make_store(self, shifts):
+        return Shift_Store(shifts)
+
+    def setUp(self):
+        self.perm_shifts = [perm_shift(start_month, end_month, hour) for start_month in range(1, 13) for end_month in range(start_month, 13) for hour in (9, 14)]
+        self.temp_shifts = [temp_shift(month, day, hour) for month in range(1, 13) for day in (1, 15) for hour in (9, 14)]
+        self.store = self.make_store(self.perm_shifts + self.temp_shifts)
+
+    def overlapping(self, start, end):
+        return sorted([shift for shift in self.store if shift["type"] == "PermShift" and shift["start_date"] <= end and shift["end_date"] >= start], key=lambda shift: shift["start_date"])
+
+    def dated(self, start, end):
+        return sorted([shift for shift in self.store if shift["type"] == "TempShift" and start <= shift["start_date"] <= end], key=lambda shift: shift["start_date"])
+
+    def test_perm_shifts_in_date_range_are_the_overlapping_ones(self):
+        for start, end in RANGES:
+            self.assertEqual(self.store.perm_shifts_in_date_range(start, end), self.overlapping(start, end))
+
+    def test_temp_shifts_in_date_range_are_the_dated_ones(self):
+        for start, end in RANGES:
+            self.assertEqual(self.store.temp_shifts_in_date_range(start, end), self.dated(start, end))
+
+    def test_add_skips_equal_shifts(self):
+        self.assertFalse(self.store.add(dict(self.perm_shifts[0])))
+        self.assertTrue(self.store.add(perm_shift(1, 1, hour=18)))
+
+        self.assertEqual(len(self.store), len(self.perm_shifts) + len(self.temp_shifts) + 1)
+        self.assertIn(perm_shift(1, 1, hour=18), self.store)
+
+    def test_remove(self):
+        self.store.remove(dict(self.temp_shifts[0]))
+
+        self.assertNotIn(self.temp_shifts[0], self.store)
+        self.assertRaises(ValueError, self.store.remove, self.temp_shifts[0])
+
+    def test_removed_shifts_leave_the_range_queries(self):
+        for shift in self.perm_shifts[::2] + self.temp_shifts[::2]:
+            self.store.remove(shift)
+
+        self.assertEqual(len(self.store), len(self.perm_shifts[1::2]) + len(self.temp_shifts[1::2]))
+        for month in (1, 6, 12):
+            start = datetime.datetime(1900, month, 1)
+            end = start + datetime.timedelta(days=6)
+            self.assertEqual(self.store.perm_shifts_in_date_range(start, end), self.overlapping(start, end))
+            self.assertEqual(self.store.temp_shifts_in_date_range(start, end), self.dated(start, end))
+
+    def test_untyped_shifts_are_kept_aside(self):
+        untyped = temp_shift(3, 1, shift_type="Temp")
+        self.store.add(untyped)
+
+        self.assertEqual(self.store.untyped_shifts(), [untyped])
+        self.assertNotIn(untyped, self.store.temp_shifts_in_date_range(datetime.datetime(1900, 3, 1), datetime.datetime(1900, 3, 1)))
+
+    def test_removed_perm_shifts_leave_both_indexes(self):
+        for shift in self.perm_shifts[::2]:
+            self.store.remove(shift)
+
+        self.assertEqual(len(self.store.perm_dates), len(self.perm_shifts) / 2)
+        self.assertEqual(len(self.store.perm_end_dates), len(self.perm_shifts) / 2)
+
+class SQLite_Shift_Store_Test(Shift_Store_Test):
+    '''Every Shift_Store test against a sqlite store in a temporary database'''
+
+    def make_store(self, shifts):
+        store = SQLite_Shift_Store(join(self.database_dir, "history.db"))
+        for shift in shifts:
+            store.add(shift)
+        store.commit()
+        return store
+
+    def setUp(self):
+        self.database_dir = tempfile.mkdtemp()
+        Shift_Store_Test.setUp(self)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.database_dir)
+
+    @unittest.skip("the sqlite store keeps its indexes in the database")
+    def test_removed_perm_shifts_leave_both_indexes(self):
+        pass
+
+
+if __name__ == "__main__":
+    unittest.main()